@@ -4,10 +4,15 @@ from typing import TypeAlias
 import sqlalchemy
 import sqlalchemy.dialects
 import sqlalchemy.dialects.sqlite
+import sqlalchemy.ext.asyncio
 import sqlalchemy.orm
 
 Connection: TypeAlias = sqlalchemy.engine.Connection
 OrmSession: TypeAlias = sqlalchemy.orm.Session
+AsyncOrmSession: TypeAlias = sqlalchemy.ext.asyncio.AsyncSession
+
+# async driver used in place of the sync one for each dialect
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite"}
 
 
 def insert(
@@ -16,4 +21,13 @@ def insert(
     return sqlalchemy.dialects.sqlite.insert(table)
 
 
+def async_db_url(db_url: str) -> str:
+    """
+    `db_url` with its driver swapped for the async one e.g. `sqlite:///db.sqlite` -> `sqlite+aiosqlite:///db.sqlite`
+    """
+    url = sqlalchemy.make_url(db_url)
+    drivername = _ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)
+    return url.set(drivername=drivername).render_as_string(hide_password=False)
+
+
 logger = logging.getLogger("DB")
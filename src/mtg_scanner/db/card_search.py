@@ -0,0 +1,172 @@
+"""
+Full text search over the card table, backed by the `card_search` FTS5 table.
+The sync pipeline calls `refresh_search_index` for every batch it writes,
+`rebuild_search_index` repopulates the whole table e.g. after a migration.
+"""
+
+from collections.abc import Iterable
+from typing import Any
+
+import sqlalchemy
+from sqlalchemy.orm import InstrumentedAttribute
+from sqlalchemy.sql import operators
+
+from mtg_scanner.db import OrmSession
+from mtg_scanner.db.models import CARD_SEARCH_TABLE, Card
+
+COLOR_ORDER = "WUBRG"
+# `colors` filter value for colourless cards
+COLORLESS = "C"
+# SQLite has a limit on bound parameters per statement
+_REFRESH_CHUNK_SIZE = 500
+
+card_search = sqlalchemy.table(
+    CARD_SEARCH_TABLE,
+    sqlalchemy.column("rowid", sqlalchemy.Integer),
+    sqlalchemy.column("name", sqlalchemy.String),
+    sqlalchemy.column("type", sqlalchemy.String),
+)
+
+
+def sort_colors(colors: Iterable[str]) -> str:
+    """
+    Colour letters in WUBRG order with duplicates and anything else removed
+
+    Usage:
+        ```python
+        sort_colors(["R", "W"]) -> "WR"
+        sort_colors("uub") -> "UB"
+        ```
+    """
+    letters = {color.upper() for color in colors}
+    return "".join(color for color in COLOR_ORDER if color in letters)
+
+
+def _index_rows(scryfall_ids: list[str]) -> sqlalchemy.Insert:
+    return sqlalchemy.insert(card_search).from_select(
+        ["rowid", "name", "type"],
+        sqlalchemy.select(Card.card_id, Card.name, Card.type).where(
+            Card.scryfall_id.in_(scryfall_ids), Card.deleted_at.is_(None)
+        ),
+    )
+
+
+def refresh_search_index(orm: OrmSession, scryfall_ids: list[str]) -> None:
+    """
+    Re-index the cards with `scryfall_ids` from the card table, soft deleted cards are removed.
+    Not committed, call in the same transaction as the card change.
+    """
+    for i in range(0, len(scryfall_ids), _REFRESH_CHUNK_SIZE):
+        chunk = scryfall_ids[i : i + _REFRESH_CHUNK_SIZE]
+        orm.execute(
+            sqlalchemy.delete(card_search).where(
+                card_search.c.rowid.in_(
+                    sqlalchemy.select(Card.card_id).where(Card.scryfall_id.in_(chunk))
+                )
+            )
+        )
+        orm.execute(_index_rows(chunk))
+
+
+def rebuild_search_index(orm: OrmSession) -> None:
+    """
+    Drop everything in the search index and re-index every live card
+    """
+    orm.execute(sqlalchemy.delete(card_search))
+    orm.execute(
+        sqlalchemy.insert(card_search).from_select(
+            ["rowid", "name", "type"],
+            sqlalchemy.select(Card.card_id, Card.name, Card.type).where(
+                Card.deleted_at.is_(None)
+            ),
+        )
+    )
+    orm.commit()
+
+
+def _match_terms(column: str, text: str) -> list[str]:
+    # every word is quoted so user input can't use FTS5 syntax, and matched as a prefix
+    quoted = ('"' + word.replace('"', '""') + '"' for word in text.split())
+    return [f"{column} : {word}*" for word in quoted]
+
+
+def match_expression(name: str | None = None, type_line: str | None = None) -> str:
+    """
+    FTS5 query matching cards whose name starts each word of `name` and type line each word of `type_line`,
+    empty if neither has any words
+
+    Usage:
+        ```python
+        match_expression("jace bel") -> 'name : "jace"* AND name : "bel"*'
+        match_expression(type_line="Legendary") -> 'type : "Legendary"*'
+        ```
+    """
+    terms = _match_terms("name", name or "") + _match_terms("type", type_line or "")
+    return " AND ".join(terms)
+
+
+def _without_index(
+    column: InstrumentedAttribute[Any],
+) -> sqlalchemy.ColumnElement[Any]:
+    """`+column`, SQLite won't use an index for a comparison on it"""
+    return sqlalchemy.UnaryExpression(
+        column.expression, operator=operators.custom_op("+"), type_=column.type
+    )
+
+
+def search_cards_query(
+    name: str | None = None,
+    type_line: str | None = None,
+    set_code: str | None = None,
+    rarity: str | None = None,
+    colors: str | None = None,
+) -> sqlalchemy.Select[tuple[Card]]:
+    """
+    Live cards matching every filter given, ready for `paginate_cards`
+
+    Args:
+        name (str | None, optional): words the card name contains, each matched as a prefix. Defaults to None.
+        type_line (str | None, optional): words the type line contains, each matched as a prefix. Defaults to None.
+        set_code (str | None, optional): exact set code, case insensitive. Defaults to None.
+        rarity (str | None, optional): exact rarity e.g. `mythic`. Defaults to None.
+        colors (str | None, optional): the card's exact colours as letters in any order e.g. `UW`,
+            or `C` for colourless cards. Defaults to None.
+
+    Raises:
+        ValueError: if `colors` has anything other than colour letters
+
+    Returns:
+        sqlalchemy.Select[tuple[Card]]: the filtered query
+    """
+    if colors and colors.upper() != COLORLESS:
+        if not set(colors.upper()) <= set(COLOR_ORDER):
+            raise ValueError(f"Unknown colors {colors!r}, expected WUBRG letters or C")
+    query = sqlalchemy.select(Card).where(Card.deleted_at.is_(None))
+    match = match_expression(name, type_line)
+    if match:
+        query = query.where(
+            Card.card_id.in_(
+                sqlalchemy.select(card_search.c.rowid).where(
+                    sqlalchemy.literal_column(CARD_SEARCH_TABLE).op("MATCH")(match)
+                )
+            )
+        )
+    exact_colors = None
+    if colors:
+        # an exact match, unlike "has all of these colours" it can use an index
+        exact_colors = "" if colors.upper() == COLORLESS else sort_colors(colors)
+    exact_filters: tuple[tuple[InstrumentedAttribute[Any], str | None], ...] = (
+        (Card.set_code, set_code.lower() if set_code else None),
+        (Card.colors, exact_colors),
+        (Card.rarity, rarity.lower() if rarity else None),
+    )
+    # most selective first, only the first one given keeps its index. The db has no table statistics
+    # so SQLite can't tell a set code apart from a rarity and may walk most of the table through the wrong index
+    use_index = True
+    for column, value in exact_filters:
+        if value is not None:
+            query = query.where(
+                (column if use_index else _without_index(column)) == value
+            )
+            use_index = False
+    return query
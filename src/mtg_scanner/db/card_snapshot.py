@@ -0,0 +1,465 @@
+"""
+Read only columnar snapshot of the live cards, for lookups by scryfall id, name or set without the db.
+Each string column is dictionary encoded, its distinct values stored once, sorted, as a UTF-8 blob
+with per row codes into them. The arrays are laid out back to back in one file that `load` memory maps
+and views in place, loading takes about a millisecond whatever the number of cards.
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import json
+import logging
+import shutil
+import tempfile
+from collections.abc import Iterable, Mapping, Sequence
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from mmap import ACCESS_READ
+from mmap import mmap as MemoryMap
+from pathlib import Path
+from typing import Self
+
+import numpy as np
+import numpy.typing as npt
+import sqlalchemy
+
+import mtg_scanner.env as env
+from mtg_scanner.db import OrmSession
+from mtg_scanner.db.models import Card
+
+logger = logging.getLogger(__name__)
+
+SCRYFALL_DATA_DIR = Path(__file__).parent.parent / "scryfall_data"
+DEFAULT_SNAPSHOT_DIR = SCRYFALL_DATA_DIR / "card_snapshot"
+
+# bumped whenever the files change, an older snapshot has to be exported again
+SNAPSHOT_VERSION = 1
+
+_META_FILE = "meta.json"
+_ARRAYS_FILE = "arrays.bin"
+# byte alignment of each array in the arrays file
+_ALIGNMENT = 64
+# string columns of the snapshot, in `SnapshotCard` order
+_STRING_COLUMNS = (
+    "scryfall_id",
+    "name",
+    "set_code",
+    "rarity",
+    "colors",
+    "mana_cost",
+    "type",
+    "card_art_uri",
+)
+# columns with a row index for `CardSnapshot.rows`
+INDEXED_COLUMNS = ("scryfall_id", "name", "set_code")
+# card id of a card exported from the bulk file rather than the db
+_NO_CARD_ID = -1
+# code of a null value
+_NULL = -1
+
+
+@dataclass(frozen=True)
+class SnapshotCard:
+    # `None` if exported from the bulk file
+    card_id: int | None
+    scryfall_id: str | None
+    name: str
+    set_code: str | None
+    rarity: str
+    colors: str | None
+    mana_cost: str | None
+    type: str | None
+    card_art_uri: str | None
+
+
+class StringColumn:
+    """
+    Dictionary encoded strings. The distinct values are sorted, so a value's code is found by bisection,
+    and each row holds the code of its value or -1 for null.
+    An indexed column also holds its row numbers grouped by code, the rows with code `c` being
+    `rows[starts[c]:starts[c + 1]]`.
+    """
+
+    def __init__(
+        self,
+        codes: npt.NDArray[np.int32],
+        offsets: npt.NDArray[np.int64],
+        data: npt.NDArray[np.uint8],
+        rows: npt.NDArray[np.int32] | None = None,
+        starts: npt.NDArray[np.int64] | None = None,
+    ) -> None:
+        self.codes = codes
+        # value `c` is `data[offsets[c]:offsets[c + 1]]`
+        self.offsets = offsets
+        self.data = data
+        self.rows = rows
+        self.starts = starts
+
+    @classmethod
+    def encode(cls, values: Sequence[str | None], indexed: bool = False) -> Self:
+        strings = sorted({value for value in values if value is not None})
+        lookup = {value: code for code, value in enumerate(strings)}
+        codes = np.fromiter(
+            (_NULL if value is None else lookup[value] for value in values),
+            dtype=np.int32,
+            count=len(values),
+        )
+        encoded = [value.encode("utf-8") for value in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        if not indexed:
+            return cls(codes, offsets, data)
+        rows = np.argsort(codes, kind="stable").astype(np.int32)
+        rows = rows[codes[rows] != _NULL]
+        starts = np.searchsorted(codes[rows], np.arange(len(encoded) + 1)).astype(
+            np.int64
+        )
+        return cls(codes, offsets, data, rows, starts)
+
+    @property
+    def n_values(self) -> int:
+        """number of distinct values"""
+        return len(self.offsets) - 1
+
+    def value(self, code: int) -> str:
+        return bytes(self.data[self.offsets[code] : self.offsets[code + 1]]).decode(
+            "utf-8"
+        )
+
+    def __getitem__(self, row: int) -> str | None:
+        code = int(self.codes[row])
+        return None if code == _NULL else self.value(code)
+
+    def find(self, value: str) -> int | None:
+        """code of `value`, `None` if no row has it"""
+        code = bisect.bisect_left(range(self.n_values), value, key=self.value)
+        if code < self.n_values and self.value(code) == value:
+            return code
+        return None
+
+    def rows_with(self, value: str) -> npt.NDArray[np.int32]:
+        """row numbers holding `value`, in row order"""
+        if self.rows is None or self.starts is None:
+            raise ValueError("Column is not indexed")
+        code = self.find(value)
+        if code is None:
+            return np.empty(0, dtype=np.int32)
+        return self.rows[self.starts[code] : self.starts[code + 1]]
+
+    def arrays(self) -> dict[str, npt.NDArray[np.generic]]:
+        """the column's arrays by name, as saved"""
+        arrays: dict[str, npt.NDArray[np.generic]] = {
+            "codes": self.codes,
+            "offsets": self.offsets,
+            "data": self.data,
+        }
+        if self.rows is not None and self.starts is not None:
+            arrays.update(rows=self.rows, starts=self.starts)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Mapping[str, npt.NDArray[np.generic]]) -> Self:
+        return cls(
+            codes=arrays["codes"].view(np.int32),
+            offsets=arrays["offsets"].view(np.int64),
+            data=arrays["data"].view(np.uint8),
+            rows=arrays["rows"].view(np.int32) if "rows" in arrays else None,
+            starts=arrays["starts"].view(np.int64) if "starts" in arrays else None,
+        )
+
+
+class CardSnapshot:
+    """
+    Columns of the live cards, one row per card. Rows are kept in the order given to `build`,
+    by name from `from_db`.
+    """
+
+    def __init__(
+        self,
+        card_ids: npt.NDArray[np.int64],
+        columns: Mapping[str, StringColumn],
+        created_at: datetime | None = None,
+    ) -> None:
+        missing = set(_STRING_COLUMNS) - set(columns)
+        if missing:
+            raise ValueError(f"Missing columns {sorted(missing)}")
+        for name in _STRING_COLUMNS:
+            if len(columns[name].codes) != len(card_ids):
+                raise ValueError(
+                    f"Got {len(columns[name].codes)} {name} values for {len(card_ids)} cards"
+                )
+        self.card_ids = card_ids
+        self.columns = dict(columns)
+        self.created_at = created_at or datetime.now(timezone.utc)
+
+    def __len__(self) -> int:
+        return len(self.card_ids)
+
+    @classmethod
+    def build(cls, rows: Iterable[Mapping[str, object]]) -> Self:
+        """
+        Snapshot of `rows`, each a mapping of `Card` column to value.
+        Rows without a `card_id` get `None`, e.g. rows made from the bulk file.
+        """
+        card_ids: list[int] = []
+        values: dict[str, list[str | None]] = {name: [] for name in _STRING_COLUMNS}
+        for row in rows:
+            card_id = row.get("card_id")
+            card_ids.append(card_id if isinstance(card_id, int) else _NO_CARD_ID)
+            for name in _STRING_COLUMNS:
+                value = row.get(name)
+                values[name].append(None if value is None else str(value))
+        return cls(
+            np.array(card_ids, dtype=np.int64),
+            {
+                name: StringColumn.encode(column, indexed=name in INDEXED_COLUMNS)
+                for name, column in values.items()
+            },
+        )
+
+    @classmethod
+    def from_db(cls, orm: OrmSession) -> Self:
+        """
+        Snapshot of every card not soft deleted, ordered by name
+        """
+        columns = [Card.card_id, *(getattr(Card, name) for name in _STRING_COLUMNS)]
+        rows = orm.execute(
+            sqlalchemy.select(*columns)
+            .where(Card.deleted_at.is_(None))
+            .order_by(Card.name, Card.card_id)
+        ).mappings()
+        return cls.build(dict(row) for row in rows)
+
+    @classmethod
+    def from_bulk_file(cls, file: Path, image_dir: Path) -> Self:
+        """
+        Snapshot of the cards in a Scryfall bulk file, as a sync would write them to the db.
+        The cards have no card id, for when there's no db e.g. naming scan matches.
+        """
+        # only exporting from the bulk file needs the pydantic models
+        from mtg_scanner.db.sync_scryfall_data import card_row
+        from mtg_scanner.scryfall_data.bulk_data import iter_bulk_file
+
+        now = datetime.now(timezone.utc)
+        rows = [card_row(card, image_dir, now) for card in iter_bulk_file(file)]
+        rows.sort(key=lambda row: (str(row["name"]), str(row["scryfall_id"])))
+        return cls.build(rows)
+
+    def card(self, row: int) -> SnapshotCard:
+        card_id = int(self.card_ids[row])
+        name, rarity = self.columns["name"][row], self.columns["rarity"][row]
+        assert name is not None and rarity is not None
+        return SnapshotCard(
+            card_id=None if card_id == _NO_CARD_ID else card_id,
+            scryfall_id=self.columns["scryfall_id"][row],
+            name=name,
+            set_code=self.columns["set_code"][row],
+            rarity=rarity,
+            colors=self.columns["colors"][row],
+            mana_cost=self.columns["mana_cost"][row],
+            type=self.columns["type"][row],
+            card_art_uri=self.columns["card_art_uri"][row],
+        )
+
+    def rows(self, column: str, value: str) -> npt.NDArray[np.int32]:
+        """
+        Row numbers of the cards whose `column` is `value`, `column` being one of `INDEXED_COLUMNS`
+        """
+        if column not in INDEXED_COLUMNS:
+            raise ValueError(
+                f"{column} is not indexed, expected one of {INDEXED_COLUMNS}"
+            )
+        return self.columns[column].rows_with(value)
+
+    def by_scryfall_id(self, scryfall_id: str) -> SnapshotCard | None:
+        rows = self.rows("scryfall_id", scryfall_id)
+        return self.card(int(rows[0])) if len(rows) else None
+
+    def by_name(self, name: str) -> list[SnapshotCard]:
+        """every printing of the card named `name`"""
+        return [self.card(int(row)) for row in self.rows("name", name)]
+
+    def by_set(self, set_code: str) -> list[SnapshotCard]:
+        return [self.card(int(row)) for row in self.rows("set_code", set_code)]
+
+    def names(self, scryfall_ids: Iterable[str]) -> dict[str, str]:
+        """
+        Name of each card in `scryfall_ids`, ids not in the snapshot are left out
+
+        Usage:
+            ```python
+            snapshot.names(["0000579f-7b35-4ed3-b44c-db2a538066fe", "missing"])
+            -> {"0000579f-7b35-4ed3-b44c-db2a538066fe": "Fury Sliver"}
+            ```
+        """
+        ids, names = self.columns["scryfall_id"], self.columns["name"]
+        found: dict[str, str] = {}
+        for scryfall_id in scryfall_ids:
+            rows = ids.rows_with(scryfall_id)
+            if len(rows):
+                name = names[int(rows[0])]
+                assert name is not None
+                found[scryfall_id] = name
+        return found
+
+    def save(self, snapshot_dir: Path = DEFAULT_SNAPSHOT_DIR) -> None:
+        """
+        Write the snapshot to `snapshot_dir`, replacing any snapshot already there.
+        It's written alongside and swapped in, so a reader never loads half of one
+        and anything still mapping the old files keeps working.
+        """
+        arrays: dict[str, npt.NDArray[np.generic]] = {"card_id": self.card_ids}
+        for name in _STRING_COLUMNS:
+            for part, array in self.columns[name].arrays().items():
+                arrays[f"{name}.{part}"] = array
+        snapshot_dir.parent.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(
+            tempfile.mkdtemp(prefix=f".{snapshot_dir.name}.", dir=snapshot_dir.parent)
+        )
+        try:
+            layout: dict[str, dict[str, object]] = {}
+            with open(tmp_dir / _ARRAYS_FILE, "wb") as f:
+                for key, array in arrays.items():
+                    # aligned so every array can be viewed in place
+                    f.write(b"\0" * (-f.tell() % _ALIGNMENT))
+                    layout[key] = {
+                        "offset": f.tell(),
+                        "dtype": array.dtype.str,
+                        "length": len(array),
+                    }
+                    f.write(np.ascontiguousarray(array).tobytes())
+            (tmp_dir / _META_FILE).write_text(
+                json.dumps(
+                    {
+                        "version": SNAPSHOT_VERSION,
+                        "cards": len(self),
+                        "created_at": self.created_at.isoformat(),
+                        "arrays": layout,
+                    }
+                )
+            )
+            old_dir = snapshot_dir.with_name(f"{tmp_dir.name}.old")
+            if snapshot_dir.exists():
+                snapshot_dir.rename(old_dir)
+            tmp_dir.rename(snapshot_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @classmethod
+    def load(cls, snapshot_dir: Path = DEFAULT_SNAPSHOT_DIR, mmap: bool = True) -> Self:
+        """
+        Load a snapshot saved with `save`, memory mapping the arrays unless `mmap` is `False`
+
+        Raises:
+            FileNotFoundError: if there's no snapshot in `snapshot_dir`
+            ValueError: if the snapshot was saved by a different version
+        """
+        meta = json.loads((snapshot_dir / _META_FILE).read_text())
+        if meta["version"] != SNAPSHOT_VERSION:
+            raise ValueError(
+                f"Snapshot in {snapshot_dir} is version {meta['version']}, expected {SNAPSHOT_VERSION}"
+            )
+        with open(snapshot_dir / _ARRAYS_FILE, "rb") as f:
+            # the arrays are views of the one buffer, which stays mapped after the file is closed
+            buffer: MemoryMap | bytes = (
+                MemoryMap(f.fileno(), 0, access=ACCESS_READ) if mmap else f.read()
+            )
+        arrays = {
+            key: np.frombuffer(
+                buffer,
+                dtype=np.dtype(layout["dtype"]),
+                count=layout["length"],
+                offset=layout["offset"],
+            )
+            for key, layout in meta["arrays"].items()
+        }
+        return cls(
+            card_ids=arrays["card_id"].view(np.int64),
+            columns={
+                name: StringColumn.from_arrays(
+                    {
+                        key.removeprefix(f"{name}."): array
+                        for key, array in arrays.items()
+                        if key.startswith(f"{name}.")
+                    }
+                )
+                for name in _STRING_COLUMNS
+            },
+            created_at=datetime.fromisoformat(meta["created_at"]),
+        )
+
+
+def load_snapshot(snapshot_dir: Path = DEFAULT_SNAPSHOT_DIR) -> CardSnapshot | None:
+    """
+    The snapshot in `snapshot_dir`, `None` with a warning if there isn't a usable one
+    """
+    try:
+        return CardSnapshot.load(snapshot_dir)
+    except (FileNotFoundError, ValueError) as err:
+        logger.warning("No card snapshot loaded from %s: %s", snapshot_dir, err)
+        return None
+
+
+@dataclass
+class CliArgs:
+    snapshot_dir: Path
+    bulk_file: Path | None
+    image_dir: Path
+
+    @classmethod
+    def parse_args(cls, argv: list[str] | None = None) -> Self:
+        parser = argparse.ArgumentParser(
+            description="Exports the cards in the db at DB_URL, or a Scryfall bulk file, to a snapshot",
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        )
+        parser.add_argument(
+            "--snapshot_dir",
+            type=Path,
+            default=DEFAULT_SNAPSHOT_DIR,
+            help="Directory to save the snapshot to",
+        )
+        parser.add_argument(
+            "--bulk_file",
+            type=Path,
+            default=None,
+            help="Bulk file to export instead of the db",
+        )
+        parser.add_argument(
+            "--image_dir",
+            type=Path,
+            default=SCRYFALL_DATA_DIR / "image_data",
+            help="Directory of pulled Scryfall images, used with --bulk_file",
+        )
+        args = parser.parse_args(argv)
+        return cls(
+            snapshot_dir=args.snapshot_dir,
+            bulk_file=args.bulk_file,
+            image_dir=args.image_dir,
+        )
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = CliArgs.parse_args(argv)
+    logger.info("Args: %s", args)
+    if args.bulk_file is not None:
+        snapshot = CardSnapshot.from_bulk_file(args.bulk_file, args.image_dir)
+    else:
+        dot_env = Path("./.env")
+        if dot_env.exists():
+            env.export_dot_env(dot_env)
+        engine = sqlalchemy.create_engine(env.get_db_url())
+        with OrmSession(engine) as orm:
+            snapshot = CardSnapshot.from_db(orm)
+        engine.dispose()
+    snapshot.save(args.snapshot_dir)
+    logger.info("Saved snapshot of %d cards to %s", len(snapshot), args.snapshot_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
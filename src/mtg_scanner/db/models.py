@@ -1,7 +1,18 @@
 import uuid
 from datetime import datetime, timezone
 
-from sqlalchemy import UUID, DateTime, Enum, Integer, String
+from sqlalchemy import (
+    UUID,
+    Connection,
+    DateTime,
+    Enum,
+    Index,
+    Integer,
+    String,
+    Table,
+    event,
+    text,
+)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -47,6 +58,23 @@ class Card(Base):
     """
 
     __tablename__ = "card"
+    __table_args__ = (
+        # keyset pagination over cards ordered by name, card_id breaks ties between reprints
+        Index("ix_card_name_card_id", "name", "card_id"),
+        # only the rows the card list shows, so its pages are a straight walk of the index
+        Index(
+            "ix_card_list_name_card_id",
+            "name",
+            "card_id",
+            sqlite_where=text(
+                "mana_cost IS NOT NULL AND card_art_uri IS NOT NULL AND deleted_at IS NULL"
+            ),
+        ),
+        # searches filtered on one of these, walked in the same order as the card list
+        Index("ix_card_set_code_name_card_id", "set_code", "name", "card_id"),
+        Index("ix_card_rarity_name_card_id", "rarity", "name", "card_id"),
+        Index("ix_card_colors_name_card_id", "colors", "name", "card_id"),
+    )
 
     card_id: Mapped[int] = mapped_column(
         Integer, primary_key=True, nullable=False, autoincrement=True, unique=True
@@ -55,7 +83,8 @@ class Card(Base):
     #     UUID, nullable=False, unique=True, default=uuid.uuid4()
     # )
     name: Mapped[str] = mapped_column(String, nullable=False)
-    # colors: Mapped[list[CardColor]] = mapped_column(CardColor, nullable=False) # TODO: figure out how to represent list of colours here
+    # colour letters in WUBRG order e.g. "WU", empty for colourless cards
+    colors: Mapped[str | None] = mapped_column(String(5), nullable=True)
     mana_cost: Mapped[str | None] = mapped_column(String(255), nullable=True)
     rarity: Mapped[CardRarity] = mapped_column(String(25), nullable=False)
     power: Mapped[int | None]
@@ -65,11 +94,33 @@ class Card(Base):
     scryfall_id: Mapped[str | None] = mapped_column(String, nullable=True, unique=True)
     scryfall_uri: Mapped[str | None] = mapped_column(String, nullable=True, unique=True)
     card_art_uri: Mapped[str | None]
+    # hash of the scryfall sourced columns, used to skip unchanged cards on sync
+    content_hash: Mapped[str | None] = mapped_column(String(32), nullable=True)
     created_at: Mapped[datetime] = build_default_dt_now()
     updated_at: Mapped[datetime] = build_default_dt_now()
     deleted_at: Mapped[datetime | None]
 
 
+# Full text index of the name and type line of every live card, its rowid is `Card.card_id`.
+# SQLAlchemy has no model for FTS5 tables so it is created and dropped along with the card table,
+# `mtg_scanner.db.card_search` keeps it in sync
+CARD_SEARCH_TABLE = "card_search"
+CARD_SEARCH_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {CARD_SEARCH_TABLE} USING fts5("
+    "name, type, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+
+
+@event.listens_for(Card.__table__, "after_create")
+def _create_card_search(target: Table, connection: Connection, **_: object) -> None:
+    connection.exec_driver_sql(CARD_SEARCH_DDL)
+
+
+@event.listens_for(Card.__table__, "before_drop")
+def _drop_card_search(target: Table, connection: Connection, **_: object) -> None:
+    connection.exec_driver_sql(f"DROP TABLE IF EXISTS {CARD_SEARCH_TABLE}")
+
+
 # class Config(Base):
 #     """
 #     Configuration
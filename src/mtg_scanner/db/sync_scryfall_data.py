@@ -1,40 +1,212 @@
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import TYPE_CHECKING
+
+import sqlalchemy
 
 from mtg_scanner.db import OrmSession, insert, logger
+from mtg_scanner.db.card_search import refresh_search_index, sort_colors
 from mtg_scanner.db.models import Card
-from mtg_scanner.scryfall_data.model import ScryfallCard
+from mtg_scanner.utils import batched
+
+if TYPE_CHECKING:
+    # the pydantic models are only needed by callers that parse a bulk file
+    from mtg_scanner.scryfall_data.model import ScryfallCard
+
+DEFAULT_BATCH_SIZE = 500
+# SQLite has a limit on bound parameters per statement
+_DELETE_CHUNK_SIZE = 500
+
+# columns sourced from scryfall, any change in these will update the row
+_SCRYFALL_COLUMNS = (
+    "name",
+    "mana_cost",
+    "rarity",
+    "power",
+    "toughness",
+    "type",
+    "set_code",
+    "colors",
+    "scryfall_uri",
+    "card_art_uri",
+)
+
+
+@dataclass
+class SyncResult:
+    """
+    Counts of what a sync did to the card table
+    """
+
+    processed: int = 0
+    upserted: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+
+
+def _content_hash(row: dict[str, object]) -> str:
+    values = [row["scryfall_id"], *(row[column] for column in _SCRYFALL_COLUMNS)]
+    return hashlib.blake2b(
+        json.dumps(values).encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+def _card_colors(card: ScryfallCard) -> str:
+    if card.colors is not None:
+        return sort_colors(color.value for color in card.colors)
+    # multi faced cards only have colours on their faces
+    return sort_colors(
+        color.value for face in card.card_faces or [] for color in face.colors or []
+    )
+
+
+def card_row(card: ScryfallCard, image_dir: Path, now: datetime) -> dict[str, object]:
+    card_art_uri: str = f"{card.id}.jpg"
+    # check image exists
+    image_path = image_dir / card_art_uri
+    return {
+        "name": card.name,
+        "mana_cost": card.mana_cost,
+        "rarity": card.rarity.value,
+        "power": card.power,
+        "toughness": card.toughness,
+        "type": card.type_line,
+        "set_code": card.set,
+        "colors": _card_colors(card),
+        "scryfall_id": card.id,
+        "scryfall_uri": card.uri,
+        # This will need to align with the image mount for the web server
+        "card_art_uri": card_art_uri if image_path.exists() else None,
+        "created_at": now,
+        "updated_at": now,
+        "deleted_at": None,
+    }
+
+
+def _upsert_statement() -> sqlalchemy.dialects.sqlite.Insert:
+    """
+    Insert keyed on `scryfall_id`, existing rows are only touched (and `updated_at` bumped)
+    when their content has changed or they are being restored from a soft delete
+    """
+    statement = insert(Card)
+    excluded = statement.excluded
+    return statement.on_conflict_do_update(
+        index_elements=[Card.scryfall_id],
+        set_={
+            **{column: excluded[column] for column in _SCRYFALL_COLUMNS},
+            "content_hash": excluded.content_hash,
+            "updated_at": excluded.updated_at,
+            "deleted_at": None,
+        },
+        where=sqlalchemy.or_(
+            Card.content_hash.is_distinct_from(excluded.content_hash),
+            Card.deleted_at.is_not(None),
+        ),
+    )
+
+
+def _existing_cards(orm: OrmSession) -> tuple[dict[str, str | None], set[str]]:
+    """
+    Map of scryfall_id to content hash for every card in the db, and the ids of cards not soft deleted
+    Soft deleted cards map to `None` so they are always restored when seen again
+    """
+    hashes: dict[str, str | None] = {}
+    live: set[str] = set()
+    rows = orm.execute(
+        sqlalchemy.select(Card.scryfall_id, Card.content_hash, Card.deleted_at).where(
+            Card.scryfall_id.is_not(None)
+        )
+    ).tuples()
+    for scryfall_id, content_hash, deleted_at in rows:
+        assert scryfall_id is not None
+        if deleted_at is None:
+            hashes[scryfall_id] = content_hash
+            live.add(scryfall_id)
+        else:
+            hashes[scryfall_id] = None
+    return hashes, live
+
+
+def _soft_delete(orm: OrmSession, scryfall_ids: list[str]) -> None:
+    now = datetime.now(timezone.utc)
+    for i in range(0, len(scryfall_ids), _DELETE_CHUNK_SIZE):
+        orm.execute(
+            sqlalchemy.update(Card)
+            .where(Card.scryfall_id.in_(scryfall_ids[i : i + _DELETE_CHUNK_SIZE]))
+            .values(deleted_at=now, updated_at=now)
+        )
+    refresh_search_index(orm, scryfall_ids)
+    orm.commit()
 
 
 def populate_cards_from_scryfall_data(
-    cards: list[ScryfallCard], orm: OrmSession, image_dir: Path
-) -> None:
+    cards: Iterable[ScryfallCard],
+    orm: OrmSession,
+    image_dir: Path,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    delete_missing: bool = False,
+    on_progress: Callable[[SyncResult], None] | None = None,
+) -> SyncResult:
+    """
+    Upsert cards into the db, `cards` can be a list or a stream such as `bulk_data.iter_bulk_file`
+    Cards whose content hash matches the db are skipped, the rest are sent in batches
+    as a single executemany and committed along with their search index entries
+
+    Args:
+        cards (Iterable[ScryfallCard]): cards to upsert
+        orm (OrmSession): db session
+        image_dir (Path): directory holding the pulled card images
+        batch_size (int, optional): number of cards per statement/commit. Defaults to DEFAULT_BATCH_SIZE.
+        delete_missing (bool, optional): soft delete any card in the db not in `cards`,
+            only set this when `cards` is the full dataset. Defaults to False.
+        on_progress (Callable[[SyncResult], None] | None, optional): called with a copy of the counts
+            so far after each batch is committed. Defaults to None.
+
+    Returns:
+        SyncResult: counts of processed, upserted, unchanged and deleted cards
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be positive, got {batch_size}")
+
     logger.info("Populating cards from Scryfall data")
-    orm.begin()
-    while len(cards) > 0:
-        card = cards.pop()
-        card_art_uri: str = f"{card.id}.jpg"
-        # check image exists
-        image_path = image_dir / card_art_uri
-
-        statement = insert(Card).values(
-            name=card.name,
-            mana_cost=card.mana_cost,
-            rarity=card.rarity.value,
-            power=card.power,
-            toughness=card.toughness,
-            type=card.type_line,
-            set_code=card.set,
-            scryfall_id=card.id,
-            scryfall_uri=card.uri,
-            card_art_uri=(
-                card_art_uri if image_path.exists() else None
-            ),  # This will need to align with the image mount for the web server
-        )
-        statement = statement.on_conflict_do_nothing(index_elements=[Card.scryfall_id])
-        orm.execute(statement)
-        if len(cards) % 100 == 0:
-            # Commit every 100 cards
-            orm.commit()
-            orm.begin()
-            logger.info("%s cards left to process", len(cards))
+    existing, live = _existing_cards(orm)
+    # release the read transaction before the writes start
     orm.commit()
+    result = SyncResult()
+    seen: set[str] = set()
+    statement = _upsert_statement()
+    for batch in batched(cards, batch_size):
+        now = datetime.now(timezone.utc)
+        rows = []
+        for card in batch:
+            seen.add(card.id)
+            row = card_row(card, image_dir, now)
+            row["content_hash"] = _content_hash(row)
+            if existing.get(card.id, "") == row["content_hash"]:
+                result.unchanged += 1
+                continue
+            rows.append(row)
+        if rows:
+            orm.execute(statement, rows)
+            refresh_search_index(orm, [str(row["scryfall_id"]) for row in rows])
+            orm.commit()
+        result.processed += len(batch)
+        result.upserted += len(rows)
+        logger.info("%s cards processed", result.processed)
+        if on_progress is not None:
+            on_progress(dataclasses.replace(result))
+
+    if delete_missing:
+        missing = sorted(live - seen)
+        _soft_delete(orm, missing)
+        result.deleted = len(missing)
+
+    logger.info("Sync finished: %s", result)
+    return result
@@ -0,0 +1,356 @@
+"""
+Second stage card matcher using ORB feature descriptors.
+More robust to glare and angled photos than the perceptual hash, at the cost of a bigger index and slower queries.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Literal, Self
+
+import cv2 as cv
+import numpy as np
+import numpy.typing as npt
+
+from mtg_scanner.scanner.identification.phash_index import (
+    DEFAULT_IMAGE_DIR,
+    SCRYFALL_DATA_DIR,
+)
+from mtg_scanner.scanner.image_processing.card_detection import CARD_HEIGHT, CARD_WIDTH
+
+if TYPE_CHECKING:
+    import cv2.typing as ct
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = SCRYFALL_DATA_DIR / "orb_index"
+DEFAULT_N_FEATURES = 250
+# images are scaled to the Scryfall `normal` size before extracting features so keypoint scales line up
+REFERENCE_SIZE = (CARD_WIDTH, CARD_HEIGHT)
+# ORB descriptors are 256 bits
+DESCRIPTOR_BYTES = 32
+
+_FLANN_INDEX_LSH = 6
+# longer keys than the usual 12 bits keep buckets small with ~100k+ descriptors, 4x faster queries for the same recall
+_LSH_INDEX_PARAMS: dict[str, bool | int | float | str] = {
+    "algorithm": _FLANN_INDEX_LSH,
+    "table_number": 6,
+    "key_size": 20,
+    "multi_probe_level": 1,
+}
+_LSH_SEARCH_PARAMS: dict[str, bool | int | float | str] = {"checks": 50}
+# homography needs at least 4 point pairs
+_MIN_MATCHES_FOR_HOMOGRAPHY = 4
+
+_IDS_FILE = "ids.npy"
+_OFFSETS_FILE = "offsets.npy"
+_DESCRIPTORS_FILE = "descriptors.npy"
+_KEYPOINTS_FILE = "keypoints.npy"
+_META_FILE = "meta.json"
+
+
+def extract_features(
+    img: ct.MatLike, n_features: int = DEFAULT_N_FEATURES
+) -> tuple[npt.NDArray[np.float32], npt.NDArray[np.uint8]]:
+    """
+    ORB keypoints and descriptors of a card image, after scaling it to `REFERENCE_SIZE`
+
+    Args:
+        img (ct.MatLike): BGR or grayscale card image, e.g. the output of `normalize_card`
+        n_features (int, optional): max keypoints to keep. Defaults to DEFAULT_N_FEATURES.
+
+    Returns:
+        tuple[npt.NDArray[np.float32], npt.NDArray[np.uint8]]: (n, 2) keypoint positions and (n, 32) descriptors
+    """
+    gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    if gray.shape[1::-1] != REFERENCE_SIZE:
+        gray = cv.resize(gray, REFERENCE_SIZE, interpolation=cv.INTER_AREA)
+    orb = cv.ORB.create(nfeatures=n_features)
+    # the type stubs are missing the optional mask
+    keypoints, descriptors = orb.detectAndCompute(gray, None)  # type: ignore[call-overload]
+    if descriptors is None:
+        return (
+            np.empty((0, 2), dtype=np.float32),
+            np.empty((0, DESCRIPTOR_BYTES), dtype=np.uint8),
+        )
+    points = np.array([kp.pt for kp in keypoints], dtype=np.float32).reshape(-1, 2)
+    return points, np.asarray(descriptors, dtype=np.uint8)
+
+
+@dataclass
+class OrbMatch:
+    scryfall_id: str
+    # descriptor matches passing the ratio test
+    votes: int
+    # matches consistent with a single homography, 0 if not verified
+    inliers: int
+
+
+class OrbIndex:
+    """
+    Descriptors of every card packed into one (n_descriptors, 32) array,
+    card `i` owning rows `offsets[i]:offsets[i + 1]`, with keypoint positions in a parallel array.
+    Queried through a FLANN LSH index built on first use.
+    """
+
+    def __init__(
+        self,
+        ids: npt.NDArray[np.str_],
+        offsets: npt.NDArray[np.int64],
+        descriptors: npt.NDArray[np.uint8],
+        keypoints: npt.NDArray[np.float32],
+        n_features: int = DEFAULT_N_FEATURES,
+    ) -> None:
+        if len(offsets) != len(ids) + 1 or offsets[-1] != len(descriptors):
+            raise ValueError("offsets do not line up with ids and descriptors")
+        if len(descriptors) != len(keypoints):
+            raise ValueError(
+                f"Got {len(keypoints)} keypoints for {len(descriptors)} descriptors"
+            )
+        self.ids = ids
+        self.offsets = offsets
+        self.descriptors = descriptors
+        self.keypoints = keypoints
+        self.n_features = n_features
+        self._matcher: cv.FlannBasedMatcher | None = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(
+        cls,
+        image_dir: Path = DEFAULT_IMAGE_DIR,
+        n_features: int = DEFAULT_N_FEATURES,
+        workers: int = 8,
+    ) -> Self:
+        """
+        Extract features from every `<scryfall_id>.jpg` in `image_dir`
+
+        Args:
+            image_dir (Path, optional): directory of pulled scryfall images. Defaults to DEFAULT_IMAGE_DIR.
+            n_features (int, optional): max keypoints per card. Defaults to DEFAULT_N_FEATURES.
+            workers (int, optional): threads extracting features, OpenCV releases the GIL. Defaults to 8.
+
+        Returns:
+            Self: the built index
+        """
+        paths = sorted(image_dir.glob("*.jpg"))
+
+        def _extract(
+            path: Path,
+        ) -> tuple[npt.NDArray[np.float32], npt.NDArray[np.uint8]] | None:
+            img = cv.imread(str(path))
+            if img is None:
+                logger.warning("Could not read %s, skipping", path)
+                return None
+            return extract_features(img, n_features)
+
+        start = time.perf_counter()
+        ids: list[str] = []
+        counts: list[int] = []
+        all_points: list[npt.NDArray[np.float32]] = []
+        all_descriptors: list[npt.NDArray[np.uint8]] = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for path, features in zip(paths, executor.map(_extract, paths)):
+                if features is None:
+                    continue
+                points, descriptors = features
+                ids.append(path.stem)
+                counts.append(len(descriptors))
+                all_points.append(points)
+                all_descriptors.append(descriptors)
+
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        logger.info(
+            "Extracted %d descriptors from %d images in %.1fs",
+            offsets[-1],
+            len(ids),
+            time.perf_counter() - start,
+        )
+        return cls(
+            ids=np.array(ids, dtype=np.str_),
+            offsets=offsets,
+            descriptors=(
+                np.concatenate(all_descriptors)
+                if all_descriptors
+                else np.empty((0, DESCRIPTOR_BYTES), dtype=np.uint8)
+            ),
+            keypoints=(
+                np.concatenate(all_points)
+                if all_points
+                else np.empty((0, 2), dtype=np.float32)
+            ),
+            n_features=n_features,
+        )
+
+    def save(self, index_dir: Path = DEFAULT_INDEX_DIR) -> None:
+        index_dir.mkdir(parents=True, exist_ok=True)
+        np.save(index_dir / _IDS_FILE, self.ids)
+        np.save(index_dir / _OFFSETS_FILE, self.offsets)
+        np.save(index_dir / _DESCRIPTORS_FILE, self.descriptors)
+        np.save(index_dir / _KEYPOINTS_FILE, self.keypoints)
+        (index_dir / _META_FILE).write_text(json.dumps({"n_features": self.n_features}))
+
+    @classmethod
+    def load(cls, index_dir: Path = DEFAULT_INDEX_DIR, mmap: bool = True) -> Self:
+        """
+        Load an index saved with `save`, memory mapping the arrays unless `mmap` is `False`
+        """
+        mmap_mode: Literal["r"] | None = "r" if mmap else None
+        meta = json.loads((index_dir / _META_FILE).read_text())
+        return cls(
+            ids=np.load(index_dir / _IDS_FILE, mmap_mode=mmap_mode),
+            offsets=np.load(index_dir / _OFFSETS_FILE),
+            descriptors=np.load(index_dir / _DESCRIPTORS_FILE, mmap_mode=mmap_mode),
+            keypoints=np.load(index_dir / _KEYPOINTS_FILE, mmap_mode=mmap_mode),
+            n_features=int(meta["n_features"]),
+        )
+
+    @property
+    def matcher(self) -> cv.FlannBasedMatcher:
+        """
+        FLANN LSH index over all descriptors, built on first use as it takes a while for a full index
+        """
+        if self._matcher is None:
+            start = time.perf_counter()
+            matcher = cv.FlannBasedMatcher(_LSH_INDEX_PARAMS, _LSH_SEARCH_PARAMS)
+            matcher.add([np.ascontiguousarray(self.descriptors)])
+            matcher.train()
+            logger.info("Built LSH index in %.1fs", time.perf_counter() - start)
+            self._matcher = matcher
+        return self._matcher
+
+    def _verify(
+        self,
+        query_points: npt.NDArray[np.float32],
+        train_rows: npt.NDArray[np.int64],
+    ) -> int:
+        """
+        Number of matches between the query points and descriptor rows of one card that agree on a single homography
+        """
+        if len(train_rows) < _MIN_MATCHES_FOR_HOMOGRAPHY:
+            return 0
+        _, mask = cv.findHomography(
+            query_points, self.keypoints[train_rows], cv.RANSAC, 5.0
+        )
+        return 0 if mask is None else int(mask.sum())
+
+    def query(
+        self,
+        img: ct.MatLike,
+        k: int = 5,
+        n_candidates: int = 10,
+        ratio: float = 0.75,
+    ) -> list[OrbMatch]:
+        """
+        The `k` best matching cards for a cropped card image.
+        Descriptor matches vote for their card, the `n_candidates` cards with the most votes
+        are then re-ranked by the number of geometrically consistent matches.
+
+        Args:
+            img (ct.MatLike): cropped card image
+            k (int, optional): number of matches to return. Defaults to 5.
+            n_candidates (int, optional): cards to geometrically verify. Defaults to 10.
+            ratio (float, optional): Lowe's ratio test threshold. Defaults to 0.75.
+
+        Returns:
+            list[OrbMatch]: best match first
+        """
+        if len(self) == 0:
+            return []
+        points, descriptors = extract_features(img, self.n_features)
+        if len(descriptors) == 0:
+            return []
+
+        query_rows: list[int] = []
+        train_rows: list[int] = []
+        for pair in self.matcher.knnMatch(descriptors, k=2):
+            # LSH can return fewer than 2 neighbours
+            if not pair:
+                continue
+            if len(pair) == 2 and pair[0].distance >= ratio * pair[1].distance:
+                continue
+            query_rows.append(pair[0].queryIdx)
+            train_rows.append(pair[0].trainIdx)
+        if not train_rows:
+            return []
+
+        train = np.array(train_rows, dtype=np.int64)
+        query = np.array(query_rows, dtype=np.int64)
+        cards = np.searchsorted(self.offsets, train, side="right") - 1
+        votes = np.bincount(cards, minlength=len(self))
+        candidates = np.argsort(votes)[::-1][:n_candidates]
+        candidates = candidates[votes[candidates] > 0]
+
+        matches = [
+            OrbMatch(
+                scryfall_id=str(self.ids[card]),
+                votes=int(votes[card]),
+                inliers=self._verify(
+                    points[query[cards == card]], train[cards == card]
+                ),
+            )
+            for card in candidates
+        ]
+        matches.sort(key=lambda match: (match.inliers, match.votes), reverse=True)
+        return matches[:k]
+
+
+@dataclass
+class CliArgs:
+    image_dir: Path
+    index_dir: Path
+    n_features: int
+
+    @classmethod
+    def parse_args(cls) -> Self:
+        parser = argparse.ArgumentParser(
+            description="Builds the ORB descriptor index of the pulled Scryfall images",
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        )
+        parser.add_argument(
+            "--image_dir",
+            type=Path,
+            default=DEFAULT_IMAGE_DIR,
+            help="Directory of pulled Scryfall images",
+        )
+        parser.add_argument(
+            "--index_dir",
+            type=Path,
+            default=DEFAULT_INDEX_DIR,
+            help="Directory to save the index to",
+        )
+        parser.add_argument(
+            "--n_features",
+            type=int,
+            default=DEFAULT_N_FEATURES,
+            help="Max keypoints per card",
+        )
+        args = parser.parse_args()
+        return cls(
+            image_dir=args.image_dir,
+            index_dir=args.index_dir,
+            n_features=args.n_features,
+        )
+
+
+def main() -> int:
+    args = CliArgs.parse_args()
+    logger.info("Args: %s", args)
+    index = OrbIndex.build(args.image_dir, args.n_features)
+    index.save(args.index_dir)
+    logger.info("Saved index of %d cards to %s", len(index), args.index_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
@@ -0,0 +1,286 @@
+"""
+Perceptual hash index over the Scryfall card images, used to identify a cropped card scan
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import TYPE_CHECKING, Self
+
+import cv2 as cv
+import numpy as np
+import numpy.typing as npt
+
+if TYPE_CHECKING:
+    import cv2.typing as ct
+
+logger = logging.getLogger(__name__)
+
+SCRYFALL_DATA_DIR = Path(__file__).parent.parent.parent / "scryfall_data"
+DEFAULT_IMAGE_DIR = SCRYFALL_DATA_DIR / "image_data"
+DEFAULT_INDEX_DIR = SCRYFALL_DATA_DIR / "phash_index"
+
+# 8x8 bits = 64 bit hash
+HASH_SIZE = 8
+# size the image is shrunk to before the DCT, the hash comes from the lowest frequencies
+_DCT_SIZE = 32
+
+_HASHES_FILE = "hashes.npy"
+_IDS_FILE = "ids.npy"
+_META_FILE = "meta.json"
+
+# number of set bits in each possible byte, used for a vectorised Hamming distance on older numpy
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class HashMethod(Enum):
+    PHASH = "phash"
+    DHASH = "dhash"
+
+
+def _grayscale(img: ct.MatLike) -> ct.MatLike:
+    return cv.cvtColor(img, cv.COLOR_BGR2GRAY) if img.ndim == 3 else img
+
+
+def phash(img: ct.MatLike, hash_size: int = HASH_SIZE) -> npt.NDArray[np.uint8]:
+    """
+    DCT based perceptual hash, robust to scaling, blur and small colour changes
+
+    Args:
+        img (ct.MatLike): BGR or grayscale image
+        hash_size (int, optional): hash is `hash_size`**2 bits. Defaults to HASH_SIZE.
+
+    Returns:
+        npt.NDArray[np.uint8]: hash bits packed into bytes
+    """
+    small = cv.resize(
+        _grayscale(img), (_DCT_SIZE, _DCT_SIZE), interpolation=cv.INTER_AREA
+    )
+    dct = np.asarray(cv.dct(small.astype(np.float32)), dtype=np.float32)
+    low_freq = dct[:hash_size, :hash_size]
+    # the DC term is the mean brightness and would skew the median
+    median = np.median(low_freq.ravel()[1:])
+    return np.packbits(low_freq > median)
+
+
+def dhash(img: ct.MatLike, hash_size: int = HASH_SIZE) -> npt.NDArray[np.uint8]:
+    """
+    Gradient hash, cheaper than `phash` but less tolerant of lighting changes
+
+    Args:
+        img (ct.MatLike): BGR or grayscale image
+        hash_size (int, optional): hash is `hash_size`**2 bits. Defaults to HASH_SIZE.
+
+    Returns:
+        npt.NDArray[np.uint8]: hash bits packed into bytes
+    """
+    small = cv.resize(
+        _grayscale(img), (hash_size + 1, hash_size), interpolation=cv.INTER_AREA
+    )
+    return np.packbits(small[:, 1:] > small[:, :-1])
+
+
+HashFunction = Callable[["ct.MatLike", int], npt.NDArray[np.uint8]]
+
+HASH_FUNCTIONS: dict[HashMethod, HashFunction] = {
+    HashMethod.PHASH: phash,
+    HashMethod.DHASH: dhash,
+}
+
+
+def hamming_distances(
+    hashes: npt.NDArray[np.uint8], query: npt.NDArray[np.uint8]
+) -> npt.NDArray[np.uint16]:
+    """
+    Hamming distance from `query` to each row of `hashes`, both packed as bytes
+    """
+    if hasattr(np, "bitwise_count") and hashes.shape[1] % 8 == 0:
+        # compare 64 bits at a time with a native popcount (numpy>=2.0)
+        xor = np.bitwise_xor(
+            np.ascontiguousarray(hashes).view(np.uint64),
+            np.ascontiguousarray(query).view(np.uint64),
+        )
+        counts = np.bitwise_count(xor)
+    else:
+        counts = _POPCOUNT[np.bitwise_xor(hashes, query)]
+    distances: npt.NDArray[np.uint16] = counts.sum(axis=1, dtype=np.uint16)
+    return distances
+
+
+@dataclass
+class Match:
+    scryfall_id: str
+    distance: int
+
+
+class PHashIndex:
+    """
+    Hashes of every card image held in one contiguous (n_cards, n_bytes) array,
+    with the scryfall id of each row in a parallel array.
+    Saved as `.npy` files so `load` can memory map them instead of reading them in.
+    """
+
+    def __init__(
+        self,
+        ids: npt.NDArray[np.str_],
+        hashes: npt.NDArray[np.uint8],
+        method: HashMethod = HashMethod.PHASH,
+        hash_size: int = HASH_SIZE,
+    ) -> None:
+        if len(ids) != len(hashes):
+            raise ValueError(f"Got {len(ids)} ids for {len(hashes)} hashes")
+        self.ids = ids
+        self.hashes = hashes
+        self.method = method
+        self.hash_size = hash_size
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def hash_image(self, img: ct.MatLike) -> npt.NDArray[np.uint8]:
+        return HASH_FUNCTIONS[self.method](img, self.hash_size)
+
+    @classmethod
+    def build(
+        cls,
+        image_dir: Path = DEFAULT_IMAGE_DIR,
+        method: HashMethod = HashMethod.PHASH,
+        hash_size: int = HASH_SIZE,
+        workers: int = 8,
+    ) -> Self:
+        """
+        Hash every `<scryfall_id>.jpg` in `image_dir`, the whole card image is hashed to match a cropped scan
+
+        Args:
+            image_dir (Path, optional): directory of pulled scryfall images. Defaults to DEFAULT_IMAGE_DIR.
+            method (HashMethod, optional): hash to use. Defaults to HashMethod.PHASH.
+            hash_size (int, optional): hash is `hash_size`**2 bits. Defaults to HASH_SIZE.
+            workers (int, optional): threads decoding images, OpenCV releases the GIL. Defaults to 8.
+
+        Returns:
+            Self: the built index
+        """
+        paths = sorted(image_dir.glob("*.jpg"))
+        hash_fn = HASH_FUNCTIONS[method]
+        n_bytes = hash_size * hash_size // 8
+
+        def _hash(path: Path) -> npt.NDArray[np.uint8] | None:
+            img = cv.imread(str(path))
+            if img is None:
+                logger.warning("Could not read %s, skipping", path)
+                return None
+            return hash_fn(img, hash_size)
+
+        start = time.perf_counter()
+        hashes = np.empty((len(paths), n_bytes), dtype=np.uint8)
+        keep = np.zeros(len(paths), dtype=bool)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for i, img_hash in enumerate(executor.map(_hash, paths)):
+                if img_hash is not None:
+                    hashes[i] = img_hash
+                    keep[i] = True
+        ids = np.array([path.stem for path in paths], dtype=np.str_)
+        logger.info(
+            "Hashed %d images in %.1fs", keep.sum(), time.perf_counter() - start
+        )
+        return cls(ids[keep], hashes[keep], method, hash_size)
+
+    def save(self, index_dir: Path = DEFAULT_INDEX_DIR) -> None:
+        index_dir.mkdir(parents=True, exist_ok=True)
+        np.save(index_dir / _HASHES_FILE, np.ascontiguousarray(self.hashes))
+        np.save(index_dir / _IDS_FILE, self.ids)
+        (index_dir / _META_FILE).write_text(
+            json.dumps({"method": self.method.value, "hash_size": self.hash_size})
+        )
+
+    @classmethod
+    def load(cls, index_dir: Path = DEFAULT_INDEX_DIR, mmap: bool = True) -> Self:
+        """
+        Load an index saved with `save`, memory mapping the arrays unless `mmap` is `False`
+        """
+        meta = json.loads((index_dir / _META_FILE).read_text())
+        return cls(
+            ids=np.load(index_dir / _IDS_FILE, mmap_mode="r" if mmap else None),
+            hashes=np.load(index_dir / _HASHES_FILE, mmap_mode="r" if mmap else None),
+            method=HashMethod(meta["method"]),
+            hash_size=int(meta["hash_size"]),
+        )
+
+    def query_hash(self, img_hash: npt.NDArray[np.uint8], k: int = 5) -> list[Match]:
+        """
+        The `k` closest cards to `img_hash` by Hamming distance, closest first
+        """
+        if len(self) == 0:
+            return []
+        distances = hamming_distances(self.hashes, img_hash)
+        k = min(k, len(distances))
+        # partial sort, only the top k need ordering
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top], kind="stable")]
+        return [Match(str(self.ids[i]), int(distances[i])) for i in top]
+
+    def query(self, img: ct.MatLike, k: int = 5) -> list[Match]:
+        """
+        The `k` closest cards to a cropped card image, closest first
+        """
+        return self.query_hash(self.hash_image(img), k)
+
+
+@dataclass
+class CliArgs:
+    image_dir: Path
+    index_dir: Path
+    method: HashMethod
+
+    @classmethod
+    def parse_args(cls) -> Self:
+        parser = argparse.ArgumentParser(
+            description="Builds the perceptual hash index of the pulled Scryfall images",
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        )
+        parser.add_argument(
+            "--image_dir",
+            type=Path,
+            default=DEFAULT_IMAGE_DIR,
+            help="Directory of pulled Scryfall images",
+        )
+        parser.add_argument(
+            "--index_dir",
+            type=Path,
+            default=DEFAULT_INDEX_DIR,
+            help="Directory to save the index to",
+        )
+        parser.add_argument(
+            "--method",
+            type=HashMethod,
+            default=HashMethod.PHASH.value,
+            help="Hash to use",
+        )
+        args = parser.parse_args()
+        return cls(
+            image_dir=args.image_dir,
+            index_dir=args.index_dir,
+            method=HashMethod(args.method),
+        )
+
+
+def main() -> int:
+    args = CliArgs.parse_args()
+    logger.info("Args: %s", args)
+    index = PHashIndex.build(args.image_dir, args.method)
+    index.save(args.index_dir)
+    logger.info("Saved index of %d cards to %s", len(index), args.index_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
 import logging
+from collections.abc import Sequence
 from typing import TYPE_CHECKING
 
 import cv2 as cv
 import numpy as np
+import numpy.typing as npt
 
 if TYPE_CHECKING:
     import cv2.typing as ct
@@ -12,23 +14,48 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 
-def detect_card_edge(image: ct.MatLike) -> ct.MatLike:
-    """https://learnopencv.com/contour-detection-using-opencv-python-c/"""
-    # Convert the image to grayscale
-    grayscale_img = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+# Scryfall `normal` image size, cards are warped to this so crops line up with the reference images
+CARD_WIDTH = 488
+CARD_HEIGHT = 680
+# short side over long side of a card, 63mm x 88mm
+CARD_ASPECT_RATIO = 63 / 88
+# size (longest side) to shrink to when finding the card in `detect_card_edge`'s downscaled mode
+DEFAULT_DETECTION_MAX_DIM = 1024
+# pixels of padding around the mapped back card when refining at full resolution,
+# added to one downscaled pixel to cover rounding of the coarse contour
+_REFINE_MARGIN = 4
+# `warp_card` halves a card with INTER_AREA first while warping would scale it by less than this
+_PRE_SHRINK_SCALE = 0.5
+
+
+def _threshold_contours(
+    grayscale_img: ct.MatLike,
+    offset: tuple[int, int] = (0, 0),
+    ignore_mask: ct.MatLike | None = None,
+) -> tuple[Sequence[ct.MatLike], ct.MatLike | None]:
     # set all pixels above threshold to 255 and all others to 0
     # gives a black and white mask of the image for cleaner contours
     ret, threshold_img = cv.threshold(
         grayscale_img, thresh=70, maxval=255, type=cv.THRESH_BINARY
     )
+    if ignore_mask is not None:
+        # blank out the pixels we know are not on the card edge so they are not traced
+        cv.subtract(threshold_img, ignore_mask, dst=threshold_img)
     # NOTE: cv.CHAIN_APPROX_NONE is the most accurate, but cv.CHAIN_APPROX_SIMPLE is faster with less "resolution"
     # may be worth playing with the `mode` in the future to see if it affects the results
+    # `_largest_contour` also relies on every boundary pixel being kept to bound the area by the point count
     contours, hierarchy = cv.findContours(
         image=threshold_img,
         mode=cv.RETR_CCOMP,
         method=cv.CHAIN_APPROX_NONE,
+        offset=offset,
     )
+    return contours, hierarchy
 
+
+def _largest_contour(
+    contours: Sequence[ct.MatLike], hierarchy: ct.MatLike | None
+) -> ct.MatLike:
     # filter only parent contours
     # each contour is part of a hierarchy
     # the hierarchy "mask" is a 4-element array
@@ -38,27 +65,84 @@ def detect_card_edge(image: ct.MatLike) -> ct.MatLike:
     # parent is the index of the parent contour
 
     # the outer edge of the image gets identified as a contour, so we need to find the first children of the outer edge
-    try:
-        outer_border_contour_index = [
-            i
-            for i, (next_, previous, first_child, parent) in enumerate(hierarchy[0])
-            if parent == -1 and next_ == -1 and first_child > -1
-        ][0]
-    except IndexError:
+    if hierarchy is None:
+        raise ValueError("No contours found")
+    next_, _, first_child, parent = hierarchy[0].T
+    outer_border = np.flatnonzero((parent == -1) & (next_ == -1) & (first_child > -1))
+    if not len(outer_border):
         logger.debug("No outer border contour found")
-        outer_border_contour_index = None
 
     # grab largest contour by area
     # this should help remove any tiny contour noise
-    contours_to_consider = list(contours)
+    # a contour of n 8-connected points has a perimeter of at most n*sqrt(2),
+    # so an area of at most n**2 / (2 * pi), which prunes most of the noise in one go
+    n_points = np.fromiter(map(len, contours), dtype=np.float64, count=len(contours))
+    max_areas = n_points**2 / (2 * np.pi)
     # drop the outer border contour if one was found
-    if outer_border_contour_index is not None:
-        contours_to_consider.pop(outer_border_contour_index)
-    card_contour = max(contours_to_consider, key=cv.contourArea)
-
+    max_areas[outer_border[:1]] = -1
+    card_contour: ct.MatLike | None = None
+    card_area = -1.0
+    # largest bound first, stop once no remaining contour could beat the best so far
+    for i in np.argsort(-max_areas, kind="stable"):
+        if max_areas[i] <= card_area:
+            break
+        area = cv.contourArea(contours[i])
+        if area > card_area:
+            card_contour, card_area = contours[i], area
+    if card_contour is None:
+        raise ValueError("No card contour found")
     return card_contour
 
 
+def detect_card_edge(image: ct.MatLike, max_dim: int | None = None) -> ct.MatLike:
+    """
+    https://learnopencv.com/contour-detection-using-opencv-python-c/
+
+    Args:
+        image (ct.MatLike): BGR image containing a card
+        max_dim (int | None, optional): if set and the image is larger, the card is found on a copy
+            shrunk so its longest side is `max_dim`, then refined at full resolution around where it was found.
+            Much faster on large photos, `DEFAULT_DETECTION_MAX_DIM` is a good value. Defaults to None.
+
+    Returns:
+        ct.MatLike: contour of the card, in full resolution coordinates
+    """
+    height, width = image.shape[:2]
+    if max_dim is None or max(height, width) <= max_dim:
+        # Convert the image to grayscale
+        grayscale_img = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+        return _largest_contour(*_threshold_contours(grayscale_img))
+
+    # INTER_AREA is several times slower at non integer scales, the coarse pass only needs the rough outline
+    scale = max_dim / max(height, width)
+    small_img = cv.resize(
+        image, None, fx=scale, fy=scale, interpolation=cv.INTER_LINEAR
+    )
+    coarse_contour = _largest_contour(
+        *_threshold_contours(cv.cvtColor(small_img, cv.COLOR_BGR2GRAY))
+    )
+    scaled_contour: ct.MatLike = np.round(coarse_contour / scale).astype(np.int32)
+
+    # map the coarse bounding box back and only look at that region at full resolution
+    x, y, w, h = cv.boundingRect(scaled_contour)
+    margin = int(np.ceil(1 / scale)) + _REFINE_MARGIN
+    x0, y0 = max(x - margin, 0), max(y - margin, 0)
+    x1, y1 = min(x + w + margin, width), min(y + h + margin, height)
+    roi = cv.cvtColor(image[y0:y1, x0:x1], cv.COLOR_BGR2GRAY)
+    # only a band either side of the coarse edge can hold the card edge, ignore the card's interior
+    interior = np.zeros_like(roi)
+    roi_contour = scaled_contour - np.array([x0, y0], dtype=np.int32)
+    cv.drawContours(interior, [roi_contour], -1, color=(255,), thickness=cv.FILLED)
+    cv.drawContours(interior, [roi_contour], -1, color=(0,), thickness=2 * margin)
+    try:
+        return _largest_contour(
+            *_threshold_contours(roi, offset=(x0, y0), ignore_mask=interior)
+        )
+    except ValueError:
+        logger.debug("Refinement found no contour, using the scaled up coarse contour")
+        return scaled_contour
+
+
 def blackout_outside_contour(img: ct.MatLike, contour: ct.MatLike) -> ct.MatLike:
     """
     SO link: https://stackoverflow.com/questions/28759253/how-to-crop-the-internal-area-of-a-contour
@@ -84,3 +168,339 @@ def crop_img_to_contour(img: ct.MatLike, contour: ct.MatLike) -> ct.MatLike:
     x, y, w, h = cv.boundingRect(contour)
     cropped_image = img[y : y + h, x : x + w]
     return cropped_image
+
+
+def _buffer_view(
+    buffer: npt.NDArray[np.uint8] | None, shape: tuple[int, ...]
+) -> npt.NDArray[np.uint8]:
+    """view of the top left `shape` of `buffer`, or a new array if it is missing or too small"""
+    if (
+        buffer is None
+        or buffer.ndim != len(shape)
+        or any(have < need for have, need in zip(buffer.shape, shape))
+    ):
+        return np.empty(shape, dtype=np.uint8)
+    return buffer[tuple(slice(0, size) for size in shape)]
+
+
+def extract_card(
+    img: ct.MatLike,
+    contour: ct.MatLike,
+    out: npt.NDArray[np.uint8] | None = None,
+    mask: npt.NDArray[np.uint8] | None = None,
+) -> ct.MatLike:
+    """
+    Same result as `crop_img_to_contour(blackout_outside_contour(img, contour), contour)`,
+    but the crop happens first so the mask and output are only the size of the contour's bounding box.
+    When processing a stream of frames pass the same `out` and `mask` buffers each time to avoid allocating,
+    buffers at least as large as the card are reused through a view of their top left corner.
+
+    Args:
+        img (ct.MatLike): BGR image
+        contour (ct.MatLike): contour of the card in `img`, e.g. from `detect_card_edge`
+        out (npt.NDArray[np.uint8] | None, optional): buffer for the result, shaped like `img`. Defaults to None.
+        mask (npt.NDArray[np.uint8] | None, optional): single channel scratch buffer for the mask. Defaults to None.
+
+    Returns:
+        ct.MatLike: the card cropped to its bounding box, black outside the contour. A view of `out` if given.
+    """
+    x, y, w, h = cv.boundingRect(contour)
+    roi = img[y : y + h, x : x + w]
+    mask_view = _buffer_view(mask, (h, w))
+    mask_view.fill(0)
+    cv.drawContours(
+        image=mask_view,
+        contours=[contour],
+        contourIdx=-1,
+        color=(255,),
+        thickness=cv.FILLED,
+        offset=(-x, -y),
+    )
+    out_view = _buffer_view(out, roi.shape)
+    # the mask leaves pixels outside the contour untouched, so they need clearing when reusing a buffer
+    out_view.fill(0)
+    cv.bitwise_and(roi, roi, dst=out_view, mask=mask_view)
+    return out_view
+
+
+def fit_card_quad(contour: ct.MatLike) -> npt.NDArray[np.float32]:
+    """
+    Four corners of the card outlined by `contour`, ordered top left, top right, bottom right, bottom left
+    of the card held upright, so a card lying sideways has its right hand side as the top edge.
+    Uses the polygon approximation of the convex hull when it has four corners, catching perspective tilt,
+    otherwise (rounded corners, occlusion, noise) the minimum area rotated rectangle.
+
+    Args:
+        contour (ct.MatLike): contour of the card, e.g. from `detect_card_edge`
+
+    Returns:
+        npt.NDArray[np.float32]: (4, 2) corner points
+    """
+    hull = cv.convexHull(contour)
+    approx = cv.approxPolyDP(hull, epsilon=0.02 * cv.arcLength(hull, True), closed=True)
+    quad: npt.NDArray[np.float32]
+    if len(approx) == 4:
+        quad = approx.reshape(4, 2).astype(np.float32)
+    else:
+        quad = cv.boxPoints(cv.minAreaRect(contour)).astype(np.float32)
+
+    # clockwise from the corner nearest the image origin, y points down so increasing angle is clockwise
+    center = quad.mean(axis=0)
+    angles = np.arctan2(quad[:, 1] - center[1], quad[:, 0] - center[0])
+    quad = quad[np.argsort(angles)]
+    quad = np.roll(quad, -int(np.argmin(quad.sum(axis=1))), axis=0)
+    top = np.linalg.norm(quad[1] - quad[0]) + np.linalg.norm(quad[2] - quad[3])
+    side = np.linalg.norm(quad[3] - quad[0]) + np.linalg.norm(quad[2] - quad[1])
+    if top > side:
+        # landscape, turn it upright
+        quad = np.roll(quad, -1, axis=0)
+    return quad
+
+
+def warp_card(
+    img: ct.MatLike,
+    quad: npt.NDArray[np.float32],
+    out: npt.NDArray[np.uint8] | None = None,
+) -> ct.MatLike:
+    """
+    Perspective warp the card with corners `quad` (as from `fit_card_quad`) to a `CARD_WIDTH` x `CARD_HEIGHT` image
+
+    Args:
+        img (ct.MatLike): BGR image
+        quad (npt.NDArray[np.float32]): (4, 2) corners, top left, top right, bottom right, bottom left
+        out (npt.NDArray[np.uint8] | None, optional): (CARD_HEIGHT, CARD_WIDTH, channels) buffer to write into. Defaults to None.
+
+    Returns:
+        ct.MatLike: the upright card
+    """
+    scale = _warp_scale(quad)
+    if scale < _PRE_SHRINK_SCALE:
+        # warpPerspective has no area interpolation, so a big downscale would alias.
+        # the card's bounding box is halved with INTER_AREA first, which OpenCV has a fast path for,
+        # until what's left for the warp is a small enough scale for bilinear
+        x, y, w, h = cv.boundingRect(quad)
+        x, y = max(x, 0), max(y, 0)
+        img = img[y : y + h, x : x + w]
+        quad = quad - np.array([x, y], dtype=np.float32)
+        while scale < _PRE_SHRINK_SCALE:
+            height, width = img.shape[:2]
+            img = cv.resize(
+                img[: height - height % 2, : width - width % 2],
+                (width // 2, height // 2),
+                interpolation=cv.INTER_AREA,
+            )
+            quad = quad * np.float32(0.5)
+            scale *= 2
+    target = np.array(
+        [[0, 0], [CARD_WIDTH, 0], [CARD_WIDTH, CARD_HEIGHT], [0, CARD_HEIGHT]],
+        dtype=np.float32,
+    )
+    transform = cv.getPerspectiveTransform(quad, target)
+    if out is None:
+        return cv.warpPerspective(
+            img, transform, (CARD_WIDTH, CARD_HEIGHT), flags=cv.INTER_LINEAR
+        )
+    return cv.warpPerspective(
+        img, transform, (CARD_WIDTH, CARD_HEIGHT), dst=out, flags=cv.INTER_LINEAR
+    )
+
+
+def _warp_scale(quad: npt.NDArray[np.float32]) -> float:
+    """how much `warp_card` scales the card with corners `quad` by, below 1 is a downscale"""
+    edges = np.linalg.norm(quad - np.roll(quad, -1, axis=0), axis=1)
+    width = max(float(edges[0] + edges[2]) / 2, 1.0)
+    height = max(float(edges[1] + edges[3]) / 2, 1.0)
+    return max(CARD_WIDTH / width, CARD_HEIGHT / height)
+
+
+def normalize_card(
+    img: ct.MatLike,
+    contour: ct.MatLike,
+    out: npt.NDArray[np.uint8] | None = None,
+) -> ct.MatLike:
+    """
+    The card outlined by `contour` straightened and scaled to `CARD_WIDTH` x `CARD_HEIGHT`,
+    ready to compare with the reference images without any further resizing
+    """
+    return warp_card(img, fit_card_quad(contour), out=out)
+
+
+def _contour_edges(
+    contours: Sequence[ct.MatLike],
+) -> tuple[
+    npt.NDArray[np.float64],
+    npt.NDArray[np.float64],
+    npt.NDArray[np.float64],
+    npt.NDArray[np.float64],
+    npt.NDArray[np.intp],
+]:
+    """
+    x, y of the points of all `contours` concatenated, x, y of the point following each one round its contour,
+    and the index each contour starts at to split sums over the points per contour with `np.add.reduceat`
+    """
+    lengths = np.fromiter(map(len, contours), dtype=np.intp, count=len(contours))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    points = np.concatenate(contours).reshape(-1, 2)
+    # each contour moved to start at the origin, areas and central moments are the same with less cancellation
+    points = (points - np.repeat(points[starts], lengths, axis=0)).astype(np.float64)
+    # index of the following point, wrapping round to the start of the same contour
+    following = np.arange(1, len(points) + 1)
+    following[starts + lengths - 1] = starts
+    x, y = points[:, 0], points[:, 1]
+    return x, y, x[following], y[following], starts
+
+
+def contour_areas(contours: Sequence[ct.MatLike]) -> npt.NDArray[np.float64]:
+    """
+    Area of every contour in one vectorised pass, the shoelace sums over the concatenated points split per contour
+
+    Args:
+        contours (Sequence[ct.MatLike]): non empty contours as returned by `cv.findContours`
+
+    Returns:
+        npt.NDArray[np.float64]: areas
+    """
+    if not len(contours):
+        return np.empty(0)
+    x, y, x1, y1, starts = _contour_edges(contours)
+    areas: npt.NDArray[np.float64] = (
+        np.abs(np.add.reduceat(x * y1 - x1 * y, starts)) / 2
+    )
+    return areas
+
+
+def contour_aspect_ratios(contours: Sequence[ct.MatLike]) -> npt.NDArray[np.float64]:
+    """
+    Short over long side of the rectangle with the same second moments as each contour,
+    independent of rotation and of the staircase edges of a tilted contour.
+    The polygon moments are shoelace sums like `contour_areas`, weighted by each edge's coordinates
+
+    Args:
+        contours (Sequence[ct.MatLike]): non empty contours as returned by `cv.findContours`
+
+    Returns:
+        npt.NDArray[np.float64]: aspect ratios, 0 for contours with no area
+    """
+    if not len(contours):
+        return np.empty(0)
+    x, y, x1, y1, starts = _contour_edges(contours)
+    cross = x * y1 - x1 * y
+    x_sum, y_sum = x + x1, y + y1
+    m00 = np.add.reduceat(cross, starts) / 2
+    m10 = np.add.reduceat(cross * x_sum, starts) / 6
+    m01 = np.add.reduceat(cross * y_sum, starts) / 6
+    # x^2 + x x1 + x1^2, 2 x y + x y1 + x1 y + 2 x1 y1 and y^2 + y y1 + y1^2
+    m20 = np.add.reduceat(cross * (x_sum * x_sum - x * x1), starts) / 12
+    m11 = np.add.reduceat(cross * (x_sum * y_sum + x * y + x1 * y1), starts) / 24
+    m02 = np.add.reduceat(cross * (y_sum * y_sum - y * y1), starts) / 12
+    # the sums are negative for clockwise contours
+    orientation = np.sign(m00)
+    area = m00 * orientation
+    inverse_area = np.divide(1, area, out=np.zeros_like(area), where=area > 0)
+    mu20 = m20 * orientation - m10 * m10 * inverse_area
+    mu11 = m11 * orientation - m10 * m01 * inverse_area
+    mu02 = m02 * orientation - m01 * m01 * inverse_area
+    # eigenvalues of the covariance, for a rectangle they're proportional to the squared sides
+    spread = np.hypot((mu20 - mu02) / 2, mu11)
+    major = (mu20 + mu02) / 2 + spread
+    minor = np.maximum((mu20 + mu02) / 2 - spread, 0)
+    ratios: npt.NDArray[np.float64] = np.sqrt(
+        np.divide(minor, major, out=np.zeros_like(major), where=major > 0)
+    )
+    return ratios
+
+
+def _reading_order(boxes: npt.NDArray[np.intp]) -> list[int]:
+    """indices of `boxes` (x, y, w, h) in rows top to bottom, left to right within a row"""
+    by_top = np.argsort(boxes[:, 1], kind="stable")
+    rows: list[list[int]] = []
+    row_bottom = -1.0
+    for i in by_top:
+        x, y, w, h = boxes[i]
+        # a box starting above the middle of the current row belongs to it
+        if rows and y < row_bottom:
+            rows[-1].append(int(i))
+        else:
+            rows.append([int(i)])
+            row_bottom = y + h / 2
+    return [i for row in rows for i in sorted(row, key=lambda i: boxes[i, 0])]
+
+
+def detect_card_edges(
+    image: ct.MatLike,
+    max_dim: int | None = None,
+    min_area_fraction: float = 0.005,
+    aspect_tolerance: float = 0.1,
+) -> list[ct.MatLike]:
+    """
+    Contours of every card in the image, e.g. a binder page or cards laid out on a table.
+    Contours are filtered by area, computed for all contours at once, then by the aspect ratio from the second moments
+    of those left, then contours inside another card (e.g. the art box) are dropped.
+
+    Args:
+        image (ct.MatLike): BGR image
+        max_dim (int | None, optional): if set and the image is larger, find the cards on a copy
+            shrunk so its longest side is `max_dim` and scale the contours back up. Defaults to None.
+        min_area_fraction (float, optional): smallest card, as a fraction of the image area. Defaults to 0.005.
+        aspect_tolerance (float, optional): max difference from `CARD_ASPECT_RATIO`. Defaults to 0.1.
+
+    Returns:
+        list[ct.MatLike]: card contours in reading order, top to bottom then left to right
+    """
+    height, width = image.shape[:2]
+    scale = 1.0
+    if max_dim is not None and max(height, width) > max_dim:
+        scale = max_dim / max(height, width)
+        # see `detect_card_edge` for why not INTER_AREA
+        image = cv.resize(
+            image, None, fx=scale, fy=scale, interpolation=cv.INTER_LINEAR
+        )
+    grayscale_img = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+    contours, _ = _threshold_contours(grayscale_img)
+    if not contours:
+        return []
+
+    image_area = grayscale_img.shape[0] * grayscale_img.shape[1]
+    min_area = min_area_fraction * image_area
+    # same point count bound as `_largest_contour`, drops the noise before concatenating points
+    n_points = np.fromiter(map(len, contours), dtype=np.float64, count=len(contours))
+    candidates = np.flatnonzero(n_points**2 / (2 * np.pi) >= min_area)
+    areas = contour_areas([contours[i] for i in candidates])
+    # the border of a plain background covers the whole image
+    candidates = candidates[(areas >= min_area) & (areas < 0.9 * image_area)]
+    aspect_ratios = contour_aspect_ratios([contours[i] for i in candidates])
+    candidates = candidates[
+        np.abs(aspect_ratios - CARD_ASPECT_RATIO) <= aspect_tolerance
+    ]
+    if not len(candidates):
+        return []
+
+    boxes = np.array([cv.boundingRect(contours[i]) for i in candidates], dtype=np.intp)
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    # contains[i, j], box i holds box j
+    contains = (
+        (x0[:, None] <= x0[None, :])
+        & (y0[:, None] <= y0[None, :])
+        & (x1[:, None] >= x1[None, :])
+        & (y1[:, None] >= y1[None, :])
+    )
+    # of identical boxes only the first is kept
+    identical = contains & contains.T
+    contains &= ~(identical & np.tri(len(boxes), k=0, dtype=bool))
+    outermost = ~contains.any(axis=0)
+    candidates, boxes = candidates[outermost], boxes[outermost]
+
+    cards = [contours[candidates[i]] for i in _reading_order(boxes)]
+    if scale != 1.0:
+        cards = [np.round(card / scale).astype(np.int32) for card in cards]
+    return cards
+
+
+def extract_cards(
+    image: ct.MatLike, contours: Sequence[ct.MatLike]
+) -> list[ct.MatLike]:
+    """
+    Every card in `contours` (as from `detect_card_edges`) straightened with `normalize_card`
+    """
+    return [normalize_card(image, contour) for contour in contours]
@@ -0,0 +1,284 @@
+"""
+Batch scanning of a directory (or glob) of card photos across a process pool, results are streamed as JSON lines
+"""
+
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Self, TextIO
+
+import cv2 as cv
+import numpy as np
+
+from mtg_scanner.scanner.identification.phash_index import PHashIndex
+from mtg_scanner.scanner.image_processing.card_detection import (
+    DEFAULT_DETECTION_MAX_DIM,
+    detect_card_edge,
+    normalize_card,
+)
+from mtg_scanner.scanner.scan_pool import init_worker, worker_index
+
+if TYPE_CHECKING:
+    import cv2.typing as ct
+
+    from mtg_scanner.db.card_snapshot import CardSnapshot
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = frozenset({".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff"})
+
+
+@dataclass
+class ScanResult:
+    """
+    Outcome of scanning a single image
+    """
+
+    path: str
+    # x, y, w, h of the detected card
+    bounding_box: tuple[int, int, int, int] | None = None
+    matches: list[dict[str, object]] = field(default_factory=list)
+    error: str | None = None
+    elapsed_ms: float = 0.0
+
+    def to_json(self) -> str:
+        return json.dumps(dataclasses.asdict(self))
+
+
+def find_images(source: str) -> list[Path]:
+    """
+    Image files in a directory (recursively) or matching a glob pattern, sorted
+
+    Args:
+        source (str): directory or glob pattern e.g. `photos/**/*.jpg`
+
+    Returns:
+        list[Path]: image paths
+    """
+    if os.path.isdir(source):
+        paths: Iterable[Path] = Path(source).rglob("*")
+    else:
+        paths = (Path(path) for path in glob.glob(source, recursive=True))
+    return sorted(
+        path
+        for path in paths
+        if path.suffix.lower() in IMAGE_SUFFIXES and path.is_file()
+    )
+
+
+def _scan(
+    name: str,
+    decode: Callable[[], ct.MatLike | None],
+    index: PHashIndex | None,
+    k: int,
+) -> ScanResult:
+    start = time.perf_counter()
+    result = ScanResult(path=name)
+    try:
+        img = decode()
+        if img is None:
+            raise ValueError("Could not decode image")
+        # photos are mostly phone camera sized, find the card on a downscaled copy
+        contour = detect_card_edge(img, max_dim=DEFAULT_DETECTION_MAX_DIM)
+        x, y, w, h = cv.boundingRect(contour)
+        result.bounding_box = (x, y, w, h)
+        if index is not None:
+            card = normalize_card(img, contour)
+            result.matches = [
+                dataclasses.asdict(match) for match in index.query(card, k=k)
+            ]
+    except Exception as err:
+        result.error = repr(err)
+    result.elapsed_ms = (time.perf_counter() - start) * 1000
+    return result
+
+
+def scan_image(path: Path, index: PHashIndex | None = None, k: int = 5) -> ScanResult:
+    """
+    Decode, detect, straighten and (if an index is given) identify the card in one image.
+    Errors are recorded on the result so one bad photo does not stop a batch.
+    """
+    return _scan(str(path), lambda: cv.imread(str(path)), index, k)
+
+
+def scan_image_bytes(
+    data: bytes, name: str, index: PHashIndex | None = None, k: int = 5
+) -> ScanResult:
+    """
+    `scan_image` for an encoded image held in memory e.g. an upload, decoded straight from the buffer.
+    `name` is recorded as the result's path.
+    """
+    return _scan(
+        name,
+        lambda: cv.imdecode(np.frombuffer(data, dtype=np.uint8), cv.IMREAD_COLOR),
+        index,
+        k,
+    )
+
+
+def _scan_in_worker(path: Path, k: int) -> ScanResult:
+    return scan_image(path, worker_index(), k)
+
+
+def scan_images(
+    paths: list[Path],
+    index_dir: Path | None = None,
+    workers: int | None = None,
+    k: int = 5,
+    chunksize: int = 4,
+) -> Iterator[ScanResult]:
+    """
+    Scan `paths` over a process pool, yielding results in input order as they complete
+
+    Args:
+        paths (list[Path]): images to scan
+        index_dir (Path | None, optional): saved `PHashIndex` to identify cards with, skip identification if `None`. Defaults to None.
+        workers (int | None, optional): number of processes. Defaults to the number of CPUs.
+        k (int, optional): matches to return per image. Defaults to 5.
+        chunksize (int, optional): images sent to a worker at a time. Defaults to 4.
+
+    Yields:
+        ScanResult: result for each image
+    """
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(index_dir,)
+    ) as executor:
+        yield from executor.map(
+            _scan_in_worker, paths, [k] * len(paths), chunksize=chunksize
+        )
+
+
+@dataclass
+class CliArgs:
+    source: str
+    output: Path | None
+    index_dir: Path | None
+    snapshot_dir: Path | None
+    workers: int | None
+    top_k: int
+
+    @classmethod
+    def parse_args(cls, argv: list[str] | None = None) -> Self:
+        parser = argparse.ArgumentParser(
+            description="Detects, crops and optionally identifies the card in each photo, writing JSON lines",
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        )
+        parser.add_argument(
+            "source",
+            type=str,
+            help="Directory of photos or a glob pattern e.g. 'photos/**/*.jpg'",
+        )
+        parser.add_argument(
+            "--output",
+            type=Path,
+            default=None,
+            help="File to write results to, defaults to stdout",
+        )
+        parser.add_argument(
+            "--index_dir",
+            type=Path,
+            default=None,
+            help="Perceptual hash index to identify cards with, identification is skipped if not given",
+        )
+        parser.add_argument(
+            "--snapshot_dir",
+            type=Path,
+            default=None,
+            help="Card snapshot to name each match from, matches are left unnamed if not given",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of worker processes, defaults to the number of CPUs",
+        )
+        parser.add_argument(
+            "--top_k",
+            type=int,
+            default=5,
+            help="Number of matches to return per image",
+        )
+        args = parser.parse_args(argv)
+        return cls(
+            source=args.source,
+            output=args.output,
+            index_dir=args.index_dir,
+            snapshot_dir=args.snapshot_dir,
+            workers=args.workers,
+            top_k=args.top_k,
+        )
+
+
+def _name_matches(
+    results: Iterable[ScanResult], snapshot: CardSnapshot
+) -> Iterator[ScanResult]:
+    """add the name of each match's card, `None` if it's not in `snapshot`"""
+    for result in results:
+        names = snapshot.names(str(match["scryfall_id"]) for match in result.matches)
+        for match in result.matches:
+            match["name"] = names.get(str(match["scryfall_id"]))
+        yield result
+
+
+def _write_results(results: Iterable[ScanResult], out: TextIO) -> tuple[int, int]:
+    """write each result as a line, returns the number of results and errors"""
+    count = errors = 0
+    for result in results:
+        out.write(result.to_json() + "\n")
+        out.flush()
+        count += 1
+        errors += result.error is not None
+    return count, errors
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = CliArgs.parse_args(argv)
+    logger.info("Args: %s", args)
+
+    paths = find_images(args.source)
+    logger.info("Scanning %d images", len(paths))
+    start = time.perf_counter()
+    results = scan_images(paths, args.index_dir, args.workers, args.top_k)
+    if args.snapshot_dir is not None:
+        # the db package is only needed to name matches
+        from mtg_scanner.db.card_snapshot import CardSnapshot
+
+        results = _name_matches(results, CardSnapshot.load(args.snapshot_dir))
+    if args.output is None:
+        count, errors = _write_results(results, sys.stdout)
+    else:
+        with open(args.output, "w", encoding="utf-8") as out:
+            count, errors = _write_results(results, out)
+    elapsed = time.perf_counter() - start
+
+    logger.info(
+        "Scanned %d images (%d failed) in %.1fs, %.1f images/sec",
+        count,
+        errors,
+        elapsed,
+        count / elapsed if elapsed > 0 else 0.0,
+    )
+    return 1 if errors else 0
+
+
+def cli() -> int:
+    """
+    Entry point for the `mtg-scan` script
+    """
+    logging.basicConfig(level=logging.INFO)
+    return main()
+
+
+if __name__ == "__main__":
+    raise SystemExit(cli())
@@ -0,0 +1,102 @@
+"""
+Long lived process pool scanning images held in memory, e.g. uploads to the web server.
+The scanner and OpenCV are only imported by the workers, so using a pool costs the caller nothing until it scans.
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from mtg_scanner.scanner.identification.phash_index import PHashIndex
+    from mtg_scanner.scanner.scan import ScanResult
+
+logger = logging.getLogger(__name__)
+
+# set per worker process by `init_worker`
+_worker_index: PHashIndex | None = None
+
+
+def init_worker(index_dir: Path | None) -> None:
+    """
+    Process pool initializer for scanning, shared with `scan.scan_images`.
+    Limits OpenCV to one thread and loads the index once per worker for `worker_index`
+    """
+    global _worker_index
+    import cv2 as cv
+
+    from mtg_scanner.scanner.identification.phash_index import PHashIndex
+
+    # each process works on one image at a time, stop OpenCV spawning threads on top
+    cv.setNumThreads(1)
+    # memory mapped so every worker shares the same pages
+    _worker_index = PHashIndex.load(index_dir) if index_dir is not None else None
+
+
+def worker_index() -> PHashIndex | None:
+    """the index loaded by `init_worker` in this process"""
+    return _worker_index
+
+
+def _scan_in_worker(data: bytes, name: str, k: int) -> ScanResult:
+    from mtg_scanner.scanner.scan import scan_image_bytes
+
+    return scan_image_bytes(data, name, _worker_index, k)
+
+
+class ScanPool:
+    """
+    Scans encoded images on worker processes, the workers are started on the first `submit`
+    """
+
+    def __init__(
+        self, index_dir: Path | None = None, workers: int | None = None
+    ) -> None:
+        """
+        Args:
+            index_dir (Path | None, optional): saved `PHashIndex` to identify cards with,
+                identification is skipped if `None` or it doesn't exist. Defaults to None.
+            workers (int | None, optional): number of processes. Defaults to the number of CPUs.
+        """
+        self.index_dir = index_dir
+        self.workers = workers
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                index_dir = self.index_dir
+                if index_dir is not None and not index_dir.exists():
+                    logger.warning(
+                        "No index at %s, scans won't identify cards", index_dir
+                    )
+                    index_dir = None
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    # a fresh interpreter, forking would copy the caller's threads e.g. a server's event loop
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_worker,
+                    initargs=(index_dir,),
+                )
+            return self._executor
+
+    def submit(self, data: bytes, name: str, k: int = 5) -> Future[ScanResult]:
+        """
+        Scan an encoded image on a worker, see `scan.scan_image_bytes`
+        """
+        return self._get_executor().submit(_scan_in_worker, data, name, k)
+
+    def shutdown(self) -> None:
+        """
+        Stop the workers, scans still queued are cancelled. The pool restarts on the next `submit`.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
@@ -0,0 +1,372 @@
+"""
+Streaming scanner for a video file or capture device.
+Edge detection runs on a worker thread that only ever holds the newest frame,
+the card is tracked between frames and identified once it has been held still.
+"""
+
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import json
+import logging
+import sys
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from queue import Empty, Queue
+from typing import TYPE_CHECKING, Self
+
+import cv2 as cv
+import numpy as np
+import numpy.typing as npt
+
+from mtg_scanner.scanner.identification.phash_index import Match, PHashIndex
+from mtg_scanner.scanner.image_processing.card_detection import (
+    CARD_HEIGHT,
+    CARD_WIDTH,
+    DEFAULT_DETECTION_MAX_DIM,
+    detect_card_edge,
+    fit_card_quad,
+    normalize_card,
+)
+
+if TYPE_CHECKING:
+    import cv2.typing as ct
+
+logger = logging.getLogger(__name__)
+
+# consecutive frames the card has to stay still for before it is identified, ~1/6s at 30fps
+DEFAULT_STABLE_FRAMES = 5
+# max movement of any corner between frames, in pixels, for the card to count as still
+DEFAULT_STABLE_TOLERANCE = 4.0
+# padding around the last known card position searched when tracking, as a fraction of the card's size
+DEFAULT_TRACK_MARGIN = 0.15
+# smallest card to accept, as a fraction of the frame, anything smaller is most likely noise
+DEFAULT_MIN_CARD_FRACTION = 0.05
+# with no card in view the whole frame comes back as one contour
+_MAX_CARD_FRACTION = 0.9
+
+Identify = Callable[["ct.MatLike"], list[Match]]
+
+
+@dataclass
+class Identification:
+    """
+    A card identified once it was held still
+    """
+
+    frame_index: int
+    # top left, top right, bottom right, bottom left corners of the card in the frame
+    corners: list[list[float]]
+    matches: list[Match]
+
+    def to_json(self) -> str:
+        return json.dumps(dataclasses.asdict(self))
+
+
+@dataclass
+class VideoScanStats:
+    frames: int = 0
+    processed: int = 0
+    # frames replaced by a newer one before the worker got to them
+    dropped: int = 0
+    full_detections: int = 0
+    tracked: int = 0
+    identifications: int = 0
+
+
+@dataclass
+class _CardState:
+    contour: ct.MatLike | None = None
+    corners: npt.NDArray[np.float32] | None = None
+    stable_frames: int = 0
+    identified: bool = False
+
+
+class VideoScanner:
+    """
+    Takes frames with `submit` and processes them on a worker thread.
+    Only one frame is ever waiting, a new frame replaces it and the old one is counted as dropped,
+    so however slow detection is the result is never more than one frame behind.
+    Identifications are put on `identifications` as they are made.
+    """
+
+    def __init__(
+        self,
+        identify: Identify | None = None,
+        max_dim: int | None = DEFAULT_DETECTION_MAX_DIM,
+        stable_frames: int = DEFAULT_STABLE_FRAMES,
+        stable_tolerance: float = DEFAULT_STABLE_TOLERANCE,
+        track_margin: float = DEFAULT_TRACK_MARGIN,
+        min_card_fraction: float = DEFAULT_MIN_CARD_FRACTION,
+    ) -> None:
+        """
+        Args:
+            identify (Identify | None, optional): identifies a normalized card image, e.g. `PHashIndex.query`.
+                Cards are only detected and tracked if `None`. Defaults to None.
+            max_dim (int | None, optional): passed to `detect_card_edge`. Defaults to DEFAULT_DETECTION_MAX_DIM.
+            stable_frames (int, optional): frames the card must stay still before identifying it. Defaults to DEFAULT_STABLE_FRAMES.
+            stable_tolerance (float, optional): max corner movement in pixels between still frames. Defaults to DEFAULT_STABLE_TOLERANCE.
+            track_margin (float, optional): search padding when tracking, as a fraction of the card's size. Defaults to DEFAULT_TRACK_MARGIN.
+            min_card_fraction (float, optional): smallest card accepted, as a fraction of the frame area. Defaults to DEFAULT_MIN_CARD_FRACTION.
+        """
+        self.identify = identify
+        self.max_dim = max_dim
+        self.stable_frames = stable_frames
+        self.stable_tolerance = stable_tolerance
+        self.track_margin = track_margin
+        self.min_card_fraction = min_card_fraction
+        self.stats = VideoScanStats()
+        self.identifications: Queue[Identification] = Queue()
+
+        self._card = _CardState()
+        self._card_buffer = np.empty((CARD_HEIGHT, CARD_WIDTH, 3), dtype=np.uint8)
+        self._pending: tuple[int, ct.MatLike] | None = None
+        self._stopping = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name="video-scanner", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the worker once it has processed the frame waiting for it, if any
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.stop()
+
+    def submit(self, frame: ct.MatLike) -> None:
+        """
+        Hand a frame to the worker, replacing any frame it has not started on yet
+        """
+        with self._condition:
+            if self._pending is not None:
+                self.stats.dropped += 1
+            self._pending = (self.stats.frames, frame)
+            self.stats.frames += 1
+            self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._pending is None and not self._stopping:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                frame_index, frame = self._pending
+                self._pending = None
+            try:
+                self.process(frame_index, frame)
+            except Exception:
+                logger.exception("Failed to process frame %d", frame_index)
+
+    def _track(self, frame: ct.MatLike, previous: ct.MatLike) -> ct.MatLike | None:
+        """the card near `previous`, or `None` if it has moved out of the search area or changed size"""
+        height, width = frame.shape[:2]
+        x, y, w, h = cv.boundingRect(previous)
+        margin = int(self.track_margin * max(w, h))
+        x0, y0 = max(x - margin, 0), max(y - margin, 0)
+        x1, y1 = min(x + w + margin, width), min(y + h + margin, height)
+        try:
+            contour = detect_card_edge(frame[y0:y1, x0:x1], max_dim=self.max_dim)
+        except ValueError:
+            return None
+        cx, cy, cw, ch = cv.boundingRect(contour)
+        # touching a side of the search area that is not the frame edge means the card has moved past it
+        if (
+            (cx == 0 and x0 > 0)
+            or (cy == 0 and y0 > 0)
+            or (cx + cw == x1 - x0 and x1 < width)
+            or (cy + ch == y1 - y0 and y1 < height)
+        ):
+            return None
+        area_ratio = cv.contourArea(contour) / max(cv.contourArea(previous), 1.0)
+        if not 0.8 <= area_ratio <= 1.25:
+            return None
+        tracked: ct.MatLike = contour + np.array([x0, y0], dtype=contour.dtype)
+        return tracked
+
+    def _detect(self, frame: ct.MatLike) -> tuple[ct.MatLike | None, bool]:
+        """the card's contour, if there is one, and whether it was tracked from the last frame"""
+        if self._card.contour is not None:
+            contour = self._track(frame, self._card.contour)
+            if contour is not None:
+                self.stats.tracked += 1
+                return contour, True
+        self.stats.full_detections += 1
+        try:
+            contour = detect_card_edge(frame, max_dim=self.max_dim)
+        except ValueError:
+            return None, False
+        frame_area = frame.shape[0] * frame.shape[1]
+        card_fraction = cv.contourArea(contour) / frame_area
+        if not self.min_card_fraction <= card_fraction <= _MAX_CARD_FRACTION:
+            return None, False
+        return contour, False
+
+    def process(self, frame_index: int, frame: ct.MatLike) -> None:
+        """
+        Detect (or track) the card in a frame and identify it if it has been still for long enough,
+        called on the worker thread but usable directly to process frames synchronously
+        """
+        self.stats.processed += 1
+        contour, tracked = self._detect(frame)
+        if not tracked:
+            # lost track of the card, anything found is treated as a new card
+            self._card = _CardState()
+        if contour is None:
+            return
+
+        corners = fit_card_quad(contour)
+        card = self._card
+        if (
+            card.corners is not None
+            and np.abs(corners - card.corners).max() <= self.stable_tolerance
+        ):
+            card.stable_frames += 1
+        else:
+            card.stable_frames = 1
+        card.contour, card.corners = contour, corners
+
+        if (
+            self.identify is None
+            or card.identified
+            or card.stable_frames < self.stable_frames
+        ):
+            return
+        normalized = normalize_card(frame, contour, out=self._card_buffer)
+        self.identifications.put(
+            Identification(frame_index, corners.tolist(), self.identify(normalized))
+        )
+        card.identified = True
+        self.stats.identifications += 1
+
+
+def scan_video(
+    source: str | int, scanner: VideoScanner, realtime: bool = True
+) -> VideoScanStats:
+    """
+    Feed every frame of `source` to `scanner`, returning once the last frame has been processed
+
+    Args:
+        source (str | int): video file or capture device index
+        scanner (VideoScanner): scanner to feed, started and stopped here
+        realtime (bool, optional): read a video file at its frame rate, as a camera would deliver it,
+            instead of as fast as it decodes. Defaults to True.
+
+    Returns:
+        VideoScanStats: counts of frames processed, dropped and identified
+    """
+    capture = cv.VideoCapture(source)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video source {source!r}")
+    fps = capture.get(cv.CAP_PROP_FPS) or 30.0
+    # a capture device already delivers frames at its own rate
+    frame_interval = 1 / fps if realtime and isinstance(source, str) else 0.0
+    try:
+        with scanner:
+            next_frame_at = time.perf_counter()
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                scanner.submit(frame)
+                if frame_interval:
+                    next_frame_at += frame_interval
+                    time.sleep(max(next_frame_at - time.perf_counter(), 0.0))
+    finally:
+        capture.release()
+    return scanner.stats
+
+
+@dataclass
+class CliArgs:
+    source: str | int
+    index_dir: Path | None
+    stable_frames: int
+    realtime: bool
+
+    @classmethod
+    def parse_args(cls, argv: list[str] | None = None) -> Self:
+        parser = argparse.ArgumentParser(
+            description="Scans cards held up to a camera or in a video, writing each identification as a JSON line",
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        )
+        parser.add_argument(
+            "source",
+            type=str,
+            help="Video file, or the index of a capture device e.g. 0",
+        )
+        parser.add_argument(
+            "--index_dir",
+            type=Path,
+            default=None,
+            help="Perceptual hash index to identify cards with, cards are only tracked if not given",
+        )
+        parser.add_argument(
+            "--stable_frames",
+            type=int,
+            default=DEFAULT_STABLE_FRAMES,
+            help="Frames a card has to be held still for before it is identified",
+        )
+        parser.add_argument(
+            "--no_realtime",
+            action="store_true",
+            help="Read video files as fast as possible instead of at their frame rate",
+        )
+        args = parser.parse_args(argv)
+        return cls(
+            source=int(args.source) if args.source.isdigit() else args.source,
+            index_dir=args.index_dir,
+            stable_frames=args.stable_frames,
+            realtime=not args.no_realtime,
+        )
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = CliArgs.parse_args(argv)
+    logger.info("Args: %s", args)
+    index = PHashIndex.load(args.index_dir) if args.index_dir is not None else None
+    scanner = VideoScanner(
+        identify=index.query if index is not None else None,
+        stable_frames=args.stable_frames,
+    )
+
+    done = threading.Event()
+
+    def _print_identifications() -> None:
+        while not (done.is_set() and scanner.identifications.empty()):
+            try:
+                identification = scanner.identifications.get(timeout=0.1)
+            except Empty:
+                continue
+            sys.stdout.write(identification.to_json() + "\n")
+            sys.stdout.flush()
+
+    printer = threading.Thread(target=_print_identifications, daemon=True)
+    printer.start()
+    stats = scan_video(args.source, scanner, realtime=args.realtime)
+    done.set()
+    printer.join()
+    logger.info("Finished: %s", stats)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
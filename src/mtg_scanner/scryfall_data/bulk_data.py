@@ -1,15 +1,126 @@
 import json
+from collections.abc import Iterator
 from pathlib import Path
 
 from pydantic import TypeAdapter
 
 from mtg_scanner.scryfall_data.model import ScryfallCard
+from mtg_scanner.utils import batched
+
+DEFAULT_BULK_FILE = Path(__file__).parent / "bulk_data/bulk_data.json"
+# read size used when walking the bulk file, a single card entry is a few KB
+DEFAULT_CHUNK_SIZE = 64 * 1024
 
 
 def read_bulk_file(
-    file: Path = Path(__file__).parent / "bulk_data/bulk_data.json",
+    file: Path = DEFAULT_BULK_FILE,
 ) -> list[ScryfallCard]:
+    """
+    Read and validate the whole bulk file in one go.
+    NOTE: this holds the full file in memory, prefer `iter_bulk_file` for anything larger than `unique_artwork`
+    """
     with open(file, "r", encoding="utf-8") as f:
         data = json.load(f)
 
     return TypeAdapter(list[ScryfallCard]).validate_python(data)
+
+
+def iter_bulk_file_raw(
+    file: Path = DEFAULT_BULK_FILE,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[dict[str, object]]:
+    """
+    Walk the top level JSON array of a bulk file, yielding each entry as it is parsed.
+    Only the current chunk and the entry being decoded are held in memory.
+
+    Args:
+        file (Path, optional): path to the bulk data file. Defaults to DEFAULT_BULK_FILE.
+        chunk_size (int, optional): number of characters to read at a time. Defaults to DEFAULT_CHUNK_SIZE.
+
+    Raises:
+        ValueError: if the file is not a JSON array of objects
+
+    Yields:
+        dict[str, object]: raw entry from the bulk file
+    """
+    decoder = json.JSONDecoder()
+    with open(file, "r", encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def _fill() -> bool:
+            """read the next chunk into the buffer, dropping anything already consumed"""
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return True
+
+        def _next_token() -> str | None:
+            """advance past whitespace and return the next character without consuming it"""
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer):
+                    return buffer[pos]
+                if not _fill():
+                    return None
+
+        if _next_token() != "[":
+            raise ValueError(f"Expected {file} to contain a JSON array")
+        pos += 1
+
+        expect_separator = False
+        while True:
+            token = _next_token()
+            if token is None:
+                raise ValueError(f"Unexpected end of file in {file}")
+            if token == "]":
+                return
+            if expect_separator:
+                if token != ",":
+                    raise ValueError(f"Expected ',' at {pos} in {file}, got {token!r}")
+                pos += 1
+                _next_token()
+
+            while True:
+                try:
+                    entry, end = decoder.raw_decode(buffer, pos)
+                    break
+                except json.JSONDecodeError as err:
+                    # most likely the entry runs past the end of the buffer
+                    if eof or not _fill():
+                        raise ValueError(f"Malformed entry in {file}") from err
+
+            if not isinstance(entry, dict):
+                raise ValueError(f"Expected a JSON object in {file}, got {entry!r}")
+            pos = end
+            expect_separator = True
+            yield entry
+
+
+def iter_bulk_file(
+    file: Path = DEFAULT_BULK_FILE,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[ScryfallCard]:
+    """
+    Stream validated cards from the bulk file, see `iter_bulk_file_raw`
+    """
+    for entry in iter_bulk_file_raw(file, chunk_size):
+        yield ScryfallCard.model_validate(entry)
+
+
+def iter_bulk_file_batches(
+    file: Path = DEFAULT_BULK_FILE,
+    batch_size: int = 1000,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[list[ScryfallCard]]:
+    """
+    Stream validated cards from the bulk file in lists of up to `batch_size`
+    """
+    return batched(iter_bulk_file(file, chunk_size), batch_size)
@@ -0,0 +1,289 @@
+"""
+Bounded concurrency download scheduler used when pulling card images from Scryfall,
+and streaming of downloads straight to disk
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import aiofiles
+import aiofiles.os
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Scryfall asks for 50-100ms between requests: https://scryfall.com/docs/api#rate-limits-and-good-citizenship
+DEFAULT_REQUESTS_PER_SECOND = 10.0
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# statuses worth retrying, anything else in the 4xx range will fail the same way again
+_RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+@dataclass
+class DownloadJob:
+    """
+    A single file to download
+    """
+
+    key: str
+    uri: str
+    path: Path
+    # scryfall `image_status` of the card, used to spot improved scans of the same image
+    image_status: str | None = None
+
+
+@dataclass
+class DownloadError:
+    """
+    A download that failed after all retries
+    """
+
+    key: str
+    uri: str
+    error: str
+
+
+@dataclass
+class DownloadReport:
+    """
+    Summary of a scheduler run
+    """
+
+    downloaded: int = 0
+    skipped: int = 0
+    errors: list[DownloadError] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def completed(self) -> int:
+        return self.downloaded + self.skipped + len(self.errors)
+
+    @property
+    def throughput(self) -> float:
+        """downloads per second"""
+        return self.downloaded / self.elapsed if self.elapsed > 0 else 0.0
+
+
+@dataclass
+class StreamedFile:
+    """
+    A file written by `stream_response_to_file`
+    """
+
+    size: int
+    sha256: str
+
+
+class RateLimiter:
+    """
+    Spaces out calls to `wait` so at most `requests_per_second` pass per second
+    """
+
+    def __init__(self, requests_per_second: float) -> None:
+        if requests_per_second <= 0:
+            raise ValueError(
+                f"requests_per_second must be positive, got {requests_per_second}"
+            )
+        self.interval = 1 / requests_per_second
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def partial_path(path: Path) -> Path:
+    """
+    Where a download is written to before being moved into place
+    """
+    return path.with_name(f"{path.name}.part")
+
+
+async def stream_response_to_file(
+    response: aiohttp.ClientResponse,
+    path: Path,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> StreamedFile:
+    """
+    Write the body of `response` to `path` a chunk at a time, hashing it on the way.
+    The body goes to a `.part` file that is renamed over `path` once complete,
+    so `path` is either absent, the old version or the complete new one.
+
+    Args:
+        response (aiohttp.ClientResponse): response to read the body from
+        path (Path): final location of the file
+        chunk_size (int, optional): bytes to read and write at a time. Defaults to DEFAULT_CHUNK_SIZE.
+
+    Returns:
+        StreamedFile: size and checksum of the written file
+    """
+    tmp_path = partial_path(path)
+    written = 0
+    digest = hashlib.sha256()
+    try:
+        async with aiofiles.open(tmp_path, "wb") as file:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                await file.write(chunk)
+                digest.update(chunk)
+                written += len(chunk)
+        await aiofiles.os.replace(tmp_path, path)
+    except BaseException:
+        # covers cancellation too, a killed process can still leave a `.part` behind but never a truncated `path`
+        if await aiofiles.os.path.exists(tmp_path):
+            await aiofiles.os.remove(tmp_path)
+        raise
+    return StreamedFile(size=written, sha256=digest.hexdigest())
+
+
+def _is_retryable(err: BaseException) -> bool:
+    if isinstance(err, aiohttp.ClientResponseError):
+        return err.status in _RETRY_STATUSES
+    return isinstance(err, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+def _retry_after(err: BaseException) -> float | None:
+    """seconds to wait from a `Retry-After` header, if the server sent one"""
+    if not isinstance(err, aiohttp.ClientResponseError) or err.headers is None:
+        return None
+    value = err.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class DownloadScheduler:
+    """
+    Runs downloads through a fixed pool of workers so only `max_concurrency` requests are in flight,
+    each host is rate limited and failures are retried with exponential backoff.
+    Failures are collected on the report instead of stopping the run.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        progress_interval: float = 10.0,
+    ) -> None:
+        """
+        Args:
+            max_concurrency (int, optional): max downloads in flight. Defaults to DEFAULT_MAX_CONCURRENCY.
+            requests_per_second (float, optional): max requests per second to each host. Defaults to DEFAULT_REQUESTS_PER_SECOND.
+            max_retries (int, optional): retries after the first attempt. Defaults to DEFAULT_MAX_RETRIES.
+            backoff_base (float, optional): seconds to wait before the first retry, doubled each retry. Defaults to 0.5.
+            backoff_max (float, optional): cap on the wait between retries. Defaults to 30.0.
+            progress_interval (float, optional): seconds between progress log lines. Defaults to 10.0.
+        """
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be positive, got {max_concurrency}")
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.progress_interval = progress_interval
+        self._limiters: dict[str, RateLimiter] = {}
+
+    def _limiter(self, uri: str) -> RateLimiter:
+        host = urlsplit(uri).netloc
+        if host not in self._limiters:
+            self._limiters[host] = RateLimiter(self.requests_per_second)
+        return self._limiters[host]
+
+    async def _attempt(
+        self,
+        job: DownloadJob,
+        download: Callable[[DownloadJob], Awaitable[bool]],
+    ) -> bool:
+        attempt = 0
+        while True:
+            await self._limiter(job.uri).wait()
+            try:
+                return await download(job)
+            except Exception as err:
+                if attempt >= self.max_retries or not _is_retryable(err):
+                    raise
+                delay = _retry_after(err) or min(
+                    self.backoff_base * 2**attempt, self.backoff_max
+                )
+                attempt += 1
+                logger.debug(
+                    "Retry %d for %s in %.2fs: %r", attempt, job.uri, delay, err
+                )
+                await asyncio.sleep(delay)
+
+    async def run(
+        self,
+        jobs: Iterable[DownloadJob],
+        download: Callable[[DownloadJob], Awaitable[bool]],
+        total: int | None = None,
+        skip: Callable[[DownloadJob], Awaitable[bool]] | None = None,
+    ) -> DownloadReport:
+        """
+        Download every job, `jobs` is consumed lazily so it can be a generator over a large file
+
+        Args:
+            jobs (Iterable[DownloadJob]): files to download
+            download (Callable[[DownloadJob], Awaitable[bool]]): downloads a single job,
+                returns `False` if it was skipped e.g. already on disk
+            total (int | None, optional): number of jobs, only used for progress logging. Defaults to None.
+            skip (Callable[[DownloadJob], Awaitable[bool]] | None, optional): whether a job can be skipped
+                e.g. already on disk, checked before the job waits on the rate limiter
+                so skips don't use up request slots. Defaults to None.
+
+        Returns:
+            DownloadReport: counts, errors and timing of the run
+        """
+        report = DownloadReport()
+        job_iter = iter(jobs)
+        start = time.monotonic()
+        last_progress = start
+
+        def _log_progress() -> None:
+            elapsed = time.monotonic() - start
+            logger.info(
+                "%d/%s downloads complete (%d failed), %.1f/s",
+                report.completed,
+                total if total is not None else "?",
+                len(report.errors),
+                report.downloaded / elapsed if elapsed > 0 else 0.0,
+            )
+
+        async def _worker() -> None:
+            nonlocal last_progress
+            # workers share the iterator, safe as there is no await between checking and taking a job
+            for job in job_iter:
+                try:
+                    if skip is not None and await skip(job):
+                        report.skipped += 1
+                    elif await self._attempt(job, download):
+                        report.downloaded += 1
+                    else:
+                        report.skipped += 1
+                except Exception as err:
+                    logger.warning("Failed to download %s: %r", job.uri, err)
+                    report.errors.append(DownloadError(job.key, job.uri, repr(err)))
+                if time.monotonic() - last_progress >= self.progress_interval:
+                    last_progress = time.monotonic()
+                    _log_progress()
+
+        await asyncio.gather(*(_worker() for _ in range(self.max_concurrency)))
+        report.elapsed = time.monotonic() - start
+        _log_progress()
+        return report
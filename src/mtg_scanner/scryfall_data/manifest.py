@@ -0,0 +1,148 @@
+"""
+Persistent record of the images pulled from Scryfall, so an interrupted pull can resume
+and later pulls only fetch images that changed
+"""
+
+import hashlib
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Self, TextIO
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE_NAME = "manifest.jsonl"
+
+
+@dataclass
+class ManifestEntry:
+    """
+    A fully downloaded image
+    """
+
+    scryfall_id: str
+    uri: str
+    size: int
+    sha256: str
+    fetched_at: str
+    image_status: str | None = None
+
+
+class DownloadManifest:
+    """
+    Append only JSON lines file of `ManifestEntry`, the last entry for an id wins.
+    An entry is only written after its image has been moved into place,
+    so an image without an entry is treated as never downloaded.
+    """
+
+    def __init__(self, path: Path, entries: dict[str, ManifestEntry]) -> None:
+        self.path = path
+        self._entries = entries
+        self._file: TextIO | None = None
+
+    @classmethod
+    def load(cls, path: Path) -> Self:
+        """
+        Read the manifest at `path` (if any) and rewrite it with only the latest entry per image
+
+        Args:
+            path (Path): manifest file
+
+        Returns:
+            Self: the loaded manifest
+        """
+        entries: dict[str, ManifestEntry] = {}
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as file:
+                for line_no, line in enumerate(file, 1):
+                    try:
+                        entry = ManifestEntry(**json.loads(line))
+                    except (json.JSONDecodeError, TypeError):
+                        # most likely the last line of a killed run
+                        logger.warning(
+                            "Skipping bad manifest line %s:%d", path, line_no
+                        )
+                        continue
+                    entries[entry.scryfall_id] = entry
+            logger.info("Loaded %d entries from %s", len(entries), path)
+        manifest = cls(path, entries)
+        manifest._compact()
+        return manifest
+
+    def _compact(self) -> None:
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            for entry in self._entries.values():
+                file.write(json.dumps(asdict(entry)) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, scryfall_id: str) -> ManifestEntry | None:
+        return self._entries.get(scryfall_id)
+
+    def is_current(
+        self,
+        scryfall_id: str,
+        uri: str,
+        image_status: str | None,
+        img_path: Path,
+    ) -> bool:
+        """
+        Whether the image on disk is a complete, uncorrupted copy of `uri`.
+        Scryfall image uris carry a timestamp query param that changes with the art,
+        and `image_status` changes when a low res scan is replaced.
+        NOTE: reads the whole image to check its hash
+        """
+        entry = self._entries.get(scryfall_id)
+        if entry is None or entry.uri != uri or entry.image_status != image_status:
+            return False
+        try:
+            if img_path.stat().st_size != entry.size:
+                return False
+            with open(img_path, "rb") as file:
+                return hashlib.file_digest(file, "sha256").hexdigest() == entry.sha256
+        except FileNotFoundError:
+            return False
+
+    def record(
+        self,
+        scryfall_id: str,
+        uri: str,
+        size: int,
+        sha256: str,
+        image_status: str | None = None,
+    ) -> ManifestEntry:
+        """
+        Append an entry for a completed download, flushed straight away so it survives the process being killed
+        """
+        entry = ManifestEntry(
+            scryfall_id=scryfall_id,
+            uri=uri,
+            size=size,
+            sha256=sha256,
+            fetched_at=datetime.now(timezone.utc).isoformat(),
+            image_status=image_status,
+        )
+        self._entries[scryfall_id] = entry
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(asdict(entry)) + "\n")
+        self._file.flush()
+        return entry
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
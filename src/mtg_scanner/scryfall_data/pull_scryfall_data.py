@@ -2,16 +2,29 @@ import argparse
 import asyncio
 import json
 import logging
-from collections.abc import Coroutine
+from collections.abc import Iterable, Iterator, Sized
 from dataclasses import dataclass
 from enum import Enum
 from pathlib import Path
-from typing import Self, TypeGuard
+from typing import Self
 
 import aiofiles
 import aiofiles.os
 import aiohttp
 
+from mtg_scanner.scryfall_data import bulk_data
+from mtg_scanner.scryfall_data.downloader import (
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_REQUESTS_PER_SECOND,
+    DownloadError,
+    DownloadJob,
+    DownloadReport,
+    DownloadScheduler,
+    StreamedFile,
+    stream_response_to_file,
+)
+from mtg_scanner.scryfall_data.manifest import MANIFEST_FILE_NAME, DownloadManifest
+
 logger = logging.getLogger(__name__)
 
 
@@ -39,6 +52,8 @@ class CliArgs:
     bulk_data_type: BulkDataType
     image_pull_limit: int
     overwrite_existing_images: bool
+    max_concurrency: int
+    requests_per_second: float
 
     @classmethod
     def parse_args(cls) -> Self:
@@ -49,7 +64,7 @@ class CliArgs:
         parser.add_argument(
             "--bulk_data_path",
             type=Path,
-            default=Path(__file__).parent / "bulk_data" / "bulk_data.json",
+            default=bulk_data.DEFAULT_BULK_FILE,
             help="Path to save the bulk data file",
         )
         parser.add_argument(
@@ -76,6 +91,18 @@ class CliArgs:
             default=None,
             help="Limit on the number of images to pull",
         )
+        parser.add_argument(
+            "--max_concurrency",
+            type=int,
+            default=DEFAULT_MAX_CONCURRENCY,
+            help="Max number of image downloads in flight",
+        )
+        parser.add_argument(
+            "--requests_per_second",
+            type=float,
+            default=DEFAULT_REQUESTS_PER_SECOND,
+            help="Max requests per second to each host",
+        )
 
         args = parser.parse_args()
 
@@ -85,41 +112,27 @@ class CliArgs:
             bulk_data_type=BulkDataType(args.bulk_data_type),
             image_pull_limit=args.image_pull_limit,
             overwrite_existing_images=args.overwrite_existing_images,
+            max_concurrency=args.max_concurrency,
+            requests_per_second=args.requests_per_second,
         )
 
 
-def _is_list_dict_str(obj: object) -> TypeGuard[list[dict[str, object]]]:
-    if not isinstance(obj, list):
-        return False
-    for item in obj:
-        if not isinstance(item, dict):
-            return False
-        for key, val in item.items():
-            if not isinstance(key, str):
-                return False
-            if not isinstance(val, object):
-                return False
-
-    return True
-
-
 class ScryfallApiClient:
     def __init__(self, http_session: aiohttp.ClientSession) -> None:
         self.session = http_session
         self.base_url = "https://api.scryfall.com"
 
-    async def get_bulk_data(self, type_: BulkDataType) -> list[dict[str, object]]:
+    async def get_bulk_data_info(self, type_: BulkDataType) -> dict[str, object]:
         """
-        Collects the latest bulk data for the given type
+        Collects the bulk data entry for the given type, this includes the `updated_at` and `download_uri` of the file
         Api Docs: https://scryfall.com/docs/api/bulk-data
 
         Args:
-            type_ (BulkDataType): type of bulk data to pull
+            type_ (BulkDataType): type of bulk data to look up
 
         Returns:
-            dict[str, object]: Contents of the bulk data file
+            dict[str, object]: bulk data entry
         """
-
         logger.info("Getting latest bulk data link")
         async with self.session.get(f"{self.base_url}/bulk-data") as response:
             response.raise_for_status()
@@ -127,41 +140,85 @@ class ScryfallApiClient:
             assert isinstance(resp_dict, dict)
             resp_data = resp_dict["data"]
 
-            for entry in resp_data:
-                if entry["type"] == type_.value:
-                    bulk_data_url = entry["download_uri"]
-                    break
-        logger.info("Downloading bulk data")
-        async with self.session.get(bulk_data_url) as response:
+        for entry in resp_data:
+            if entry["type"] == type_.value:
+                assert isinstance(entry, dict)
+                return entry
+        raise KeyError(f"No bulk data entry found for {type_}")
+
+    async def download_bulk_data(
+        self,
+        type_: BulkDataType,
+        path: Path,
+        info: dict[str, object] | None = None,
+    ) -> int:
+        """
+        Streams the latest bulk data for the given type to `path`
+        Api Docs: https://scryfall.com/docs/api/bulk-data
+
+        Args:
+            type_ (BulkDataType): type of bulk data to pull
+            path (Path): path to save the bulk data file to
+            info (dict[str, object] | None, optional): bulk data entry if already looked up. Defaults to None.
+
+        Returns:
+            int: size of the saved file in bytes
+        """
+        if info is None:
+            info = await self.get_bulk_data_info(type_)
+        bulk_data_url = info["download_uri"]
+        assert isinstance(bulk_data_url, str)
+
+        logger.info("Downloading bulk data to %s", path)
+        await aiofiles.os.makedirs(path.parent, exist_ok=True)
+        async with self.session.get(
+            bulk_data_url,
+            # the larger bulk files take longer than the default 5 minute total timeout
+            timeout=aiohttp.ClientTimeout(total=None, sock_read=60),
+        ) as response:
             response.raise_for_status()
-            resp_dict = await response.json()
-            assert _is_list_dict_str(resp_dict)
+            streamed = await stream_response_to_file(response, path)
+        logger.info("Bulk data saved, %d bytes", streamed.size)
+        return streamed.size
 
-            return resp_dict
 
+def bulk_metadata_path(bulk_data_path: Path) -> Path:
+    """
+    Path of the file recording which version of the bulk data is saved at `bulk_data_path`
+    """
+    return bulk_data_path.with_suffix(".meta.json")
 
-async def save_bulk_data(bulk_data: list[dict[str, object]], path: Path) -> None:
-    logger.info("Saving bulk data to %s", path)
-    await aiofiles.os.makedirs(path.parent, exist_ok=True)
-    async with aiofiles.open(path, "w") as file:
-        # NOTE: this json.dumps not massively efficient, may need to be changed for larger files
-        string = json.dumps(bulk_data)
-        await file.write(string)
-    logger.info("Bulk data saved")
 
+async def is_bulk_data_current(info: dict[str, object], bulk_data_path: Path) -> bool:
+    """
+    Whether the saved bulk data file matches the `updated_at` of the given bulk data entry
+    """
+    metadata_path = bulk_metadata_path(bulk_data_path)
+    if not (
+        await aiofiles.os.path.exists(bulk_data_path)
+        and await aiofiles.os.path.exists(metadata_path)
+    ):
+        return False
+    async with aiofiles.open(metadata_path, "r") as file:
+        saved = json.loads(await file.read())
+    return bool(saved.get("updated_at") == info["updated_at"])
 
-async def save_image_data(
-    image_data: list[dict[str, object]],
-    out_dir: Path,
-    http_session: aiohttp.ClientSession,
-    overwrite_existing: bool = False,
-    limit: int | None = None,
-    image_size: ImageType = ImageType.SMALL,
-) -> None:
 
-    await aiofiles.os.makedirs(out_dir, exist_ok=True)
+async def save_bulk_metadata(info: dict[str, object], bulk_data_path: Path) -> None:
+    async with aiofiles.open(bulk_metadata_path(bulk_data_path), "w") as file:
+        await file.write(json.dumps(info))
 
-    tasks: list[Coroutine[object, object, object]] = []
+
+def _image_jobs(
+    image_data: Iterable[dict[str, object]],
+    out_dir: Path,
+    limit: int | None,
+    image_size: ImageType,
+    errors: list[DownloadError],
+) -> Iterator[DownloadJob]:
+    """
+    A download job per card, cards without an image uri are added to `errors` instead
+    """
     for i, item in enumerate(image_data, 1):
         if limit is not None and i > limit:
             logger.info("Image pull limit of %d reached", i)
@@ -180,18 +237,110 @@ async def save_image_data(
                 image_uri = item["card_faces"][0]["image_uris"][image_size.value]  # type: ignore
             else:
                 image_uri = item["image_uris"][image_size.value]  # type: ignore
-        except KeyError as err:
-            raise KeyError(
-                f"Error getting image uri for {scryfall_id} with {card_layout=}. {item=}"
-            ) from err
+        except KeyError:
+            logger.warning(
+                "Error getting image uri for %s with %s, skipping. item=%s",
+                scryfall_id,
+                f"{card_layout=}",
+                item,
+            )
+            errors.append(
+                DownloadError(
+                    scryfall_id,
+                    "",
+                    f"no {image_size.value} image uri for {card_layout=}",
+                )
+            )
+            continue
 
         assert isinstance(image_uri, str)
-        img_path = out_dir / f"{scryfall_id}.jpg"
-        tasks.append(
-            download_and_save(http_session, image_uri, img_path, overwrite_existing)
+        image_status = item.get("image_status")
+        yield DownloadJob(
+            key=scryfall_id,
+            uri=image_uri,
+            path=out_dir / f"{scryfall_id}.jpg",
+            image_status=image_status if isinstance(image_status, str) else None,
+        )
+
+
+async def save_image_data(
+    image_data: Iterable[dict[str, object]],
+    out_dir: Path,
+    http_session: aiohttp.ClientSession,
+    overwrite_existing: bool = False,
+    limit: int | None = None,
+    image_size: ImageType = ImageType.SMALL,
+    scheduler: DownloadScheduler | None = None,
+    manifest: DownloadManifest | None = None,
+) -> DownloadReport:
+    """
+    Download the image of each card in `image_data` to `out_dir` as `<scryfall_id>.jpg`
+
+    Args:
+        image_data (Iterable[dict[str, object]]): bulk data entries
+        out_dir (Path): directory to save the images to
+        http_session (aiohttp.ClientSession): session to download with
+        overwrite_existing (bool, optional): re-download images already on disk. Defaults to False.
+        limit (int | None, optional): max number of entries to consider, `None`=`No Limit`. Defaults to None.
+        image_size (ImageType, optional): which scryfall image to pull. Defaults to ImageType.SMALL.
+        scheduler (DownloadScheduler | None, optional): controls concurrency, rate limits and retries. Defaults to DownloadScheduler().
+        manifest (DownloadManifest | None, optional): record of completed downloads, when given an image is only
+            skipped if the manifest shows a complete copy of the same uri rather than just the file existing. Defaults to None.
+
+    Returns:
+        DownloadReport: counts and per image errors of the run
+    """
+    await aiofiles.os.makedirs(out_dir, exist_ok=True)
+    scheduler = scheduler or DownloadScheduler()
+
+    async def _download(job: DownloadJob) -> bool:
+        if manifest is None:
+            return await download_and_save(
+                http_session, job.uri, job.path, overwrite_existing
+            )
+        streamed = await download_file(http_session, job.uri, job.path)
+        manifest.record(
+            job.key, job.uri, streamed.size, streamed.sha256, job.image_status
         )
+        return True
+
+    async def _skip(job: DownloadJob) -> bool:
+        if overwrite_existing:
+            return False
+        if manifest is None:
+            if await aiofiles.os.path.exists(job.path):
+                logger.debug("%s already exists, skipping", job.path)
+                return True
+            return False
+        # hashes the image, kept off the event loop
+        if await asyncio.to_thread(
+            manifest.is_current, job.key, job.uri, job.image_status, job.path
+        ):
+            logger.debug("%s is up to date, skipping", job.path)
+            return True
+        return False
 
-    await asyncio.gather(*tasks)
+    missing_uris: list[DownloadError] = []
+    report = await scheduler.run(
+        _image_jobs(image_data, out_dir, limit, image_size, missing_uris),
+        _download,
+        total=(
+            len(image_data)
+            if isinstance(image_data, Sized) and limit is None
+            else limit
+        ),
+        skip=_skip,
+    )
+    report.errors.extend(missing_uris)
+    logger.info(
+        "Images downloaded: %d, skipped: %d, failed: %d in %.1fs (%.1f/s)",
+        report.downloaded,
+        report.skipped,
+        len(report.errors),
+        report.elapsed,
+        report.throughput,
+    )
+    return report
 
 
 async def download_and_save(
@@ -199,59 +348,94 @@ async def download_and_save(
     image_uri: str,
     img_path: Path,
     overwrite: bool,
-) -> None:
+) -> bool:
+    """
+    Download a single image
+
+    Returns:
+        bool: `False` if the image already existed and was skipped
+    """
     # if the file exists and not overwriting, skip
     if overwrite is False and await aiofiles.os.path.exists(img_path):
         logger.debug("%s already exists, skipping", img_path)
-        return
+        return False
+
+    await download_file(http_session, image_uri, img_path)
+    return True
 
-    # download and write the file
-    logger.debug("Downloading %s", image_uri)
-    async with http_session.get(image_uri) as response:
+
+async def download_file(
+    http_session: aiohttp.ClientSession, uri: str, path: Path
+) -> StreamedFile:
+    """
+    Download `uri` to `path`, see `stream_response_to_file`
+    """
+    logger.debug("Downloading %s", uri)
+    async with http_session.get(uri) as response:
         response.raise_for_status()
-        img_bytes = response.read()
-        async with aiofiles.open(img_path, "wb") as f:
-            await f.write(await img_bytes)
+        return await stream_response_to_file(response, path)
 
 
 async def pull_scryfall_data(
     image_data_dir: Path = Path(__file__).parent / "image_data",
-    bulk_data_dir: Path = Path(__file__).parent / "bulk_data",
+    bulk_data_path: Path = bulk_data.DEFAULT_BULK_FILE,
     overwrite_existing_images: bool = False,
     image_pull_limit: int | None = None,
-) -> None:
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+) -> DownloadReport:
     """
     Pulls data from scryfall and saves it to the given directories
 
     Args:
         image_data_dir (Path, optional): path to save scryfall card images to. Defaults to Path(__file__).parent/"image_data".
-        bulk_data_dir (Path, optional): path to save bulk card data to. Defaults to Path(__file__).parent/"bulk_data".
+        bulk_data_path (Path, optional): path to save bulk card data to. Defaults to bulk_data.DEFAULT_BULK_FILE.
         overwrite_existing_images (bool, optional): Whether to overwrite any existing images for cards already pulled. Defaults to False.
         image_pull_limit (int | None, optional): Max number of images to pull, `None`=`No Limit`. Defaults to None.
+        max_concurrency (int, optional): Max image downloads in flight. Defaults to DEFAULT_MAX_CONCURRENCY.
+        requests_per_second (float, optional): Max requests per second to each host. Defaults to DEFAULT_REQUESTS_PER_SECOND.
+
+    Returns:
+        DownloadReport: result of the image pull
     """
-    tasks: list[Coroutine[object, object, object]] = []
     # NOTE: certain headers are required by scryfall: https://scryfall.com/docs/api
     async with aiohttp.ClientSession(
         headers={
             "User-Agent": "mtg_scanner",
             "Accept": "*/*",
-        }
+        },
+        # pool only as many connections as there are downloads in flight
+        connector=aiohttp.TCPConnector(limit=max_concurrency),
     ) as session:
         client = ScryfallApiClient(session)
-        bulk_data = await client.get_bulk_data(BulkDataType.UNIQUE_ARTWORK)
-        tasks.append(save_bulk_data(bulk_data, bulk_data_dir))
-
-        tasks.append(
-            save_image_data(
-                bulk_data,
+        bulk_info = await client.get_bulk_data_info(BulkDataType.UNIQUE_ARTWORK)
+        if await is_bulk_data_current(bulk_info, bulk_data_path):
+            logger.info(
+                "Bulk data unchanged since %s, using saved copy",
+                bulk_info["updated_at"],
+            )
+        else:
+            await client.download_bulk_data(
+                BulkDataType.UNIQUE_ARTWORK, bulk_data_path, bulk_info
+            )
+            # only recorded once the file is saved so a failed save is retried next run
+            await save_bulk_metadata(bulk_info, bulk_data_path)
+
+        # the manifest lets an interrupted pull resume and skips images that have not changed
+        with DownloadManifest.load(image_data_dir / MANIFEST_FILE_NAME) as manifest:
+            return await save_image_data(
+                # NOTE: parsing is sync, but each entry is small enough not to block the loop for long
+                bulk_data.iter_bulk_file_raw(bulk_data_path),
                 image_data_dir,
                 session,
                 overwrite_existing_images,
                 image_pull_limit,
+                scheduler=DownloadScheduler(
+                    max_concurrency=max_concurrency,
+                    requests_per_second=requests_per_second,
+                ),
+                manifest=manifest,
             )
-        )
-
-        await asyncio.gather(*tasks)
 
 
 async def main() -> int:
@@ -262,16 +446,22 @@ async def main() -> int:
     args = CliArgs.parse_args()
     logger.info("Args: %s", args)
 
-    await pull_scryfall_data(
+    report = await pull_scryfall_data(
         image_data_dir=args.image_data_dir,
-        bulk_data_dir=args.bulk_data_path,
+        bulk_data_path=args.bulk_data_path,
         overwrite_existing_images=args.overwrite_existing_images,
         image_pull_limit=args.image_pull_limit,
+        max_concurrency=args.max_concurrency,
+        requests_per_second=args.requests_per_second,
     )
 
     logger.info("Finished")
+    for error in report.errors:
+        logger.error(
+            "Failed to download %s (%s): %s", error.key, error.uri, error.error
+        )
 
-    return 0
+    return 1 if report.errors else 0
 
 
 if __name__ == "__main__":
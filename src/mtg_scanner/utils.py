@@ -0,0 +1,21 @@
+"""
+Small helpers shared across the package, kept free of heavy imports
+"""
+
+from collections.abc import Iterable, Iterator
+from itertools import islice
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+def batched(items: Iterable[T], batch_size: int) -> Iterator[list[T]]:
+    """
+    `items` in lists of `batch_size`, the last one may be shorter.
+    Like `itertools.batched` but yielding lists
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+    iterator = iter(items)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
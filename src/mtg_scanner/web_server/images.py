@@ -0,0 +1,204 @@
+"""
+Serves the pulled Scryfall card images, full size or as thumbnails with `?w=<width>`.
+Thumbnails are made on first request and kept in a size bounded on disk LRU cache.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import anyio
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+logger = logging.getLogger(__name__)
+
+# requested widths are rounded up to one of these so clients share thumbnails
+THUMBNAIL_WIDTHS = (64, 128, 256)
+DEFAULT_THUMBNAIL_CACHE_BYTES = 256 * 1024 * 1024
+# a card's image only changes if it's pulled again, after this clients revalidate with the ETag
+CACHE_CONTROL = "public, max-age=2592000"
+_JPEG_QUALITY = 85
+
+
+def thumbnail_width(width: int) -> int:
+    """
+    The smallest thumbnail width at least `width`, or the largest there is
+
+    Usage:
+        ```python
+        thumbnail_width(100) -> 128
+        thumbnail_width(1000) -> 256
+        ```
+    """
+    return next((w for w in THUMBNAIL_WIDTHS if w >= width), THUMBNAIL_WIDTHS[-1])
+
+
+def _stat(path: Path) -> os.stat_result | None:
+    try:
+        return path.stat()
+    except FileNotFoundError:
+        return None
+
+
+class ThumbnailCache:
+    """
+    Thumbnails under `cache_dir/<width>/`, the least recently used are deleted once they total over `max_bytes`.
+    A thumbnail's modified time is set to its source's, so its ETag and Last-Modified outlive eviction
+    and a changed source is noticed.
+    """
+
+    def __init__(
+        self, cache_dir: Path, max_bytes: int = DEFAULT_THUMBNAIL_CACHE_BYTES
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # least recently used first
+        self._sizes: OrderedDict[Path, int] | None = None
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def _entries(self) -> OrderedDict[Path, int]:
+        # thumbnails left by a previous run, oldest made first
+        if self._sizes is None:
+            paths = [
+                path
+                for path in self.cache_dir.glob("*/**/*")
+                if path.is_file() and not path.name.startswith(".")
+            ]
+            stats = {path: path.stat() for path in paths}
+            self._sizes = OrderedDict(
+                (path, stats[path].st_size)
+                for path in sorted(paths, key=lambda path: stats[path].st_ctime)
+            )
+            self._total_bytes = sum(self._sizes.values())
+        return self._sizes
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            self._entries()
+            return self._total_bytes
+
+    def get(self, source: Path, key: str, width: int) -> tuple[Path, os.stat_result]:
+        """
+        Path of the thumbnail of `source`, made if it isn't cached or `source` has changed.
+        It's stat'ed under the same lock as eviction, so the result is never of a file another request deleted.
+
+        Args:
+            source (Path): full size image
+            key (str): name of `source` unique among the cached images e.g. its path in the image dir
+            width (int): thumbnail width, see `thumbnail_width`
+
+        Raises:
+            ValueError: if `source` can't be decoded
+
+        Returns:
+            tuple[Path, os.stat_result]: the thumbnail, at most `width` wide, and its stat
+        """
+        path = self.cache_dir / str(width) / key
+        source_mtime = source.stat().st_mtime_ns
+        with self._lock:
+            entries = self._entries()
+            if path in entries:
+                stat_result = _stat(path)
+                if stat_result is not None and stat_result.st_mtime_ns == source_mtime:
+                    entries.move_to_end(path)
+                    return path, stat_result
+                # forgotten before it's remade, evicting it would delete the new file
+                self._total_bytes -= entries.pop(path)
+        size = self._make(source, path, width, source_mtime)
+        with self._lock:
+            entries = self._entries()
+            self._total_bytes += size - entries.pop(path, 0)
+            entries[path] = size
+            self._evict()
+            return path, path.stat()
+
+    def _make(self, source: Path, path: Path, width: int, mtime_ns: int) -> int:
+        # OpenCV takes a while to import, and isn't needed until the first thumbnail
+        import cv2 as cv
+
+        img = cv.imread(str(source))
+        if img is None:
+            raise ValueError(f"Could not decode {source}")
+        height, source_width = img.shape[:2]
+        if source_width > width:
+            size = (width, max(round(height * width / source_width), 1))
+            img = cv.resize(img, size, interpolation=cv.INTER_AREA)
+        ok, encoded = cv.imencode(".jpg", img, [cv.IMWRITE_JPEG_QUALITY, _JPEG_QUALITY])
+        if not ok:
+            raise ValueError(f"Could not encode a thumbnail of {source}")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # written alongside and renamed so a request never reads half a file
+        tmp_path = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(encoded.tobytes())
+        os.utime(tmp_path, ns=(mtime_ns, mtime_ns))
+        tmp_path.replace(path)
+        return len(encoded)
+
+    def _evict(self) -> None:
+        entries = self._entries()
+        # the most recent thumbnail is kept even if it's over `max_bytes` alone, it's about to be served
+        while self._total_bytes > self.max_bytes and len(entries) > 1:
+            path, size = entries.popitem(last=False)
+            path.unlink(missing_ok=True)
+            self._total_bytes -= size
+            logger.debug("Evicted thumbnail %s", path)
+
+
+class CardImageFiles(StaticFiles):
+    """
+    `StaticFiles` for the card images, adds `?w=<width>` for a thumbnail and a long `Cache-Control`.
+    ETags, Last-Modified and conditional requests are handled by `StaticFiles`.
+    """
+
+    def __init__(
+        self, *, directory: Path, thumbnails: ThumbnailCache, check_dir: bool = True
+    ) -> None:
+        super().__init__(directory=directory, check_dir=check_dir)
+        self.thumbnails = thumbnails
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        width = self._requested_width(scope)
+        if width is None:
+            response = await super().get_response(path, scope)
+        else:
+            response = await self._thumbnail_response(path, width, scope)
+        if response.status_code in (200, 304):
+            response.headers["cache-control"] = CACHE_CONTROL
+        return response
+
+    @staticmethod
+    def _requested_width(scope: Scope) -> int | None:
+        widths = parse_qs(scope.get("query_string", b"").decode()).get("w")
+        if not widths:
+            return None
+        try:
+            width = int(widths[0])
+        except ValueError as err:
+            raise HTTPException(status_code=400, detail="w must be a number") from err
+        if width <= 0:
+            raise HTTPException(status_code=400, detail="w must be positive")
+        return thumbnail_width(width)
+
+    async def _thumbnail_response(
+        self, path: str, width: int, scope: Scope
+    ) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+        full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+        if stat_result is None or not os.path.isfile(full_path):
+            raise HTTPException(status_code=404)
+        try:
+            thumbnail, thumbnail_stat = await anyio.to_thread.run_sync(
+                self.thumbnails.get, Path(full_path), path, width
+            )
+        except ValueError as err:
+            raise HTTPException(status_code=404, detail=str(err)) from err
+        return self.file_response(thumbnail, thumbnail_stat, scope)
@@ -1,24 +1,46 @@
+import asyncio
+import functools
 import logging.config
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, AsyncIterator, Sequence
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from fastapi import Depends, FastAPI, Request
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 
 import mtg_scanner.db as db
 import mtg_scanner.db.models as db_models
 import mtg_scanner.env as env
-from mtg_scanner.db.sync_scryfall_data import populate_cards_from_scryfall_data
-from mtg_scanner.scryfall_data import bulk_data
+from mtg_scanner.db.card_search import search_cards_query
+from mtg_scanner.scanner.scan_pool import ScanPool
 from mtg_scanner.web_server import logger
+from mtg_scanner.web_server.images import CardImageFiles, ThumbnailCache
+from mtg_scanner.web_server.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    CardCursor,
+    card_list_query,
+    paginate_cards_async,
+)
+from mtg_scanner.web_server.response_cache import ResponseCache
+from mtg_scanner.web_server.sync_job import (
+    JobState,
+    SyncAlreadyRunning,
+    SyncJob,
+    SyncJobRunner,
+)
+from mtg_scanner.web_server.uploads import read_uploads
 
-env.export_dot_env()
-DB_URL = env.get_db_url()
+if TYPE_CHECKING:
+    from mtg_scanner.db.card_snapshot import CardSnapshot
 
 SRC_ROOT_DIR = Path(__file__).parent
 STATIC_DIR = SRC_ROOT_DIR / "static"
@@ -28,33 +50,155 @@ SCRYFALL_BULK_DATA_PATH = SCRYFALL_DATA_DIR / "bulk_data" / "bulk_data.json"
 
 SCRYFALL_IMAGE_DIR = SCRYFALL_DATA_DIR / "image_data"
 
-engine = create_engine(
-    DB_URL,
-    connect_args={
-        # only for SQLite (see:https://fastapi.tiangolo.com/tutorial/sql-databases/#create-the-sqlalchemy-engine)
-        "check_same_thread": False
-    },
-)
-SessionLocal = sessionmaker(autoflush=False, autocommit=False, bind=engine)
+PHASH_INDEX_DIR = SCRYFALL_DATA_DIR / "phash_index"
 
+CARD_SNAPSHOT_DIR = SCRYFALL_DATA_DIR / "card_snapshot"
 
-def get_db() -> Generator[db.OrmSession, None, None]:
-    db = SessionLocal()
-    try:
+THUMBNAIL_CACHE_DIR = SCRYFALL_DATA_DIR / "thumbnail_cache"
+# the card list shows images 50px tall, ~36px wide
+CARD_LIST_THUMBNAIL_WIDTH = 64
+
+# a phone photo is a few MB
+MAX_SCAN_FILES = 10
+MAX_SCAN_FILE_BYTES = 20 * 1024 * 1024
+
+DOT_ENV_PATH = Path("./.env")
+
+
+@dataclass
+class AppResources:
+    """
+    Everything the routes share, made when the app starts rather than on import
+    """
+
+    async_engine: AsyncEngine
+    session_factory: async_sessionmaker[db.AsyncOrmSession]
+    response_cache: ResponseCache
+    sync_jobs: SyncJobRunner
+    scan_pool: ScanPool
+    # where syncs export the card snapshot
+    snapshot_dir: Path
+    _card_snapshot: "CardSnapshot | None" = field(default=None, init=False)
+    # unset until the snapshot is first used, and again after a sync exports a new one
+    _card_snapshot_loaded: bool = field(default=False, init=False)
+
+    @classmethod
+    def create(cls, db_url: str) -> "AppResources":
+        # the routes are all `async def`, aiosqlite runs each connection on its own thread
+        # so a query doesn't block the event loop
+        async_engine = create_async_engine(db.async_db_url(db_url))
+        resources = cls(
+            async_engine=async_engine,
+            session_factory=async_sessionmaker(
+                async_engine, autoflush=False, expire_on_commit=False
+            ),
+            # the card routes only change when a sync writes to the db
+            response_cache=ResponseCache(),
+            # the sync writes from its own process with its own engine
+            sync_jobs=SyncJobRunner(
+                db_url,
+                SCRYFALL_BULK_DATA_PATH,
+                SCRYFALL_IMAGE_DIR,
+                snapshot_dir=CARD_SNAPSHOT_DIR,
+            ),
+            # scans are CPU bound, in the server they would hold up every other request
+            scan_pool=ScanPool(PHASH_INDEX_DIR),
+            snapshot_dir=CARD_SNAPSHOT_DIR,
+        )
+        resources.sync_jobs.on_update = resources.on_sync_update
+        return resources
+
+    def card_snapshot(self) -> "CardSnapshot | None":
+        """
+        The exported card snapshot, `None` if there isn't one.
+        Loaded on first use, numpy isn't needed until then.
+        """
+        if not self._card_snapshot_loaded:
+            from mtg_scanner.db.card_snapshot import load_snapshot
+
+            self._card_snapshot = load_snapshot(self.snapshot_dir)
+            self._card_snapshot_loaded = True
+        return self._card_snapshot
+
+    def on_sync_update(self, job: SyncJob) -> None:
+        self.response_cache.clear()
+        if job.state is JobState.SUCCEEDED:
+            # the sync exported a new snapshot, the old one stays mapped until this is next used
+            self._card_snapshot_loaded = False
+
+    async def close(self) -> None:
+        self.scan_pool.shutdown()
+        await self.async_engine.dispose()
+
+
+def _resources(request: Request) -> AppResources:
+    resources: AppResources = request.app.state.resources
+    return resources
+
+
+async def get_db(request: Request) -> AsyncGenerator[db.AsyncOrmSession, None]:
+    async with _resources(request).session_factory() as db:
         yield db
-    finally:
-        db.close()
 
 
-app = FastAPI()
+def get_response_cache(request: Request) -> ResponseCache:
+    return _resources(request).response_cache
+
+
+def get_sync_jobs(request: Request) -> SyncJobRunner:
+    return _resources(request).sync_jobs
+
+
+def get_scan_pool(request: Request) -> ScanPool:
+    return _resources(request).scan_pool
 
-app.mount(
-    "/static",
-    StaticFiles(directory=STATIC_DIR, check_dir=True),
-    name="static",
-)
 
-app.mount("/images", StaticFiles(directory=SCRYFALL_IMAGE_DIR), name="images")
+def create_app(db_url: str | None = None) -> FastAPI:
+    """
+    The web app, nothing is read or connected to until it starts
+
+    Args:
+        db_url (str | None, optional): db to serve, read from `DB_URL` when the app starts if not given,
+            after exporting `.env` if there is one. Defaults to None.
+
+    Returns:
+        FastAPI: the app
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        url = db_url
+        if url is None:
+            if DOT_ENV_PATH.exists():
+                env.export_dot_env(DOT_ENV_PATH)
+            url = env.get_db_url()
+        app.state.resources = AppResources.create(url)
+        try:
+            yield
+        finally:
+            await app.state.resources.close()
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(router)
+    app.mount(
+        "/static",
+        StaticFiles(directory=STATIC_DIR, check_dir=True),
+        name="static",
+    )
+    # the image dir only exists once images have been pulled
+    app.mount(
+        "/images",
+        CardImageFiles(
+            directory=SCRYFALL_IMAGE_DIR,
+            thumbnails=ThumbnailCache(THUMBNAIL_CACHE_DIR),
+            check_dir=False,
+        ),
+        name="images",
+    )
+    return app
+
+
+router = APIRouter()
 
 templates = Jinja2Templates(directory=STATIC_DIR / "templates")
 
@@ -79,7 +223,7 @@ templates = Jinja2Templates(directory=STATIC_DIR / "templates")
 # logging.config.dictConfig(logging_config)
 
 
-@app.get("/", response_class=HTMLResponse)
+@router.get("/", response_class=HTMLResponse)
 async def home(request: Request) -> HTMLResponse:
     return templates.TemplateResponse(request=request, name="home.tmpl.html")
 
@@ -91,6 +235,10 @@ COL_MAP = {
     "R": "🔴",
     "G": "🟢",
 }
+# position of each colour symbol in WUBRG order
+_SYMBOL_ORDER = {sym: "WUBRG".index(char) for char, sym in COL_MAP.items()}
+# there are a few thousand distinct mana costs across all cards, more than enough for a page
+_MANA_COST_CACHE_SIZE = 4096
 
 
 class _CardListRow(BaseModel):
@@ -123,11 +271,10 @@ class _CardListRow(BaseModel):
             ```
         """
         # sort by WUBRG with no duplicates
-        sorted_colors = {sym: "WUBRG".index(char) for char, sym in COL_MAP.items()}
         return "".join(
             sorted(
-                list({COL_MAP[c] for c in text.upper() if c in COL_MAP}),
-                key=sorted_colors.__getitem__,
+                {COL_MAP[c] for c in text.upper() if c in COL_MAP},
+                key=_SYMBOL_ORDER.__getitem__,
             )
         )
 
@@ -151,23 +298,19 @@ class _CardListRow(BaseModel):
         """
         # sort by WUBRG with no duplicates
         return "".join(
-            sorted(list({c for c in text.upper() if c in COL_MAP}), key="WUBRG".index)
+            sorted({c for c in text.upper() if c in COL_MAP}, key="WUBRG".index)
         )
 
     @classmethod
     def model_validate_orm(cls, card: db_models.Card) -> "_CardListRow":
+        if card.mana_cost is not None:
+            color_text, color_symbol = _mana_cost_colors(card.mana_cost)
+        else:
+            color_text, color_symbol = "N/a", "N/a"
         return cls(
             name=card.name,
-            color_text=(
-                _CardListRow._filter_color_text(card.mana_cost)
-                if card.mana_cost is not None
-                else "N/a"
-            ),
-            color_symbol=(
-                _CardListRow._color_text_to_symbol(card.mana_cost)
-                if card.mana_cost is not None
-                else "N/a"
-            ),
+            color_text=color_text,
+            color_symbol=color_symbol,
             mana_value=card.mana_cost if card.mana_cost is not None else "0",
             rarity=str(card.rarity),
             type=card.type if card.type is not None else "N/a",
@@ -180,35 +323,301 @@ class _CardListRow(BaseModel):
         )
 
 
-@app.get("/card_list", response_class=HTMLResponse)
-async def card_list(
-    request: Request, orm: db.OrmSession = Depends(get_db)
-) -> HTMLResponse:
-    cards = (
-        orm.query(db_models.Card)
-        .order_by(db_models.Card.name)
-        .where(db_models.Card.mana_cost.is_not(None))
-        .where(db_models.Card.card_art_uri.is_not(None))
-        .limit(100)
-        .all()
+@functools.lru_cache(maxsize=_MANA_COST_CACHE_SIZE)
+def _mana_cost_colors(mana_cost: str) -> tuple[str, str]:
+    """
+    Colour text and symbols of a mana cost, shared by every card with the same cost
+
+    Usage:
+        ```python
+        _mana_cost_colors("{2}{U}{W}") -> ("WU", "⚪🔵")
+        ```
+    """
+    return (
+        _CardListRow._filter_color_text(mana_cost),
+        _CardListRow._color_text_to_symbol(mana_cost),
     )
+
+
+def _render_card_list(
+    request: Request,
+    cards: Sequence[db_models.Card],
+    next_cursor: str | None,
+    limit: int,
+) -> HTMLResponse:
     return templates.TemplateResponse(
         request=request,
         name="card_list.tmpl.html",
         context={
             "cards": [
                 _CardListRow.model_validate_orm(card).model_dump() for card in cards
-            ]
+            ],
+            # resolved once, `url_for` per row was half the cost of rendering a page
+            "images_url": request.url_for("images", path=""),
+            "thumbnail_width": CARD_LIST_THUMBNAIL_WIDTH,
+            "next_cursor": next_cursor,
+            "limit": limit,
         },
     )
 
 
-@app.post("/sync_scryfall_data")
-def sync_db_scryfall(request: Request, orm: db.OrmSession = Depends(get_db)) -> None:
-    logger.info("Syncing Scryfall data")
-    cards = bulk_data.read_bulk_file(SCRYFALL_BULK_DATA_PATH)
-    logger.info("Read %s cards from Scryfall bulk data", len(cards))
-    populate_cards_from_scryfall_data(
-        cards=cards, orm=orm, image_dir=SCRYFALL_IMAGE_DIR
+@router.get("/card_list", response_class=HTMLResponse)
+async def card_list(
+    request: Request,
+    after: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    orm: db.AsyncOrmSession = Depends(get_db),
+    cache: ResponseCache = Depends(get_response_cache),
+) -> Response:
+    async def _render() -> Response:
+        try:
+            cursor = CardCursor.decode(after) if after else None
+        except ValueError as err:
+            raise HTTPException(status_code=400, detail=str(err)) from err
+        page = await paginate_cards_async(
+            orm, card_list_query(), after=cursor, limit=limit
+        )
+        return _render_card_list(request, page.cards, page.next_cursor, limit)
+
+    return await cache.respond(request, _render)
+
+
+class CardSearchResult(BaseModel):
+    card_id: int
+    name: str
+    mana_cost: str | None
+    rarity: str
+    type: str | None
+    set_code: str | None
+    colors: str | None
+    scryfall_id: str | None
+    scryfall_uri: str | None
+    image_uri: str | None
+
+    @classmethod
+    def model_validate_orm(cls, card: db_models.Card) -> "CardSearchResult":
+        return cls(
+            card_id=card.card_id,
+            name=card.name,
+            mana_cost=card.mana_cost,
+            rarity=str(card.rarity),
+            type=card.type,
+            set_code=card.set_code,
+            colors=card.colors,
+            scryfall_id=card.scryfall_id,
+            scryfall_uri=card.scryfall_uri,
+            image_uri=card.card_art_uri,
+        )
+
+
+class CardSearchPage(BaseModel):
+    cards: list[CardSearchResult]
+    # pass as `after` to get the next page, `None` on the last page
+    next_cursor: str | None
+
+
+@router.get("/cards/search", response_model=CardSearchPage)
+async def search_cards(
+    request: Request,
+    name: str | None = None,
+    type_line: str | None = Query(None, alias="type"),
+    set_code: str | None = None,
+    rarity: str | None = None,
+    colors: str | None = None,
+    after: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    orm: db.AsyncOrmSession = Depends(get_db),
+    cache: ResponseCache = Depends(get_response_cache),
+) -> Response:
+    """
+    Cards matching every filter given, ordered by name.
+    `name` and `type` match each word as a prefix, `colors` is the card's exact colours as WUBRG letters, or C for colourless.
+    """
+
+    async def _render() -> Response:
+        try:
+            cursor = CardCursor.decode(after) if after else None
+            query = search_cards_query(name, type_line, set_code, rarity, colors)
+        except ValueError as err:
+            raise HTTPException(status_code=400, detail=str(err)) from err
+        page = await paginate_cards_async(orm, query, after=cursor, limit=limit)
+        result = CardSearchPage(
+            cards=[CardSearchResult.model_validate_orm(card) for card in page.cards],
+            next_cursor=page.next_cursor,
+        )
+        return Response(result.model_dump_json(), media_type="application/json")
+
+    return await cache.respond(request, _render)
+
+
+class SyncJobStatus(BaseModel):
+    job_id: str
+    state: JobState
+    processed: int
+    upserted: int
+    unchanged: int
+    deleted: int
+    expected_total: int | None
+    # cards per second
+    rate: float
+    eta_seconds: float | None
+    started_at: datetime
+    finished_at: datetime | None
+    error: str | None
+
+    @classmethod
+    def from_job(cls, job: SyncJob) -> "SyncJobStatus":
+        return cls(
+            job_id=job.job_id,
+            state=job.state,
+            processed=job.progress.processed,
+            upserted=job.progress.upserted,
+            unchanged=job.progress.unchanged,
+            deleted=job.progress.deleted,
+            expected_total=job.expected_total,
+            rate=job.rate,
+            eta_seconds=job.eta_seconds,
+            started_at=job.started_at,
+            finished_at=job.finished_at,
+            error=job.error,
+        )
+
+
+@router.post("/sync_scryfall_data", status_code=202, response_model=SyncJobStatus)
+async def sync_db_scryfall(
+    orm: db.AsyncOrmSession = Depends(get_db),
+    jobs: SyncJobRunner = Depends(get_sync_jobs),
+) -> SyncJobStatus:
+    """
+    Start syncing the card table with the Scryfall bulk data file in the background,
+    poll `sync_status` with the returned job id for progress
+    """
+    # the new bulk file is about the size of the last one
+    expected_total = await orm.scalar(
+        select(func.count())
+        .select_from(db_models.Card)
+        .where(db_models.Card.deleted_at.is_(None))
     )
-    logger.info("Synced Scryfall data")
+    try:
+        job = jobs.start(expected_total=expected_total or None)
+    except SyncAlreadyRunning as err:
+        raise HTTPException(
+            status_code=409, detail={"message": str(err), "job_id": err.job_id}
+        ) from err
+    logger.info("Syncing Scryfall data, job %s", job.job_id)
+    return SyncJobStatus.from_job(job)
+
+
+@router.get("/sync_scryfall_data/{job_id}", response_model=SyncJobStatus)
+async def sync_status(
+    job_id: str, jobs: SyncJobRunner = Depends(get_sync_jobs)
+) -> SyncJobStatus:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No sync job {job_id}")
+    return SyncJobStatus.from_job(job)
+
+
+async def _card_names(
+    resources: AppResources, orm: db.AsyncOrmSession, scryfall_ids: set[str]
+) -> dict[str, str]:
+    """
+    Name of each card in `scryfall_ids` from the card snapshot,
+    cards not in it e.g. synced since it was exported are looked up in the db
+    """
+    snapshot = resources.card_snapshot()
+    names = snapshot.names(scryfall_ids) if snapshot is not None else {}
+    missing = scryfall_ids - names.keys()
+    if missing:
+        rows = await orm.execute(
+            select(db_models.Card.scryfall_id, db_models.Card.name).where(
+                db_models.Card.scryfall_id.in_(missing)
+            )
+        )
+        names.update((scryfall_id, name) for scryfall_id, name in rows if scryfall_id)
+    return names
+
+
+class ScanMatch(BaseModel):
+    scryfall_id: str
+    # Hamming distance between the hashes, lower is closer
+    distance: int
+    # `None` if the card isn't in the db
+    name: str | None
+
+
+class ScannedImage(BaseModel):
+    filename: str
+    # x, y, w, h of the detected card
+    bounding_box: tuple[int, int, int, int] | None
+    # closest first, empty if no index has been built
+    matches: list[ScanMatch]
+    error: str | None
+    elapsed_ms: float
+
+
+@router.post(
+    "/scan",
+    response_model=list[ScannedImage],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["files"],
+                        "properties": {
+                            "files": {
+                                "type": "array",
+                                "items": {"type": "string", "format": "binary"},
+                            }
+                        },
+                    }
+                }
+            },
+        }
+    },
+)
+async def scan(
+    request: Request,
+    k: int = Query(5, ge=1, le=50),
+    orm: db.AsyncOrmSession = Depends(get_db),
+    pool: ScanPool = Depends(get_scan_pool),
+) -> list[ScannedImage]:
+    """
+    Detect and identify the card in each photo uploaded as `files`, in upload order.
+    A photo that can't be scanned has its `error` set rather than failing the request.
+    """
+    # read here rather than as an `UploadFile` parameter, which spools to disk before its size can be checked
+    uploads = await read_uploads(request, "files", MAX_SCAN_FILES, MAX_SCAN_FILE_BYTES)
+    if not uploads:
+        raise HTTPException(status_code=400, detail="No files to scan")
+    results = await asyncio.gather(
+        *(asyncio.wrap_future(pool.submit(data, name, k)) for name, data in uploads)
+    )
+
+    names = await _card_names(
+        _resources(request),
+        orm,
+        {str(match["scryfall_id"]) for result in results for match in result.matches},
+    )
+    return [
+        ScannedImage(
+            filename=result.path,
+            bounding_box=result.bounding_box,
+            matches=[
+                ScanMatch.model_validate(
+                    {**match, "name": names.get(str(match["scryfall_id"]))}
+                )
+                for match in result.matches
+            ],
+            error=result.error,
+            elapsed_ms=result.elapsed_ms,
+        )
+        for result in results
+    ]
+
+
+# for `uvicorn mtg_scanner.web_server.main:app`
+app = create_app()
@@ -0,0 +1,128 @@
+"""
+Keyset (cursor) pagination over cards ordered by `(name, card_id)`.
+A page starts after the last row of the previous one instead of at an OFFSET,
+so it is an index range scan that costs the same however deep the page is.
+"""
+
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Self
+
+from sqlalchemy import Select, literal, select, tuple_
+
+import mtg_scanner.db as db
+from mtg_scanner.db.models import Card
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+@dataclass(frozen=True)
+class CardCursor:
+    """
+    Position in the `(name, card_id)` ordering, a page holds the rows after it
+    """
+
+    name: str
+    card_id: int
+
+    def encode(self) -> str:
+        """opaque url safe token for a query string"""
+        raw = json.dumps([self.name, self.card_id], separators=(",", ":"))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    @classmethod
+    def decode(cls, token: str) -> Self:
+        """
+        Inverse of `encode`
+
+        Raises:
+            ValueError: the token was not made by `encode`
+        """
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            name, card_id = json.loads(raw)
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as err:
+            raise ValueError(f"Invalid cursor {token!r}") from err
+        if not isinstance(name, str) or not isinstance(card_id, int):
+            raise ValueError(f"Invalid cursor {token!r}")
+        return cls(name, card_id)
+
+
+@dataclass
+class CardPage:
+    cards: Sequence[Card]
+    # cursor of the following page, `None` on the last page
+    next_cursor: str | None
+
+
+def card_list_query() -> Select[tuple[Card]]:
+    """
+    Cards shown on the card list, matches the `ix_card_list_name_card_id` partial index
+    """
+    return (
+        select(Card)
+        .where(Card.mana_cost.is_not(None))
+        .where(Card.card_art_uri.is_not(None))
+        .where(Card.deleted_at.is_(None))
+    )
+
+
+def _page_query(
+    query: Select[tuple[Card]], after: CardCursor | None, limit: int
+) -> Select[tuple[Card]]:
+    if after is not None:
+        # row value comparison, SQLite turns it into a range on the (name, card_id) index
+        query = query.where(
+            tuple_(Card.name, Card.card_id)
+            > tuple_(literal(after.name), literal(after.card_id))
+        )
+    # one extra row tells us whether there is a next page without a COUNT
+    return query.order_by(Card.name, Card.card_id).limit(limit + 1)
+
+
+def _to_page(cards: Sequence[Card], limit: int) -> CardPage:
+    if len(cards) <= limit:
+        return CardPage(cards=cards, next_cursor=None)
+    last = cards[limit - 1]
+    return CardPage(
+        cards=cards[:limit], next_cursor=CardCursor(last.name, last.card_id).encode()
+    )
+
+
+def paginate_cards(
+    orm: db.OrmSession,
+    query: Select[tuple[Card]],
+    after: CardCursor | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> CardPage:
+    """
+    One page of `query` ordered by `(name, card_id)`
+
+    Args:
+        orm (db.OrmSession): session to run the query on
+        query (Select[tuple[Card]]): filtered select of cards, without an ordering or limit
+        after (CardCursor | None, optional): start after this position, the first page if `None`. Defaults to None.
+        limit (int, optional): max cards on the page. Defaults to DEFAULT_PAGE_SIZE.
+
+    Returns:
+        CardPage: the cards and the cursor of the next page
+    """
+    cards = orm.scalars(_page_query(query, after, limit)).all()
+    return _to_page(cards, limit)
+
+
+async def paginate_cards_async(
+    orm: db.AsyncOrmSession,
+    query: Select[tuple[Card]],
+    after: CardCursor | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> CardPage:
+    """
+    `paginate_cards` on an async session
+    """
+    cards = (await orm.scalars(_page_query(query, after, limit))).all()
+    return _to_page(cards, limit)
@@ -0,0 +1,147 @@
+"""
+In process cache of rendered responses, keyed on the base URL, the route and its query params.
+The card data only changes when a sync runs, which clears the cache after every batch that changes cards
+and once it finishes.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+DEFAULT_TTL_S = 300.0
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# clients keep the response but check the ETag before using it
+_CACHE_CONTROL = "no-cache"
+
+CacheKey = tuple[str, str, tuple[tuple[str, str], ...]]
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    media_type: str | None
+    etag: str
+    expires_at: float
+
+    def matches(self, if_none_match: str | None) -> bool:
+        """if the client's `If-None-Match` header lists this response's ETag"""
+        if if_none_match is None:
+            return False
+        return self.etag in (
+            tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+        )
+
+
+class ResponseCache:
+    """
+    LRU cache of response bodies, entries expire after `ttl_s` and the least recently used
+    are dropped once they total over `max_bytes`. A `max_bytes` of 0 caches nothing.
+    Safe to clear from another thread.
+    """
+
+    def __init__(
+        self, ttl_s: float = DEFAULT_TTL_S, max_bytes: int = DEFAULT_MAX_BYTES
+    ) -> None:
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[CacheKey, CachedResponse] = OrderedDict()
+        self._total_bytes = 0
+        # bumped by `clear`, a response rendered from data read before a clear is not stored
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @staticmethod
+    def key(request: Request) -> CacheKey:
+        # the scheme and host too, pages hold absolute URLs made with `url_for`
+        return (
+            str(request.base_url),
+            request.url.path,
+            tuple(sorted(request.query_params.multi_items())),
+        )
+
+    def get(self, key: CacheKey) -> CachedResponse | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(
+        self,
+        key: CacheKey,
+        body: bytes,
+        media_type: str | None,
+        generation: int | None = None,
+    ) -> CachedResponse:
+        """
+        Cache `body`, unless it's bigger than the whole cache
+        or the cache was cleared since `generation` was read
+
+        Returns:
+            CachedResponse: the entry, returned even if it wasn't stored
+        """
+        entry = CachedResponse(
+            body=body,
+            media_type=media_type,
+            etag='"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"',
+            expires_at=time.monotonic() + self.ttl_s,
+        )
+        with self._lock:
+            if len(body) > self.max_bytes or (
+                generation is not None and generation != self._generation
+            ):
+                return entry
+            self._remove(key)
+            self._entries[key] = entry
+            self._total_bytes += len(body)
+            while self._total_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+        return entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+            self._generation += 1
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= len(entry.body)
+
+    async def respond(
+        self, request: Request, render: Callable[[], Awaitable[Response]]
+    ) -> Response:
+        """
+        The cached response to `request`, made with `render` on a miss.
+        Only 200s are cached, a request with a matching `If-None-Match` gets a 304.
+        """
+        key = self.key(request)
+        entry = self.get(key)
+        if entry is None:
+            generation = self.generation
+            response = await render()
+            if response.status_code != 200:
+                return response
+            entry = self.put(key, bytes(response.body), response.media_type, generation)
+        headers = {"etag": entry.etag, "cache-control": _CACHE_CONTROL}
+        if entry.matches(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+        return Response(entry.body, media_type=entry.media_type, headers=headers)
@@ -0,0 +1,267 @@
+"""
+Runs the Scryfall sync as a background job in a worker process.
+The sync parses and validates every card in the bulk file, in a thread that would hold the GIL
+the web server needs for most of a multi minute sync, so it gets its own interpreter.
+Progress is sent back over a queue after every batch, and the card snapshot is exported once it's done.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from enum import Enum
+from multiprocessing.queues import Queue
+from pathlib import Path
+from queue import Empty
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from mtg_scanner.db.sync_scryfall_data import (
+    SyncResult,
+    populate_cards_from_scryfall_data,
+)
+
+logger = logging.getLogger(__name__)
+
+# finished jobs kept around for their status to be read
+MAX_FINISHED_JOBS = 20
+# scheduling priority the worker drops by, the web server comes first when there aren't enough cores
+WORKER_NICENESS = 10
+# how often the monitor checks the worker is still alive while waiting for progress
+_POLL_INTERVAL_S = 1.0
+
+
+class SyncAlreadyRunning(RuntimeError):
+    """
+    A sync was started while another is running
+    """
+
+    def __init__(self, job_id: str) -> None:
+        super().__init__(f"Sync {job_id} is already running")
+        self.job_id = job_id
+
+
+class JobState(Enum):
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+@dataclass
+class SyncJob:
+    job_id: str
+    # live cards in the db when the job started, used as the size of the new bulk file for the ETA
+    expected_total: int | None = None
+    state: JobState = JobState.RUNNING
+    progress: SyncResult = field(default_factory=SyncResult)
+    started_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    finished_at: datetime | None = None
+    error: str | None = None
+
+    @property
+    def elapsed_seconds(self) -> float:
+        end = self.finished_at or datetime.now(timezone.utc)
+        return (end - self.started_at).total_seconds()
+
+    @property
+    def rate(self) -> float:
+        """cards processed per second"""
+        elapsed = self.elapsed_seconds
+        return self.progress.processed / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta_seconds(self) -> float | None:
+        """time left at the current rate, `None` if there is no estimate"""
+        if self.state is not JobState.RUNNING:
+            return 0.0
+        remaining = (self.expected_total or 0) - self.progress.processed
+        if remaining <= 0 or self.rate == 0:
+            return None
+        return remaining / self.rate
+
+
+def _run_sync(
+    db_url: str,
+    bulk_file: Path,
+    image_dir: Path,
+    snapshot_dir: Path | None,
+    messages: "Queue[object]",
+) -> None:
+    """entry point of the worker process, sends each `SyncResult` and finally the result or the error"""
+    # only the worker parses the bulk file and writes the snapshot
+    from mtg_scanner.db.card_snapshot import CardSnapshot
+    from mtg_scanner.scryfall_data import bulk_data
+
+    if hasattr(os, "nice"):
+        os.nice(WORKER_NICENESS)
+    try:
+        engine = create_engine(db_url)
+        with sessionmaker(autoflush=False, autocommit=False, bind=engine)() as orm:
+            result = populate_cards_from_scryfall_data(
+                cards=bulk_data.iter_bulk_file(bulk_file),
+                orm=orm,
+                image_dir=image_dir,
+                delete_missing=True,
+                on_progress=messages.put,
+            )
+            if snapshot_dir is not None:
+                CardSnapshot.from_db(orm).save(snapshot_dir)
+        engine.dispose()
+        messages.put(("done", result))
+    except Exception as err:
+        messages.put(("failed", repr(err)))
+
+
+class SyncJobRunner:
+    """
+    Starts sync jobs one at a time and tracks their progress
+    """
+
+    def __init__(
+        self,
+        db_url: str,
+        bulk_file: Path,
+        image_dir: Path,
+        on_update: Callable[[SyncJob], None] | None = None,
+        snapshot_dir: Path | None = None,
+    ) -> None:
+        """
+        Args:
+            db_url (str): db to sync
+            bulk_file (Path): Scryfall bulk data file to sync from
+            image_dir (Path): directory holding the pulled card images
+            on_update (Callable[[SyncJob], None] | None, optional): called from a background thread
+                after every batch the sync commits that upserts or deletes cards, and once it finishes.
+                Defaults to None.
+            snapshot_dir (Path | None, optional): where to export a `CardSnapshot` of the synced cards,
+                not exported if `None`. Defaults to None.
+        """
+        self.db_url = db_url
+        self.bulk_file = bulk_file
+        self.image_dir = image_dir
+        self.on_update = on_update
+        self.snapshot_dir = snapshot_dir
+        self._jobs: OrderedDict[str, SyncJob] = OrderedDict()
+        self._running: SyncJob | None = None
+        self._lock = threading.Lock()
+        # a fresh interpreter, forking would copy the server's threads and event loop state
+        self._context = multiprocessing.get_context("spawn")
+
+    def start(self, expected_total: int | None = None) -> SyncJob:
+        """
+        Start a sync in a worker process, returns straight away
+
+        Args:
+            expected_total (int | None, optional): number of cards the bulk file is expected to hold,
+                used for the ETA. Defaults to None.
+
+        Raises:
+            SyncAlreadyRunning: if a sync is still running
+
+        Returns:
+            SyncJob: the started job, updated in place as the sync progresses
+        """
+        with self._lock:
+            if self._running is not None:
+                raise SyncAlreadyRunning(self._running.job_id)
+            job = SyncJob(job_id=uuid.uuid4().hex, expected_total=expected_total)
+            messages: Queue[object] = self._context.Queue()
+            process = self._context.Process(
+                target=_run_sync,
+                args=(
+                    self.db_url,
+                    self.bulk_file,
+                    self.image_dir,
+                    self.snapshot_dir,
+                    messages,
+                ),
+                name=f"sync-{job.job_id}",
+                daemon=True,
+            )
+            process.start()
+            self._running = job
+            self._jobs[job.job_id] = job
+            self._trim()
+        threading.Thread(
+            target=self._monitor,
+            args=(job, process, messages),
+            name=f"sync-monitor-{job.job_id}",
+            daemon=True,
+        ).start()
+        logger.info("Started sync %s", job.job_id)
+        return job
+
+    def get(self, job_id: str) -> SyncJob | None:
+        return self._jobs.get(job_id)
+
+    @property
+    def running(self) -> SyncJob | None:
+        return self._running
+
+    def _trim(self) -> None:
+        finished = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.state is not JobState.RUNNING
+        ]
+        for job_id in finished[: max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job_id]
+
+    def _notify(self, job: SyncJob) -> None:
+        if self.on_update is None:
+            return
+        try:
+            self.on_update(job)
+        except Exception:
+            logger.exception("Sync %s update callback failed", job.job_id)
+
+    def _monitor(
+        self,
+        job: SyncJob,
+        process: multiprocessing.process.BaseProcess,
+        messages: "Queue[object]",
+    ) -> None:
+        """apply the worker's messages to `job` until it finishes or dies"""
+        error: str | None = "Sync worker exited without a result"
+        while True:
+            # checked before the read, anything the worker sent before exiting is already in the queue
+            exited = not process.is_alive()
+            try:
+                message = messages.get(timeout=_POLL_INTERVAL_S)
+            except Empty:
+                # died without a word e.g. killed by the OOM killer
+                if exited:
+                    break
+                continue
+            if isinstance(message, SyncResult):
+                changed = (message.upserted, message.deleted) != (
+                    job.progress.upserted,
+                    job.progress.deleted,
+                )
+                job.progress = message
+                # a batch of unchanged cards leaves the db as it was, nothing to tell
+                if changed:
+                    self._notify(job)
+            elif isinstance(message, tuple) and message[0] == "done":
+                job.progress, error = message[1], None
+                break
+            elif isinstance(message, tuple) and message[0] == "failed":
+                error = message[1]
+                break
+        process.join()
+        with self._lock:
+            job.finished_at = datetime.now(timezone.utc)
+            job.error = error
+            job.state = JobState.FAILED if error else JobState.SUCCEEDED
+            self._running = None
+        self._notify(job)
+        if error:
+            logger.error("Sync %s failed: %s", job.job_id, error)
+        else:
+            logger.info("Sync %s finished: %s", job.job_id, job.progress)
@@ -0,0 +1,134 @@
+"""
+Streaming parse of multipart file uploads straight into memory.
+Starlette's form parser spools each file to a temporary file past 1MB and only gives the route the size
+once the whole body has been read, here the limits are checked as the body arrives.
+"""
+
+from dataclasses import dataclass, field
+
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+
+# part headers and boundaries on top of the file contents
+_PART_OVERHEAD_BYTES = 16 * 1024
+
+
+@dataclass
+class _Part:
+    disposition: bytes = b""
+    # `None` for a form field that isn't a file
+    filename: str | None = None
+    data: bytearray = field(default_factory=bytearray)
+
+
+class _UploadParser:
+    """
+    Collects the files uploaded as `field_name` in a `multipart/form-data` body, in upload order.
+    More than `max_files` files, or one over `max_file_bytes`, fails with a 400 or 413 as soon as it is seen.
+    Other form fields are ignored.
+    """
+
+    def __init__(
+        self, boundary: bytes, field_name: str, max_files: int, max_file_bytes: int
+    ) -> None:
+        self.field_name = field_name
+        self.max_files = max_files
+        self.max_file_bytes = max_file_bytes
+        self.max_body_bytes = max_files * (max_file_bytes + _PART_OVERHEAD_BYTES)
+        self.files: list[tuple[str, bytes]] = []
+        self._part = _Part()
+        self._header_name = b""
+        self._header_value = b""
+        self._parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+            },
+        )
+
+    def _on_part_begin(self) -> None:
+        self._part = _Part()
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        if self._header_name.lower() == b"content-disposition":
+            self._part.disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._part.disposition)
+        if options.get(b"name", b"").decode() != self.field_name:
+            return
+        self._part.filename = options.get(b"filename", b"").decode() or (
+            f"upload-{len(self.files)}"
+        )
+        if len(self.files) >= self.max_files:
+            raise HTTPException(
+                status_code=400, detail=f"At most {self.max_files} files per upload"
+            )
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._part.filename is None:
+            return
+        if len(self._part.data) + end - start > self.max_file_bytes:
+            raise HTTPException(
+                status_code=413, detail=f"{self._part.filename} is too large"
+            )
+        self._part.data += data[start:end]
+
+    def _on_part_end(self) -> None:
+        if self._part.filename is not None:
+            self.files.append((self._part.filename, bytes(self._part.data)))
+
+    def write(self, chunk: bytes) -> None:
+        self._parser.write(chunk)
+
+    def finalize(self) -> list[tuple[str, bytes]]:
+        self._parser.finalize()
+        return self.files
+
+
+async def read_uploads(
+    request: Request, field_name: str, max_files: int, max_file_bytes: int
+) -> list[tuple[str, bytes]]:
+    """
+    The name and contents of each file uploaded as `field_name` in the body of `request`
+
+    Raises:
+        HTTPException: 400 if the body isn't `multipart/form-data` or has too many files,
+            413 if a file or the body as a whole is too large
+    """
+    mime_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if mime_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(
+            status_code=400, detail="Expected a multipart/form-data upload"
+        )
+    parser = _UploadParser(options[b"boundary"], field_name, max_files, max_file_bytes)
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > parser.max_body_bytes:
+        raise HTTPException(status_code=413, detail="Upload is too large")
+    received = 0
+    try:
+        async for chunk in request.stream():
+            # a chunked body has no content length to check up front
+            received += len(chunk)
+            if received > parser.max_body_bytes:
+                raise HTTPException(status_code=413, detail="Upload is too large")
+            parser.write(chunk)
+        return parser.finalize()
+    except MultipartParseError as err:
+        raise HTTPException(status_code=400, detail=str(err)) from err
@@ -1,13 +1,36 @@
 from __future__ import annotations
 
+import json
+import time
+import tracemalloc
+import uuid
+from collections.abc import Callable, Generator, Iterator
+from dataclasses import asdict, dataclass
+from pathlib import Path
 from typing import TYPE_CHECKING
 
+import cv2 as cv
+import numpy as np
+import numpy.typing as npt
 import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import mtg_scanner.db as db
+from mtg_scanner.db.models import Base
 
 if TYPE_CHECKING:
     from _pytest.config.argparsing import Parser
+    from _pytest.fixtures import FixtureRequest
     from _pytest.nodes import Item
 
+BENCHMARK_BASELINE_FILE = Path(__file__).parent / "data" / "benchmark_baseline.json"
+# latency differences below this are timer noise, mostly matters for sub millisecond functions
+_BENCHMARK_LATENCY_SLACK_MS = 0.2
+# peak memory can grow by this fraction of the baseline before failing, plus a little for interpreter noise
+_BENCHMARK_MEMORY_TOLERANCE = 0.1
+_BENCHMARK_MEMORY_SLACK_BYTES = 64 * 1024
+
 
 def pytest_addoption(parser: Parser):
     """
@@ -22,6 +45,24 @@ def pytest_addoption(parser: Parser):
     parser.addoption(
         "--runall", action="store_true", default=False, help="run all tests"
     )
+    parser.addoption(
+        "--update-benchmarks",
+        action="store_true",
+        default=False,
+        help="save the results of `benchmark` tests as the new baseline",
+    )
+    parser.addoption(
+        "--benchmark-no-compare",
+        action="store_true",
+        default=False,
+        help="only report `benchmark` timings instead of failing on a regression from the saved baseline",
+    )
+    parser.addoption(
+        "--benchmark-tolerance",
+        type=float,
+        default=0.5,
+        help="fraction a benchmark's median latency can exceed its baseline by before failing",
+    )
 
 
 def pytest_runtest_setup(item: Item):
@@ -37,3 +78,302 @@ def pytest_runtest_setup(item: Item):
         pytest.skip("need --runslow option to run slow tests")
     if "integration" in markers and not item.config.getoption("--runint"):
         pytest.skip("need --runint option to run integration tests")
+
+
+@pytest.fixture
+def orm() -> Generator[db.OrmSession, None, None]:
+    """
+    Session on a fresh in-memory SQLite db
+    """
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(autoflush=False, autocommit=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def _scryfall_card_json(**overrides: object) -> dict[str, object]:
+    """
+    Minimal valid entry of a Scryfall bulk data file
+    """
+    scryfall_id = str(overrides.pop("id", uuid.uuid4()))
+    card: dict[str, object] = {
+        "id": scryfall_id,
+        "lang": "en",
+        "object": "card",
+        "layout": "normal",
+        "prints_search_uri": f"https://api.scryfall.com/cards/search?q={scryfall_id}",
+        "rulings_uri": f"https://api.scryfall.com/cards/{scryfall_id}/rulings",
+        "scryfall_uri": f"https://scryfall.com/card/tst/1/{scryfall_id}",
+        "uri": f"https://api.scryfall.com/cards/{scryfall_id}",
+        "cmc": 2.0,
+        "color_identity": ["W", "U"],
+        "colors": ["W", "U"],
+        "legalities": {"standard": "legal"},
+        "mana_cost": "{W}{U}",
+        "name": f"Test Card {scryfall_id[:8]}",
+        "oracle_text": "Flying",
+        "power": "2",
+        "toughness": "2",
+        "reserved": False,
+        "type_line": "Creature — Bird",
+        "booster": True,
+        "border_color": "black",
+        "collector_number": "1",
+        "digital": False,
+        "frame": "2015",
+        "full_art": False,
+        "games": ["paper"],
+        "highres_image": True,
+        "image_status": "highres_scan",
+        "image_uris": {
+            size: f"https://cards.scryfall.io/{size}/front/{scryfall_id}.jpg?1"
+            for size in ("small", "normal", "large", "png", "art_crop", "border_crop")
+        },
+        "oversized": False,
+        "prices": {"usd": "0.10"},
+        "promo": False,
+        "rarity": "common",
+        "related_uris": {},
+        "released_at": "2024-01-01",
+        "reprint": False,
+        "scryfall_set_uri": "https://scryfall.com/sets/tst",
+        "set_name": "Test Set",
+        "set_search_uri": "https://api.scryfall.com/cards/search?q=set:tst",
+        "set_type": "expansion",
+        "set": "tst",
+        "set_id": "2f3d0a8c-7a53-4bb6-9c3b-6d4b3c1e1f11",
+        "story_spotlight": False,
+        "textless": False,
+        "variation": False,
+    }
+    card.update(overrides)
+    return card
+
+
+@pytest.fixture
+def scryfall_card_json() -> Callable[..., dict[str, object]]:
+    """
+    Factory for bulk data entries, keyword args override the default fields
+    """
+    return _scryfall_card_json
+
+
+@pytest.fixture
+def write_bulk_file(tmp_path: Path) -> Callable[[list[dict[str, object]]], Path]:
+    """
+    Factory writing entries to a bulk data file, returns the path of the file
+    """
+
+    def _write(cards: list[dict[str, object]], name: str = "bulk_data.json") -> Path:
+        path = tmp_path / name
+        path.write_text(json.dumps(cards, indent=1), encoding="utf-8")
+        return path
+
+    return _write
+
+
+def _synthetic_card(
+    seed: int, width: int = 488, height: int = 680
+) -> npt.NDArray[np.uint8]:
+    """
+    Card like BGR image, a black border around random shapes so each seed has distinct features
+    """
+    rng = np.random.default_rng(seed)
+    card = np.full((height, width, 3), 20, dtype=np.uint8)
+    border = max(width // 20, 2)
+    inner = card[border:-border, border:-border]
+    inner[:] = rng.integers(120, 230, size=3, dtype=np.uint8)
+    inner_h, inner_w = inner.shape[:2]
+    for _ in range(12):
+        color = tuple(int(c) for c in rng.integers(0, 255, size=3))
+        x1, x2 = sorted(int(v) for v in rng.integers(0, inner_w, size=2))
+        y1, y2 = sorted(int(v) for v in rng.integers(0, inner_h, size=2))
+        if rng.random() < 0.5:
+            cv.rectangle(inner, (x1, y1), (x2, y2), color, thickness=cv.FILLED)
+        else:
+            radius = max((x2 - x1) // 2, 2)
+            cv.circle(inner, ((x1 + x2) // 2, (y1 + y2) // 2), radius, color, -1)
+    for _ in range(6):
+        color = tuple(int(c) for c in rng.integers(0, 255, size=3))
+        pt1 = tuple(int(v) for v in rng.integers(0, min(inner_w, inner_h), size=2))
+        pt2 = tuple(int(v) for v in rng.integers(0, min(inner_w, inner_h), size=2))
+        cv.line(inner, pt1, pt2, color, thickness=max(width // 100, 1))
+    return card
+
+
+@pytest.fixture
+def synthetic_card() -> Callable[..., npt.NDArray[np.uint8]]:
+    """
+    Factory for synthetic card images, `synthetic_card(seed, width=488, height=680)`
+    """
+    return _synthetic_card
+
+
+def _synthetic_photo(
+    seed: int,
+    width: int = 1200,
+    height: int = 1600,
+    background: tuple[int, int, int] = (235, 235, 235),
+    card_fraction: float = 0.6,
+    noise: float = 0.0,
+) -> tuple[npt.NDArray[np.uint8], tuple[int, int, int, int]]:
+    """
+    Photo like image of a synthetic card lying flat on a plain background,
+    `noise` is the standard deviation of gaussian sensor noise added to every pixel
+
+    Returns:
+        tuple[npt.NDArray[np.uint8], tuple[int, int, int, int]]: the image and the card's x, y, w, h
+    """
+    photo: npt.NDArray[np.uint8] = np.empty((height, width, 3), dtype=np.uint8)
+    photo[:] = background
+    card_h = int(height * card_fraction)
+    card_w = int(card_h * 63 / 88)
+    card = _synthetic_card(seed, card_w, card_h)
+    x, y = (width - card_w) // 2, (height - card_h) // 2
+    photo[y : y + card_h, x : x + card_w] = card
+    if noise > 0:
+        rng = np.random.default_rng(seed)
+        noisy = photo + rng.normal(0, noise, size=photo.shape).astype(np.float32)
+        photo = np.clip(noisy, 0, 255).astype(np.uint8)
+    return photo, (x, y, card_w, card_h)
+
+
+@pytest.fixture
+def synthetic_photo() -> (
+    Callable[..., tuple[npt.NDArray[np.uint8], tuple[int, int, int, int]]]
+):
+    """
+    Factory for a synthetic card on a plain background, returns the image and the card's x, y, w, h.
+    `synthetic_photo(seed, width=1200, height=1600, background=(235, 235, 235), card_fraction=0.6, noise=0.0)`
+    """
+    return _synthetic_photo
+
+
+@dataclass
+class BenchmarkResult:
+    rounds: int
+    mean_ms: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    # peak bytes allocated through the python allocators during one call, numpy and OpenCV outputs included
+    peak_memory_bytes: int
+
+    def __str__(self) -> str:
+        return (
+            f"p50 {self.p50_ms:.2f}ms, p90 {self.p90_ms:.2f}ms, p99 {self.p99_ms:.2f}ms, "
+            f"peak {self.peak_memory_bytes / 2**20:.2f}MiB over {self.rounds} rounds"
+        )
+
+
+class Benchmark:
+    """
+    Times a function, compares it with the stored baseline for the test and fails on a regression.
+    On a noisy machine raise `--benchmark-tolerance`, or pass `--benchmark-no-compare` to only report timings.
+    Run the suite with `--runslow --update-benchmarks` to save new baselines after an intended change.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        baselines: dict[str, dict[str, float]],
+        results: dict[str, dict[str, float]],
+        tolerance: float,
+    ) -> None:
+        self.key = key
+        self.baselines = baselines
+        self.results = results
+        self.tolerance = tolerance
+
+    def __call__(
+        self, fn: Callable[[], object], rounds: int = 20, warmup: int = 2
+    ) -> BenchmarkResult:
+        for _ in range(warmup):
+            fn()
+        timings = np.empty(rounds)
+        for i in range(rounds):
+            start = time.perf_counter()
+            fn()
+            timings[i] = (time.perf_counter() - start) * 1000
+        # measured on a separate call as tracing slows everything down
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        p50, p90, p99 = np.percentile(timings, [50, 90, 99])
+        result = BenchmarkResult(
+            rounds=rounds,
+            mean_ms=float(timings.mean()),
+            p50_ms=float(p50),
+            p90_ms=float(p90),
+            p99_ms=float(p99),
+            peak_memory_bytes=peak,
+        )
+        print(f"{self.key}: {result}")
+        self.results[self.key] = {
+            name: round(value, 4) for name, value in asdict(result).items()
+        }
+        self._check(result)
+        return result
+
+    def _check(self, result: BenchmarkResult) -> None:
+        baseline = self.baselines.get(self.key)
+        if baseline is None:
+            return
+        max_p50 = (
+            baseline["p50_ms"] * (1 + self.tolerance) + _BENCHMARK_LATENCY_SLACK_MS
+        )
+        assert (
+            result.p50_ms <= max_p50
+        ), f"median latency regressed: {result.p50_ms:.2f}ms against a baseline of {baseline['p50_ms']:.2f}ms"
+        max_peak = (
+            baseline["peak_memory_bytes"] * (1 + _BENCHMARK_MEMORY_TOLERANCE)
+            + _BENCHMARK_MEMORY_SLACK_BYTES
+        )
+        assert (
+            result.peak_memory_bytes <= max_peak
+        ), f"peak memory regressed: {result.peak_memory_bytes} bytes against a baseline of {baseline['peak_memory_bytes']:.0f}"
+
+
+@pytest.fixture(scope="session")
+def _benchmark_results(
+    request: FixtureRequest,
+) -> Iterator[tuple[dict[str, dict[str, float]], dict[str, dict[str, float]]]]:
+    """baselines loaded from `BENCHMARK_BASELINE_FILE` and results of this run, saved back if asked to"""
+    baselines: dict[str, dict[str, float]] = {}
+    if BENCHMARK_BASELINE_FILE.exists():
+        baselines = json.loads(BENCHMARK_BASELINE_FILE.read_text())
+    results: dict[str, dict[str, float]] = {}
+    yield baselines, results
+    if request.config.getoption("--update-benchmarks") and results:
+        BENCHMARK_BASELINE_FILE.write_text(
+            json.dumps({**baselines, **results}, indent=2, sort_keys=True) + "\n"
+        )
+
+
+@pytest.fixture
+def benchmark(
+    request: FixtureRequest,
+    _benchmark_results: tuple[dict[str, dict[str, float]], dict[str, dict[str, float]]],
+) -> Benchmark:
+    """
+    `benchmark(fn, rounds=20, warmup=2)` times `fn`, keyed on the test id in the baseline file.
+    Regressions are not checked with `--benchmark-no-compare` or when updating the baseline.
+    """
+    baselines, results = _benchmark_results
+    compare = not (
+        request.config.getoption("--benchmark-no-compare")
+        or request.config.getoption("--update-benchmarks")
+    )
+    return Benchmark(
+        key=request.node.nodeid,
+        baselines=baselines if compare else {},
+        results=results,
+        tolerance=request.config.getoption("--benchmark-tolerance"),
+    )
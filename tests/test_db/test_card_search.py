@@ -0,0 +1,248 @@
+import random
+import time
+
+import pytest
+from sqlalchemy import select, text
+
+from mtg_scanner.db.card_search import (
+    match_expression,
+    rebuild_search_index,
+    search_cards_query,
+    sort_colors,
+)
+from mtg_scanner.db.models import Card
+from mtg_scanner.db.sync_scryfall_data import populate_cards_from_scryfall_data
+from mtg_scanner.scryfall_data.model import ScryfallCard
+from mtg_scanner.web_server.pagination import paginate_cards
+
+
+def _search(orm, **filters: str) -> list[str]:
+    return [
+        card.name for card in paginate_cards(orm, search_cards_query(**filters)).cards
+    ]
+
+
+@pytest.fixture
+def cards(orm, scryfall_card_json, tmp_path) -> list[ScryfallCard]:
+    cards = [
+        ScryfallCard.model_validate(scryfall_card_json(**card))
+        for card in (
+            {
+                "name": "Jace Beleren",
+                "type_line": "Legendary Planeswalker — Jace",
+                "colors": ["U"],
+                "rarity": "mythic",
+                "set": "lrw",
+            },
+            {
+                "name": "Jace's Erasure",
+                "type_line": "Enchantment",
+                "colors": ["U"],
+                "rarity": "common",
+                "set": "m12",
+            },
+            {
+                "name": "Lightning Helix",
+                "type_line": "Instant",
+                "colors": ["R", "W"],
+                "rarity": "uncommon",
+                "set": "rav",
+            },
+            {
+                "name": "Sol Ring",
+                "type_line": "Artifact",
+                "colors": [],
+                "rarity": "uncommon",
+                "set": "lea",
+            },
+            {
+                "name": "Æther Vial",
+                "type_line": "Artifact",
+                "colors": [],
+                "rarity": "uncommon",
+                "set": "dst",
+            },
+            {
+                "name": "Serra Angel",
+                "type_line": "Creature — Angel",
+                "colors": ["W"],
+                "rarity": "uncommon",
+                "set": "lea",
+            },
+        )
+    ]
+    populate_cards_from_scryfall_data(cards, orm, tmp_path)
+    return cards
+
+
+def test_sort_colors():
+    assert sort_colors(["R", "W"]) == "WR"
+    assert sort_colors("uubx") == "UB"
+    assert sort_colors([]) == ""
+
+
+def test_match_expression_quotes_user_input():
+    assert match_expression('jace "bel', "OR") == (
+        'name : "jace"* AND name : """bel"* AND type : "OR"*'
+    )
+    assert match_expression("  ", None) == ""
+
+
+@pytest.mark.parametrize(
+    "filters, expected",
+    [
+        (
+            {},
+            [
+                "Jace Beleren",
+                "Jace's Erasure",
+                "Lightning Helix",
+                "Serra Angel",
+                "Sol Ring",
+                "Æther Vial",
+            ],
+        ),
+        ({"name": "jace"}, ["Jace Beleren", "Jace's Erasure"]),
+        ({"name": "jac bel"}, ["Jace Beleren"]),
+        ({"name": "Jace's"}, ["Jace's Erasure"]),
+        ({"name": "æth"}, ["Æther Vial"]),
+        ({"type_line": "artifact"}, ["Sol Ring", "Æther Vial"]),
+        ({"type_line": "angel"}, ["Serra Angel"]),
+        ({"name": "jace", "type_line": "planeswalker"}, ["Jace Beleren"]),
+        ({"set_code": "LEA"}, ["Serra Angel", "Sol Ring"]),
+        ({"rarity": "mythic"}, ["Jace Beleren"]),
+        ({"colors": "w"}, ["Serra Angel"]),
+        ({"colors": "RW"}, ["Lightning Helix"]),
+        ({"colors": "WRW"}, ["Lightning Helix"]),
+        ({"colors": "C"}, ["Sol Ring", "Æther Vial"]),
+        ({"colors": "C", "set_code": "lea"}, ["Sol Ring"]),
+        ({"name": "OR"}, []),
+    ],
+)
+def test_search_filters(orm, cards, filters, expected):
+    assert _search(orm, **filters) == expected
+
+
+@pytest.mark.parametrize("colors", ["WX", "CW"])
+def test_search_rejects_unknown_colors(colors):
+    with pytest.raises(ValueError):
+        search_cards_query(colors=colors)
+
+
+@pytest.mark.parametrize(
+    "filters, index",
+    [
+        ({"set_code": "LRW", "rarity": "mythic", "colors": "U"}, "set_code"),
+        ({"set_code": "LRW", "colors": "U"}, "set_code"),
+        ({"rarity": "mythic", "colors": "U"}, "colors"),
+    ],
+)
+def test_search_uses_most_selective_index(orm, cards, filters, index):
+    # ordered like a page, the ORDER BY is what tempts SQLite into the rarity or colour index
+    query = (
+        search_cards_query(**filters)
+        .order_by(Card.name, Card.card_id)
+        .limit(51)
+        .compile(orm.bind, compile_kwargs={"literal_binds": True})
+    )
+
+    plan = orm.execute(text(f"EXPLAIN QUERY PLAN {query}")).all()
+
+    assert [row[-1] for row in plan] == [
+        f"SEARCH card USING INDEX ix_card_{index}_name_card_id ({index}=?)"
+    ]
+    assert _search(orm, **filters) == ["Jace Beleren"]
+
+
+def test_sync_keeps_index_in_sync(orm, cards, tmp_path):
+    jace, *rest = cards
+    renamed = jace.model_copy(update={"name": "Jace, the Mind Sculptor"})
+
+    populate_cards_from_scryfall_data(
+        [renamed, *rest[1:]], orm, tmp_path, delete_missing=True
+    )
+
+    assert _search(orm, name="beleren") == []
+    assert _search(orm, name="sculptor") == ["Jace, the Mind Sculptor"]
+    # soft deleted
+    assert _search(orm, name="erasure") == []
+
+    populate_cards_from_scryfall_data(cards, orm, tmp_path)
+
+    assert _search(orm, name="erasure") == ["Jace's Erasure"]
+
+
+def test_multi_faced_card_colors(orm, scryfall_card_json, tmp_path):
+    face = {"name": "Front", "object": "card_face", "mana_cost": "{G}", "colors": ["G"]}
+    card = ScryfallCard.model_validate(
+        scryfall_card_json(
+            colors=None,
+            card_faces=[face, {**face, "name": "Back", "colors": ["B"]}],
+        )
+    )
+
+    populate_cards_from_scryfall_data([card], orm, tmp_path)
+
+    assert orm.scalar(select(Card.colors)) == "BG"
+
+
+def test_rebuild_search_index(orm, cards):
+    rebuild_search_index(orm)
+
+    assert _search(orm, name="jace") == ["Jace Beleren", "Jace's Erasure"]
+
+
+_WORDS = (
+    "angel ancient bolt dragon elf goblin knight lightning mind ring serra sol storm "
+    "sword vial wall wrath zombie shadow fire ice grave lord titan spirit"
+).split()
+
+
+@pytest.mark.slow
+def test_search_latency(orm, scryfall_card_json, tmp_path):
+    # roughly the size of the scryfall default cards bulk file
+    n_cards = 100_000
+    rng = random.Random(0)
+    cards = [
+        ScryfallCard.model_validate(
+            scryfall_card_json(
+                name=" ".join(rng.sample(_WORDS, 3)) + f" {i}",
+                type_line=rng.choice(
+                    (
+                        "Creature — Elf",
+                        "Instant",
+                        "Artifact",
+                        "Legendary Creature — Dragon",
+                    )
+                ),
+                colors=rng.sample("WUBRG", rng.randint(0, 2)),
+                rarity=rng.choice(("common", "uncommon", "rare", "mythic")),
+                set=f"s{i % 500:02d}",
+            )
+        )
+        for i in range(n_cards)
+    ]
+    populate_cards_from_scryfall_data(cards, orm, tmp_path)
+
+    searches: list[dict[str, str]] = [
+        {"name": "dragon"},
+        {"name": "dr"},
+        {"name": "wrath titan"},
+        {"name": "nothing"},
+        {"type_line": "legendary", "colors": "UB"},
+        {"set_code": "s42"},
+        {"set_code": "s42", "rarity": "mythic", "colors": "C"},
+        {"rarity": "mythic", "colors": "WUB"},
+        {"colors": "WU"},
+        {"name": "zombie", "colors": "C"},
+        {"name": "sword", "type_line": "artifact", "rarity": "rare"},
+    ]
+    for filters in searches:
+        timings = []
+        for _ in range(10):
+            start = time.perf_counter()
+            _search(orm, **filters)
+            timings.append((time.perf_counter() - start) * 1000)
+        median_ms = sorted(timings)[len(timings) // 2]
+        print(f"{filters}: {median_ms:.2f}ms")
+        assert median_ms < 50
@@ -0,0 +1,184 @@
+import json
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import insert
+
+from mtg_scanner.db.card_snapshot import CardSnapshot, SnapshotCard, load_snapshot, main
+from mtg_scanner.db.models import Card
+
+
+@pytest.fixture
+def snapshot_rows(orm) -> list[dict[str, object]]:
+    """
+    Three live printings across two sets, one without a set, and a soft deleted card
+    """
+    now = datetime.now(timezone.utc)
+    rows: list[dict[str, object]] = [
+        {"name": "Llanowar Elves", "set_code": "dom", "colors": "G"},
+        {"name": "Llanowar Elves", "set_code": "m19", "colors": "G"},
+        {"name": "Æther Vial", "set_code": "m19", "colors": ""},
+        {"name": "Plains", "set_code": None, "colors": None},
+        {"name": "Deleted", "set_code": "dom", "deleted_at": now},
+    ]
+    for row in rows:
+        row.update(
+            scryfall_id=str(uuid.uuid4()),
+            rarity="common",
+            created_at=now,
+            updated_at=now,
+        )
+    orm.execute(insert(Card), rows)
+    orm.commit()
+    return rows
+
+
+def _names(cards: list[SnapshotCard]) -> list[str]:
+    return [card.name for card in cards]
+
+
+def test_snapshot_from_db(orm, snapshot_rows, tmp_path):
+    CardSnapshot.from_db(orm).save(tmp_path / "snapshot")
+    snapshot = CardSnapshot.load(tmp_path / "snapshot")
+
+    # soft deleted cards are left out, the rest are ordered by name
+    assert len(snapshot) == 4
+    assert _names([snapshot.card(row) for row in range(len(snapshot))]) == [
+        "Llanowar Elves",
+        "Llanowar Elves",
+        "Plains",
+        "Æther Vial",
+    ]
+    vial = snapshot.by_scryfall_id(str(snapshot_rows[2]["scryfall_id"]))
+    assert vial is not None
+    assert vial.name == "Æther Vial"
+    assert vial.set_code == "m19"
+    assert vial.colors == ""
+    assert vial.mana_cost is None
+    assert vial.card_id is not None
+    assert snapshot.by_scryfall_id(str(snapshot_rows[4]["scryfall_id"])) is None
+
+    assert [card.set_code for card in snapshot.by_name("Llanowar Elves")] == [
+        "dom",
+        "m19",
+    ]
+    assert _names(snapshot.by_set("m19")) == ["Llanowar Elves", "Æther Vial"]
+    assert _names(snapshot.by_set("dom")) == ["Llanowar Elves"]
+    assert snapshot.by_name("Missing") == []
+    assert snapshot.by_set("zzz") == []
+
+    ids = [str(row["scryfall_id"]) for row in snapshot_rows]
+    assert snapshot.names([ids[3], ids[4], "missing"]) == {ids[3]: "Plains"}
+
+    with pytest.raises(ValueError):
+        snapshot.rows("rarity", "common")
+
+
+def test_snapshot_interns_strings():
+    snapshot = CardSnapshot.build(
+        {"name": "Island", "rarity": "common", "set_code": f"s{i % 3}"}
+        for i in range(1000)
+    )
+
+    assert snapshot.columns["name"].n_values == 1
+    assert snapshot.columns["set_code"].n_values == 3
+    assert len(snapshot.by_set("s1")) == 333
+    # nothing came from the db
+    assert snapshot.card(0).card_id is None
+
+
+def test_snapshot_from_bulk_file(write_bulk_file, scryfall_card_json, tmp_path):
+    cards = [
+        scryfall_card_json(name="Shock", set="m19"),
+        scryfall_card_json(name="Bolt", set="lea"),
+    ]
+    (tmp_path / f"{cards[0]['id']}.jpg").touch()
+
+    snapshot = CardSnapshot.from_bulk_file(write_bulk_file(cards), tmp_path)
+
+    assert _names([snapshot.card(row) for row in range(len(snapshot))]) == [
+        "Bolt",
+        "Shock",
+    ]
+    shock = snapshot.by_scryfall_id(str(cards[0]["id"]))
+    assert shock is not None
+    assert shock.set_code == "m19"
+    assert shock.colors == "WU"
+    assert shock.type == "Creature — Bird"
+    assert shock.card_art_uri == f"{cards[0]['id']}.jpg"
+    assert snapshot.by_name("Bolt")[0].card_art_uri is None
+
+
+def test_save_replaces_snapshot(orm, snapshot_rows, tmp_path):
+    snapshot_dir = tmp_path / "snapshot"
+    CardSnapshot.from_db(orm).save(snapshot_dir)
+    old = CardSnapshot.load(snapshot_dir)
+
+    CardSnapshot.build([{"name": "New", "rarity": "rare"}]).save(snapshot_dir)
+
+    assert _names(CardSnapshot.load(snapshot_dir).by_name("New")) == ["New"]
+    # still readable from the replaced files
+    assert len(old.by_name("Llanowar Elves")) == 2
+    assert [path.name for path in tmp_path.iterdir()] == ["snapshot"]
+
+
+def test_load_snapshot_missing_or_old(tmp_path):
+    assert load_snapshot(tmp_path / "missing") is None
+
+    snapshot_dir = tmp_path / "snapshot"
+    CardSnapshot.build([{"name": "Old", "rarity": "common"}]).save(snapshot_dir)
+    meta = json.loads((snapshot_dir / "meta.json").read_text())
+    (snapshot_dir / "meta.json").write_text(json.dumps({**meta, "version": 0}))
+
+    assert load_snapshot(snapshot_dir) is None
+
+
+def test_main_exports_bulk_file(write_bulk_file, scryfall_card_json, tmp_path):
+    bulk_file = write_bulk_file([scryfall_card_json(name="Shock")])
+
+    exit_code = main(
+        [
+            "--bulk_file",
+            str(bulk_file),
+            "--image_dir",
+            str(tmp_path),
+            "--snapshot_dir",
+            str(tmp_path / "snapshot"),
+        ]
+    )
+
+    assert exit_code == 0
+    assert _names(CardSnapshot.load(tmp_path / "snapshot").by_name("Shock")) == [
+        "Shock"
+    ]
+
+
+@pytest.mark.slow
+def test_snapshot_load_benchmark(benchmark, tmp_path):
+    """
+    A snapshot the size of the full card data loads and answers a lookup in milliseconds
+    """
+    n_cards = 100_000
+    CardSnapshot.build(
+        {
+            "name": f"Card {i // 3:06d}",
+            "scryfall_id": str(uuid.UUID(int=i)),
+            "set_code": f"s{i % 500:03d}",
+            "rarity": "common",
+            "type": "Creature — Elf",
+            "mana_cost": "{1}{G}",
+        }
+        for i in range(n_cards)
+    ).save(tmp_path / "snapshot")
+    last_id = str(uuid.UUID(int=n_cards - 1))
+
+    def _load_and_lookup() -> SnapshotCard | None:
+        return CardSnapshot.load(tmp_path / "snapshot").by_scryfall_id(last_id)
+
+    result = benchmark(_load_and_lookup)
+
+    card = _load_and_lookup()
+    assert card is not None
+    assert card.name == f"Card {(n_cards - 1) // 3:06d}"
+    assert result.p50_ms < 10
@@ -0,0 +1,126 @@
+import time
+
+import pytest
+from sqlalchemy import func, select
+
+from mtg_scanner.db.models import Card
+from mtg_scanner.db.sync_scryfall_data import (
+    SyncResult,
+    populate_cards_from_scryfall_data,
+)
+from mtg_scanner.scryfall_data.model import ScryfallCard
+
+
+def _cards(scryfall_card_json, n: int) -> list[ScryfallCard]:
+    return [ScryfallCard.model_validate(scryfall_card_json()) for _ in range(n)]
+
+
+def test_populate_inserts_all_cards(orm, scryfall_card_json, tmp_path):
+    cards = _cards(scryfall_card_json, 7)
+
+    result = populate_cards_from_scryfall_data(cards, orm, tmp_path, batch_size=3)
+
+    assert result == SyncResult(processed=7, upserted=7)
+    assert orm.scalar(select(func.count()).select_from(Card)) == 7
+
+
+def test_populate_only_updates_changed_rows(orm, scryfall_card_json, tmp_path):
+    unchanged, changed = _cards(scryfall_card_json, 2)
+    populate_cards_from_scryfall_data([unchanged, changed], orm, tmp_path)
+    before = {card.scryfall_id: card.updated_at for card in orm.scalars(select(Card))}
+    orm.expunge_all()
+
+    changed = changed.model_copy(update={"name": "Renamed"})
+    result = populate_cards_from_scryfall_data([unchanged, changed], orm, tmp_path)
+
+    assert result == SyncResult(processed=2, upserted=1, unchanged=1)
+
+    after = {card.scryfall_id: card for card in orm.scalars(select(Card))}
+    assert len(after) == 2
+    assert after[changed.id].name == "Renamed"
+    assert after[changed.id].updated_at > before[changed.id]
+    assert after[unchanged.id].updated_at == before[unchanged.id]
+
+
+def test_populate_links_existing_images(orm, scryfall_card_json, tmp_path):
+    with_image, without_image = _cards(scryfall_card_json, 2)
+    (tmp_path / f"{with_image.id}.jpg").touch()
+
+    populate_cards_from_scryfall_data([with_image, without_image], orm, tmp_path)
+
+    art = dict(orm.execute(select(Card.scryfall_id, Card.card_art_uri)).tuples().all())
+    assert art == {with_image.id: f"{with_image.id}.jpg", without_image.id: None}
+
+
+def test_populate_soft_deletes_and_restores(orm, scryfall_card_json, tmp_path):
+    kept, removed = _cards(scryfall_card_json, 2)
+    populate_cards_from_scryfall_data([kept, removed], orm, tmp_path)
+
+    result = populate_cards_from_scryfall_data(
+        [kept], orm, tmp_path, delete_missing=True
+    )
+
+    assert result == SyncResult(processed=1, unchanged=1, deleted=1)
+    deleted = dict(
+        orm.execute(select(Card.scryfall_id, Card.deleted_at)).tuples().all()
+    )
+    assert deleted[kept.id] is None
+    assert deleted[removed.id] is not None
+
+    result = populate_cards_from_scryfall_data(
+        [kept, removed], orm, tmp_path, delete_missing=True
+    )
+
+    assert result == SyncResult(processed=2, upserted=1, unchanged=1)
+    assert orm.scalar(select(func.count()).where(Card.deleted_at.is_not(None))) == 0
+
+
+def test_populate_reports_progress(orm, scryfall_card_json, tmp_path):
+    progress: list[SyncResult] = []
+
+    populate_cards_from_scryfall_data(
+        _cards(scryfall_card_json, 7),
+        orm,
+        tmp_path,
+        batch_size=3,
+        on_progress=progress.append,
+    )
+
+    assert [update.processed for update in progress] == [3, 6, 7]
+    assert progress[-1] == SyncResult(processed=7, upserted=7)
+
+
+def test_populate_rejects_invalid_batch_size(orm, tmp_path):
+    with pytest.raises(ValueError):
+        populate_cards_from_scryfall_data([], orm, tmp_path, batch_size=0)
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("batch_size", (10, 100, 1000))
+def test_benchmark_populate(orm, scryfall_card_json, tmp_path, batch_size):
+    n_cards = 30_000
+    cards = _cards(scryfall_card_json, n_cards)
+
+    start = time.perf_counter()
+    populate_cards_from_scryfall_data(cards, orm, tmp_path, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+
+    assert orm.scalar(select(func.count()).select_from(Card)) == n_cards
+    print(f"batch_size={batch_size}: {n_cards / elapsed:,.0f} cards/sec")
+
+
+@pytest.mark.slow
+def test_benchmark_noop_resync(orm, scryfall_card_json, tmp_path):
+    n_cards = 100_000
+    cards = _cards(scryfall_card_json, n_cards)
+    populate_cards_from_scryfall_data(cards, orm, tmp_path, delete_missing=True)
+
+    start = time.perf_counter()
+    result = populate_cards_from_scryfall_data(
+        cards, orm, tmp_path, delete_missing=True
+    )
+    elapsed = time.perf_counter() - start
+
+    assert result == SyncResult(processed=n_cards, unchanged=n_cards)
+    print(f"no-op resync of {n_cards:,} cards: {elapsed:.2f}s")
+    assert elapsed < 10
@@ -0,0 +1,20 @@
+import uuid
+from pathlib import Path
+
+import cv2 as cv
+import pytest
+
+
+@pytest.fixture
+def card_image_dir(tmp_path, synthetic_card) -> tuple[Path, list[str]]:
+    """
+    Directory of synthetic scryfall images named `<scryfall_id>.jpg`, and the ids in seed order
+    """
+    image_dir = tmp_path / "image_data"
+    image_dir.mkdir()
+    ids = []
+    for seed in range(20):
+        scryfall_id = str(uuid.UUID(int=seed))
+        cv.imwrite(str(image_dir / f"{scryfall_id}.jpg"), synthetic_card(seed))
+        ids.append(scryfall_id)
+    return image_dir, ids
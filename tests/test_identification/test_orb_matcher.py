@@ -0,0 +1,79 @@
+import time
+
+import cv2 as cv
+import numpy as np
+import numpy.typing as npt
+import pytest
+
+from mtg_scanner.scanner.identification.orb_matcher import OrbIndex, extract_features
+
+
+def _angled_photo_of(card: npt.NDArray[np.uint8], seed: int) -> npt.NDArray[np.uint8]:
+    """stand in for a cropped photo taken at a slight angle with a glare patch"""
+    rng = np.random.default_rng(seed)
+    h, w = card.shape[:2]
+    src = np.array([[0, 0], [w, 0], [w, h], [0, h]], dtype=np.float32)
+    dst = (src + rng.uniform(-0.06, 0.06, size=(4, 2)) * [w, h]).astype(np.float32)
+    warp = cv.getPerspectiveTransform(src, dst)
+    photo = cv.warpPerspective(card, warp, (w, h), borderMode=cv.BORDER_REPLICATE)
+    glare = np.zeros_like(photo)
+    center = (int(rng.integers(0, w)), int(rng.integers(0, h)))
+    cv.circle(glare, center, w // 6, (120, 120, 120), -1)
+    glare = cv.GaussianBlur(glare, (0, 0), w / 20)
+    return np.asarray(cv.add(photo, glare), dtype=np.uint8)
+
+
+def test_extract_features_blank_image():
+    points, descriptors = extract_features(np.zeros((100, 100, 3), np.uint8))
+
+    assert points.shape == (0, 2)
+    assert descriptors.shape == (0, 32)
+
+
+def test_query_finds_card(card_image_dir, synthetic_card):
+    image_dir, ids = card_image_dir
+    index = OrbIndex.build(image_dir)
+
+    matches = index.query(_angled_photo_of(synthetic_card(5), seed=0), k=3)
+
+    assert matches[0].scryfall_id == ids[5]
+    assert matches[0].inliers > 0
+
+
+def test_save_and_load(card_image_dir, synthetic_card, tmp_path):
+    image_dir, ids = card_image_dir
+    index = OrbIndex.build(image_dir)
+    index.save(tmp_path / "index")
+
+    loaded = OrbIndex.load(tmp_path / "index")
+
+    assert loaded.ids.tolist() == index.ids.tolist()
+    assert np.array_equal(loaded.descriptors, index.descriptors)
+    assert loaded.query(synthetic_card(2), k=1)[0].scryfall_id == ids[2]
+
+
+@pytest.mark.slow
+def test_benchmark_recall_and_latency(tmp_path, synthetic_card):
+    n_cards, n_queries = 500, 100
+    for seed in range(n_cards):
+        cv.imwrite(str(tmp_path / f"{seed}.jpg"), synthetic_card(seed))
+    index = OrbIndex.build(tmp_path)
+    # build the LSH index up front so it is not counted in the first query
+    index.matcher
+
+    hits = 0
+    timings = []
+    for seed in range(n_queries):
+        photo = _angled_photo_of(synthetic_card(seed), seed)
+        start = time.perf_counter()
+        matches = index.query(photo, k=1)
+        timings.append(time.perf_counter() - start)
+        hits += bool(matches) and matches[0].scryfall_id == str(seed)
+
+    recall = hits / n_queries
+    p50, p99 = np.percentile(timings, [50, 99]) * 1000
+    print(
+        f"ORB over {n_cards} cards: recall@1 {recall:.2f}, "
+        f"latency p50 {p50:.1f}ms p99 {p99:.1f}ms"
+    )
+    assert recall >= 0.9
@@ -0,0 +1,89 @@
+import time
+
+import cv2 as cv
+import numpy as np
+import numpy.typing as npt
+import pytest
+
+from mtg_scanner.scanner.identification.phash_index import (
+    HashMethod,
+    PHashIndex,
+    hamming_distances,
+)
+
+
+def _photo_of(card: npt.NDArray[np.uint8]) -> npt.NDArray[np.uint8]:
+    """rough stand in for a cropped scan, rescaled, blurred and brightened"""
+    scan = cv.resize(card, (300, 420), interpolation=cv.INTER_LINEAR)
+    scan = cv.GaussianBlur(scan, (5, 5), 0)
+    return np.asarray(cv.convertScaleAbs(scan, alpha=1.1, beta=10), dtype=np.uint8)
+
+
+def test_hamming_distances():
+    hashes = np.array([[0b0000_0000, 0], [0b1111_1111, 1], [0b1010_0000, 3]], np.uint8)
+
+    distances = hamming_distances(hashes, np.array([0, 0], np.uint8))
+
+    assert distances.tolist() == [0, 9, 4]
+
+
+@pytest.mark.parametrize("method", HashMethod)
+def test_query_finds_card(card_image_dir, synthetic_card, method):
+    image_dir, ids = card_image_dir
+    index = PHashIndex.build(image_dir, method)
+
+    matches = index.query(_photo_of(synthetic_card(3)), k=3)
+
+    assert len(index) == len(ids)
+    assert [match.scryfall_id for match in matches][0] == ids[3]
+    assert matches == sorted(matches, key=lambda match: match.distance)
+
+
+def test_save_and_load_memory_mapped(card_image_dir, synthetic_card, tmp_path):
+    image_dir, ids = card_image_dir
+    index = PHashIndex.build(image_dir)
+    index.save(tmp_path / "index")
+
+    loaded = PHashIndex.load(tmp_path / "index")
+
+    assert isinstance(loaded.hashes, np.memmap)
+    assert loaded.ids.tolist() == index.ids.tolist()
+    assert loaded.query(synthetic_card(7), k=1) == index.query(synthetic_card(7), k=1)
+
+
+def test_build_skips_unreadable_images(card_image_dir):
+    image_dir, ids = card_image_dir
+    (image_dir / "broken.jpg").write_bytes(b"not a jpeg")
+
+    index = PHashIndex.build(image_dir)
+
+    assert sorted(index.ids.tolist()) == sorted(ids)
+
+
+def test_query_empty_index():
+    index = PHashIndex(np.array([], np.str_), np.empty((0, 8), np.uint8))
+
+    assert index.query(np.zeros((10, 10, 3), np.uint8)) == []
+
+
+@pytest.mark.slow
+def test_benchmark_query(tmp_path):
+    n_cards = 100_000
+    rng = np.random.default_rng(0)
+    index = PHashIndex(
+        np.array([str(i) for i in range(n_cards)]),
+        rng.integers(0, 256, size=(n_cards, 8), dtype=np.uint8),
+    )
+    index.save(tmp_path)
+    index = PHashIndex.load(tmp_path)
+    queries = index.hashes[rng.integers(0, n_cards, size=200)]
+
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        index.query_hash(query, k=5)
+        timings.append(time.perf_counter() - start)
+
+    p50, p99 = np.percentile(timings, [50, 99]) * 1000
+    print(f"query over {n_cards:,} hashes: p50 {p50:.2f}ms, p99 {p99:.2f}ms")
+    assert p50 < 20
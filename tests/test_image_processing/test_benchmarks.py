@@ -0,0 +1,64 @@
+"""
+Latency and memory of the image processing functions over synthetic photos,
+compared against `tests/data/benchmark_baseline.json`. Run with `--runslow`,
+add `--update-benchmarks` to save new baselines after an intended change.
+"""
+
+from collections.abc import Callable
+
+import cv2.typing as ct
+import pytest
+
+from mtg_scanner.scanner.image_processing.card_detection import (
+    DEFAULT_DETECTION_MAX_DIM,
+    blackout_outside_contour,
+    crop_img_to_contour,
+    detect_card_edge,
+    detect_card_edges,
+    extract_card,
+    normalize_card,
+)
+
+RESOLUTIONS = {
+    "0.3MP": (480, 640),
+    "1.9MP": (1200, 1600),
+    "12MP": (3000, 4000),
+}
+# background colour and sensor noise
+BACKGROUNDS = {
+    "white": ((235, 235, 235), 0.0),
+    "beige": ((170, 190, 210), 0.0),
+    "noisy": ((235, 235, 235), 12.0),
+}
+
+Operation = Callable[[ct.MatLike, ct.MatLike], object]
+
+OPERATIONS: dict[str, Operation] = {
+    "detect_card_edge": lambda photo, contour: detect_card_edge(photo),
+    "detect_card_edge_downscaled": lambda photo, contour: detect_card_edge(
+        photo, max_dim=DEFAULT_DETECTION_MAX_DIM
+    ),
+    "detect_card_edges": lambda photo, contour: detect_card_edges(photo),
+    "blackout_outside_contour": blackout_outside_contour,
+    "crop_img_to_contour": crop_img_to_contour,
+    "extract_card": extract_card,
+    "normalize_card": normalize_card,
+}
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("operation", OPERATIONS)
+@pytest.mark.parametrize("background", BACKGROUNDS)
+@pytest.mark.parametrize("resolution", RESOLUTIONS)
+def test_image_processing_benchmark(
+    benchmark, synthetic_photo, resolution: str, background: str, operation: str
+) -> None:
+    width, height = RESOLUTIONS[resolution]
+    color, noise = BACKGROUNDS[background]
+    photo, _ = synthetic_photo(
+        0, width=width, height=height, background=color, noise=noise
+    )
+    contour = detect_card_edge(photo)
+    fn = OPERATIONS[operation]
+
+    benchmark(lambda: fn(photo, contour))
@@ -1,12 +1,32 @@
+import time
+import tracemalloc
+from collections.abc import Callable
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Self
 
 import cv2 as cv
 import cv2.typing as ct
+import numpy as np
+import numpy.typing as npt
 import pytest
 
-from mtg_scanner.scanner.image_processing.card_detection import detect_card_edge
+from mtg_scanner.scanner.image_processing.card_detection import (
+    CARD_HEIGHT,
+    CARD_WIDTH,
+    DEFAULT_DETECTION_MAX_DIM,
+    blackout_outside_contour,
+    contour_areas,
+    contour_aspect_ratios,
+    crop_img_to_contour,
+    detect_card_edge,
+    detect_card_edges,
+    extract_card,
+    extract_cards,
+    fit_card_quad,
+    normalize_card,
+    warp_card,
+)
 
 DATA_DIR = Path(__file__).parent.parent / "data" / "input"
 EXPECTED_DIR = Path(__file__).parent.parent / "data" / "expected"
@@ -47,13 +67,16 @@ class _Corners:
         ),
     ),
 )
-def test_edge_detection(img_name: str, expected_corners: _Corners) -> None:
+@pytest.mark.parametrize("max_dim", (None, 400, 200))
+def test_edge_detection(
+    img_name: str, expected_corners: _Corners, max_dim: int | None
+) -> None:
     # Load the image
     image = cv.imread(str(DATA_DIR / img_name))
     if image is None:
         raise FileNotFoundError("Image not found")
 
-    card_bounds = detect_card_edge(image)
+    card_bounds = detect_card_edge(image, max_dim=max_dim)
 
     try:
         assert _Corners.from_contour(card_bounds) == expected_corners
@@ -92,3 +115,396 @@ def test_edge_detection(img_name: str, expected_corners: _Corners) -> None:
         raise AssertionError(
             f"Card bounds do not match expected. Result of bounds on image saved to {out_path}"
         ) from err
+
+
+def _corner_error(contour: ct.MatLike, expected: _Corners) -> int:
+    corners = _Corners.from_contour(contour)
+    return max(
+        abs(a - b)
+        for actual, wanted in zip(
+            (
+                corners.top_left,
+                corners.top_right,
+                corners.bottom_left,
+                corners.bottom_right,
+            ),
+            (
+                expected.top_left,
+                expected.top_right,
+                expected.bottom_left,
+                expected.bottom_right,
+            ),
+        )
+        for a, b in zip(actual, wanted)
+    )
+
+
+def _median_time_ms(fn: Callable[[], object], runs: int = 15) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def _median_ms(image: ct.MatLike, max_dim: int | None) -> float:
+    return _median_time_ms(lambda: detect_card_edge(image, max_dim=max_dim))
+
+
+@pytest.mark.slow
+def test_downscaled_edge_detection_benchmark(synthetic_photo) -> None:
+    fixture_image = cv.imread(str(DATA_DIR / "card_on_white.jpg"))
+    fixture_expected = _Corners(
+        top_left=(90, 151),
+        top_right=(535, 151),
+        bottom_left=(90, 754),
+        bottom_right=(535, 754),
+    )
+    # 12MP, the size of a typical phone photo
+    photo, (x, y, w, h) = synthetic_photo(0, width=3000, height=4000, noise=10)
+    photo_expected = _Corners(
+        top_left=(x, y),
+        top_right=(x + w, y),
+        bottom_left=(x, y + h),
+        bottom_right=(x + w, y + h),
+    )
+
+    for name, image, expected in (
+        ("card_on_white.jpg", fixture_image, fixture_expected),
+        ("12MP synthetic", photo, photo_expected),
+    ):
+        max_dim = min(DEFAULT_DETECTION_MAX_DIM, max(image.shape[:2]) // 2)
+        full_ms = _median_ms(image, None)
+        downscaled_ms = _median_ms(image, max_dim)
+        full_error = _corner_error(detect_card_edge(image), expected)
+        downscaled_error = _corner_error(
+            detect_card_edge(image, max_dim=max_dim), expected
+        )
+        print(
+            f"{name}: full {full_ms:.1f}ms (corner error {full_error}px), "
+            f"max_dim={max_dim} {downscaled_ms:.1f}ms (corner error {downscaled_error}px), "
+            f"{full_ms / downscaled_ms:.1f}x"
+        )
+        assert downscaled_error <= full_error
+    assert downscaled_ms < full_ms
+
+
+def _rotate_onto_photo(
+    card: npt.NDArray[np.uint8], angle: float, offset: tuple[int, int]
+) -> npt.NDArray[np.uint8]:
+    """`card` rotated by `angle` degrees about its top left corner, moved by `offset` onto a white background"""
+    photo = np.full((1000, 1000, 3), 235, dtype=np.uint8)
+    corners = np.array(
+        [
+            [0, 0],
+            [card.shape[1], 0],
+            [card.shape[1], card.shape[0]],
+            [0, card.shape[0]],
+        ],
+        dtype=np.float32,
+    )
+    rotation = cv.getRotationMatrix2D((0, 0), angle, 1.0)
+    rotated = cv.transform(corners[None], rotation)[0] + offset
+    warp = cv.getAffineTransform(corners[:3], rotated[:3].astype(np.float32))
+    cv.warpAffine(
+        card,
+        warp,
+        (photo.shape[1], photo.shape[0]),
+        dst=photo,
+        borderMode=cv.BORDER_TRANSPARENT,
+    )
+    return photo
+
+
+@pytest.fixture
+def rotated_card_photo(synthetic_card) -> tuple[npt.NDArray[np.uint8], ct.MatLike]:
+    """a card rotated on a white background and its contour"""
+    photo = _rotate_onto_photo(synthetic_card(0), 20, (300, 150))
+    return photo, detect_card_edge(photo)
+
+
+def test_extract_card_matches_blackout_and_crop(rotated_card_photo) -> None:
+    photo, contour = rotated_card_photo
+
+    expected = crop_img_to_contour(blackout_outside_contour(photo, contour), contour)
+
+    np.testing.assert_array_equal(extract_card(photo, contour), expected)
+
+
+def test_extract_card_reuses_buffers(rotated_card_photo) -> None:
+    photo, contour = rotated_card_photo
+    expected = extract_card(photo, contour)
+    # larger than needed and full of stale data from a "previous frame"
+    out = np.full((1000, 1000, 3), 99, dtype=np.uint8)
+    mask = np.full((1000, 1000), 99, dtype=np.uint8)
+
+    card = extract_card(photo, contour, out=out, mask=mask)
+
+    assert np.shares_memory(card, out)
+    np.testing.assert_array_equal(card, expected)
+
+
+def test_extract_card_ignores_small_buffers(rotated_card_photo) -> None:
+    photo, contour = rotated_card_photo
+    out = np.zeros((10, 10, 3), dtype=np.uint8)
+
+    card = extract_card(photo, contour, out=out, mask=np.zeros((10, 10), np.uint8))
+
+    assert not np.shares_memory(card, out)
+    np.testing.assert_array_equal(card, extract_card(photo, contour))
+
+
+@pytest.mark.slow
+def test_extract_card_benchmark(synthetic_photo) -> None:
+    photo, _ = synthetic_photo(0, width=3000, height=4000)
+    contour = detect_card_edge(photo, max_dim=DEFAULT_DETECTION_MAX_DIM)
+    out = np.empty_like(photo)
+    mask = np.empty(photo.shape[:2], dtype=np.uint8)
+
+    def _blackout_and_crop() -> None:
+        crop_img_to_contour(blackout_outside_contour(photo, contour), contour)
+
+    def _extract() -> None:
+        extract_card(photo, contour, out=out, mask=mask)
+
+    results = {}
+    for name, fn in (("blackout + crop", _blackout_and_crop), ("extract", _extract)):
+        timings = []
+        for _ in range(10):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = (float(np.median(timings)), peak)
+        print(f"{name}: {results[name][0]:.1f}ms, peak {peak / 2**20:.1f}MiB allocated")
+
+    assert results["extract"][0] < results["blackout + crop"][0]
+    assert results["extract"][1] < results["blackout + crop"][1]
+
+
+def _photo_of_card(
+    card: npt.NDArray[np.uint8], corners: list[tuple[int, int]]
+) -> npt.NDArray[np.uint8]:
+    """`card` perspective warped onto a white background with its corners (tl, tr, br, bl) at `corners`"""
+    height, width = card.shape[:2]
+    source = np.array(
+        [[0, 0], [width, 0], [width, height], [0, height]], dtype=np.float32
+    )
+    transform = cv.getPerspectiveTransform(source, np.array(corners, dtype=np.float32))
+    photo = np.full((1200, 1200, 3), 235, dtype=np.uint8)
+    cv.warpPerspective(
+        card,
+        transform,
+        (photo.shape[1], photo.shape[0]),
+        dst=photo,
+        borderMode=cv.BORDER_TRANSPARENT,
+    )
+    return photo
+
+
+@pytest.mark.parametrize(
+    "corners",
+    (
+        pytest.param([(200, 150), (688, 150), (688, 830), (200, 830)], id="upright"),
+        pytest.param([(400, 100), (860, 270), (630, 910), (170, 740)], id="rotated"),
+        pytest.param([(320, 180), (760, 200), (880, 900), (200, 880)], id="tilted"),
+        pytest.param([(150, 700), (150, 212), (830, 212), (830, 700)], id="sideways"),
+    ),
+)
+def test_normalize_card(synthetic_card, corners: list[tuple[int, int]]) -> None:
+    card = synthetic_card(0)
+    photo = _photo_of_card(card, corners)
+
+    normalized = normalize_card(photo, detect_card_edge(photo))
+
+    assert normalized.shape == (CARD_HEIGHT, CARD_WIDTH, 3)
+    # a skewed or background filled crop would be far off, resampling only blurs the edges of the shapes
+    # a sideways card can only be turned upright, it may still be upside down
+    difference = min(
+        (
+            np.asarray(cv.absdiff(normalized, expected), dtype=np.uint8)
+            for expected in (card, card[::-1, ::-1])
+        ),
+        key=lambda diff: float(np.mean(diff)),
+    )
+    assert float(np.median(difference)) <= 2
+    assert float(np.mean(difference)) < 12
+
+
+def test_warp_card_shrinks_large_cards(synthetic_card) -> None:
+    # 3x the output size, a straight bilinear warp would alias the fine detail
+    card = synthetic_card(0, width=CARD_WIDTH * 3, height=CARD_HEIGHT * 3)
+    photo = np.full((CARD_HEIGHT * 3 + 200, CARD_WIDTH * 3 + 200, 3), 235, np.uint8)
+    photo[100 : 100 + card.shape[0], 100 : 100 + card.shape[1]] = card
+    x1, y1 = 100 + card.shape[1], 100 + card.shape[0]
+    quad = np.array([(100, 100), (x1, 100), (x1, y1), (100, y1)], dtype=np.float32)
+
+    warped = warp_card(photo, quad)
+
+    expected = cv.resize(card, (CARD_WIDTH, CARD_HEIGHT), interpolation=cv.INTER_AREA)
+    target = np.array(
+        [(0, 0), (CARD_WIDTH, 0), (CARD_WIDTH, CARD_HEIGHT), (0, CARD_HEIGHT)],
+        dtype=np.float32,
+    )
+    bilinear = cv.warpPerspective(
+        photo,
+        cv.getPerspectiveTransform(quad, target),
+        (CARD_WIDTH, CARD_HEIGHT),
+        flags=cv.INTER_LINEAR,
+    )
+    assert warped.shape == (CARD_HEIGHT, CARD_WIDTH, 3)
+    difference = np.asarray(cv.absdiff(warped, expected), dtype=np.uint8)
+    bilinear_difference = np.asarray(cv.absdiff(bilinear, expected), dtype=np.uint8)
+    assert float(np.mean(difference)) < 0.8 * float(np.mean(bilinear_difference))
+
+
+def test_fit_card_quad_orders_corners(synthetic_card) -> None:
+    photo = _photo_of_card(
+        synthetic_card(0), [(400, 100), (860, 270), (630, 910), (170, 740)]
+    )
+
+    quad = fit_card_quad(detect_card_edge(photo))
+
+    expected = np.array([(400, 100), (860, 270), (630, 910), (170, 740)])
+    assert np.abs(quad - expected).max() <= 3
+
+
+@pytest.fixture
+def card_grid_photo(synthetic_card):
+    """`card_grid_photo(width, height)` a 3x3 page of cards, returns the photo and each card's x, y, w, h"""
+
+    def _card_grid_photo(
+        width: int = 1200, height: int = 1600
+    ) -> tuple[npt.NDArray[np.uint8], list[tuple[int, int, int, int]]]:
+        photo = np.full((height, width, 3), 235, dtype=np.uint8)
+        card_w = int(width * 0.27)
+        card_h = int(card_w * 88 / 63)
+        gap_x, gap_y = (width - 3 * card_w) // 4, (height - 3 * card_h) // 4
+        boxes = []
+        for row in range(3):
+            for col in range(3):
+                x = gap_x + col * (card_w + gap_x)
+                y = gap_y + row * (card_h + gap_y)
+                photo[y : y + card_h, x : x + card_w] = synthetic_card(
+                    row * 3 + col, card_w, card_h
+                )
+                boxes.append((x, y, card_w, card_h))
+        return photo, boxes
+
+    return _card_grid_photo
+
+
+@pytest.mark.parametrize("max_dim", (None, 800))
+def test_detect_card_edges_finds_every_card(card_grid_photo, max_dim) -> None:
+    photo, boxes = card_grid_photo()
+
+    contours = detect_card_edges(photo, max_dim=max_dim)
+
+    # in reading order
+    assert len(contours) == 9
+    found = np.array([cv.boundingRect(contour) for contour in contours])
+    assert np.abs(found - np.array(boxes)).max() <= 4
+
+
+def test_detect_card_edges_single_card() -> None:
+    image = cv.imread(str(DATA_DIR / "card_on_white.jpg"))
+
+    contours = detect_card_edges(image)
+
+    assert [cv.boundingRect(contour) for contour in contours] == [
+        cv.boundingRect(detect_card_edge(image))
+    ]
+
+
+@pytest.mark.parametrize("angle", (10, 20, 45))
+def test_detect_card_edges_rotated_card(synthetic_card, angle) -> None:
+    card = synthetic_card(0, width=CARD_WIDTH // 2, height=CARD_HEIGHT // 2)
+    photo = _rotate_onto_photo(card, angle, (400, 200))
+
+    contours = detect_card_edges(photo)
+
+    assert len(contours) == 1
+    width, height = sorted(cv.minAreaRect(contours[0])[1])
+    assert width == pytest.approx(CARD_WIDTH // 2, abs=4)
+    assert height == pytest.approx(CARD_HEIGHT // 2, abs=4)
+
+
+def test_detect_card_edges_plain_background() -> None:
+    assert detect_card_edges(np.full((400, 300, 3), 235, dtype=np.uint8)) == []
+
+
+def test_contour_areas_matches_opencv(rotated_card_photo) -> None:
+    photo, _ = rotated_card_photo
+    gray = cv.cvtColor(photo, cv.COLOR_BGR2GRAY)
+    _, threshold = cv.threshold(gray, 70, 255, cv.THRESH_BINARY)
+    contours, _ = cv.findContours(threshold, cv.RETR_CCOMP, cv.CHAIN_APPROX_NONE)
+
+    areas = contour_areas(contours)
+
+    np.testing.assert_allclose(areas, [cv.contourArea(c) for c in contours])
+
+
+@pytest.mark.parametrize(
+    "approximation",
+    (
+        pytest.param(cv.CHAIN_APPROX_NONE, id="all points"),
+        pytest.param(cv.CHAIN_APPROX_SIMPLE, id="simple"),
+    ),
+)
+def test_contour_aspect_ratios_matches_opencv(
+    rotated_card_photo, approximation: int
+) -> None:
+    photo, _ = rotated_card_photo
+    gray = cv.cvtColor(photo, cv.COLOR_BGR2GRAY)
+    _, threshold = cv.threshold(gray, 70, 255, cv.THRESH_BINARY)
+    contours, _ = cv.findContours(threshold, cv.RETR_CCOMP, approximation)
+
+    aspect_ratios = contour_aspect_ratios(contours)
+
+    expected = []
+    for contour in contours:
+        moments = cv.moments(contour)
+        covariance = np.array(
+            [[moments["mu20"], moments["mu11"]], [moments["mu11"], moments["mu02"]]]
+        )
+        minor, major = np.linalg.eigvalsh(covariance) if moments["m00"] else (0, 1)
+        expected.append(np.sqrt(max(minor, 0) / major))
+    np.testing.assert_allclose(aspect_ratios, expected, atol=1e-9)
+
+
+def test_extract_cards(card_grid_photo, synthetic_card) -> None:
+    photo, _ = card_grid_photo()
+
+    cards = extract_cards(photo, detect_card_edges(photo))
+
+    for seed, card in enumerate(cards):
+        assert card.shape == (CARD_HEIGHT, CARD_WIDTH, 3)
+        difference = np.asarray(cv.absdiff(card, synthetic_card(seed)), dtype=np.uint8)
+        assert float(np.median(difference)) <= 2
+
+
+@pytest.mark.slow
+def test_multi_card_benchmark(card_grid_photo, synthetic_photo) -> None:
+    grid, _ = card_grid_photo(3000, 4000)
+    singles = [synthetic_photo(seed, width=3000, height=4000)[0] for seed in range(9)]
+
+    def _one_at_a_time() -> None:
+        for photo in singles:
+            normalize_card(
+                photo, detect_card_edge(photo, max_dim=DEFAULT_DETECTION_MAX_DIM)
+            )
+
+    def _all_at_once() -> None:
+        extract_cards(grid, detect_card_edges(grid, max_dim=DEFAULT_DETECTION_MAX_DIM))
+
+    one_ms = _median_time_ms(_one_at_a_time)
+    all_ms = _median_time_ms(_all_at_once)
+    print(
+        f"9 cards, one photo each: {one_ms:.1f}ms, one photo of all 9: {all_ms:.1f}ms, "
+        f"{one_ms / all_ms:.1f}x"
+    )
+    assert all_ms < one_ms
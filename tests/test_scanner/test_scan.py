@@ -0,0 +1,165 @@
+import json
+
+import cv2 as cv
+import pytest
+
+from mtg_scanner.db.card_snapshot import CardSnapshot
+from mtg_scanner.scanner.identification.phash_index import PHashIndex
+from mtg_scanner.scanner.scan import (
+    find_images,
+    main,
+    scan_image,
+    scan_image_bytes,
+    scan_images,
+)
+from mtg_scanner.scanner.scan_pool import ScanPool
+
+
+@pytest.fixture
+def photo_dir(tmp_path, synthetic_photo):
+    photo_dir = tmp_path / "photos"
+    (photo_dir / "nested").mkdir(parents=True)
+    for seed in range(4):
+        photo, _ = synthetic_photo(seed, width=600, height=800)
+        sub_dir = photo_dir / "nested" if seed % 2 else photo_dir
+        cv.imwrite(str(sub_dir / f"photo_{seed}.jpg"), photo)
+    (photo_dir / "notes.txt").write_text("not an image")
+    return photo_dir
+
+
+@pytest.fixture
+def index_dir(tmp_path, synthetic_card):
+    image_dir = tmp_path / "image_data"
+    image_dir.mkdir()
+    for seed in range(10):
+        cv.imwrite(str(image_dir / f"card-{seed}.jpg"), synthetic_card(seed))
+    index_dir = tmp_path / "index"
+    PHashIndex.build(image_dir).save(index_dir)
+    return index_dir
+
+
+def test_find_images(photo_dir):
+    assert [path.name for path in find_images(str(photo_dir))] == [
+        "photo_1.jpg",
+        "photo_3.jpg",
+        "photo_0.jpg",
+        "photo_2.jpg",
+    ]
+    assert [path.name for path in find_images(str(photo_dir / "*.jpg"))] == [
+        "photo_0.jpg",
+        "photo_2.jpg",
+    ]
+
+
+def test_scan_image_records_errors(tmp_path):
+    path = tmp_path / "broken.jpg"
+    path.write_bytes(b"not a jpeg")
+
+    result = scan_image(path)
+
+    assert result.error is not None
+    assert result.bounding_box is None
+
+
+def test_scan_images_identifies_cards(photo_dir, index_dir, synthetic_photo):
+    paths = find_images(str(photo_dir / "*.jpg"))
+
+    results = list(scan_images(paths, index_dir, workers=2, k=1))
+
+    assert [result.path for result in results] == [str(path) for path in paths]
+    assert [result.matches[0]["scryfall_id"] for result in results] == [
+        "card-0",
+        "card-2",
+    ]
+    _, (x, y, w, h) = synthetic_photo(0, width=600, height=800)
+    assert results[0].bounding_box is not None
+    bx, by, bw, bh = results[0].bounding_box
+    assert abs(bx - x) <= 2 and abs(by - y) <= 2
+    assert abs(bw - w) <= 3 and abs(bh - h) <= 3
+
+
+def test_scan_image_bytes_matches_scan_image(photo_dir, index_dir):
+    path = photo_dir / "photo_0.jpg"
+    index = PHashIndex.load(index_dir)
+
+    from_file = scan_image(path, index, k=1)
+    from_bytes = scan_image_bytes(path.read_bytes(), "upload.jpg", index, k=1)
+
+    assert from_bytes.path == "upload.jpg"
+    assert from_bytes.error is None
+    assert from_bytes.bounding_box == from_file.bounding_box
+    assert from_bytes.matches == from_file.matches
+    assert scan_image_bytes(b"not a jpeg", "broken.jpg").error is not None
+
+
+def test_scan_pool(photo_dir, index_dir, tmp_path):
+    pool = ScanPool(index_dir, workers=1)
+    try:
+        futures = [
+            pool.submit((photo_dir / name).read_bytes(), name, k=1)
+            for name in ("photo_0.jpg", "photo_2.jpg")
+        ]
+        results = [future.result(timeout=60) for future in futures]
+    finally:
+        pool.shutdown()
+
+    assert [result.matches[0]["scryfall_id"] for result in results] == [
+        "card-0",
+        "card-2",
+    ]
+
+
+def test_scan_pool_without_index(photo_dir, tmp_path):
+    pool = ScanPool(tmp_path / "missing", workers=1)
+    try:
+        result = pool.submit((photo_dir / "photo_0.jpg").read_bytes(), "a.jpg").result(
+            timeout=60
+        )
+    finally:
+        pool.shutdown()
+
+    assert result.error is None
+    assert result.matches == []
+
+
+def test_main_writes_json_lines(photo_dir, tmp_path):
+    output = tmp_path / "results.jsonl"
+
+    exit_code = main([str(photo_dir), "--output", str(output), "--workers", "2"])
+
+    lines = [json.loads(line) for line in output.read_text().splitlines()]
+    assert exit_code == 0
+    assert len(lines) == 4
+    assert all(line["error"] is None and line["matches"] == [] for line in lines)
+
+
+def test_main_names_matches(photo_dir, index_dir, tmp_path):
+    CardSnapshot.build(
+        [{"name": "Card Zero", "rarity": "common", "scryfall_id": "card-0"}]
+    ).save(tmp_path / "snapshot")
+    output = tmp_path / "results.jsonl"
+
+    exit_code = main(
+        [
+            str(photo_dir / "*.jpg"),
+            "--output",
+            str(output),
+            "--index_dir",
+            str(index_dir),
+            "--snapshot_dir",
+            str(tmp_path / "snapshot"),
+            "--top_k",
+            "1",
+            "--workers",
+            "1",
+        ]
+    )
+
+    lines = [json.loads(line) for line in output.read_text().splitlines()]
+    assert exit_code == 0
+    # card-2 isn't in the snapshot
+    assert [
+        (match["scryfall_id"], match["name"])
+        for line in lines
+        for match in line["matches"]
+    ] == [("card-0", "Card Zero"), ("card-2", None)]
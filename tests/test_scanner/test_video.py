@@ -0,0 +1,155 @@
+import json
+import threading
+from pathlib import Path
+
+import cv2 as cv
+import cv2.typing as ct
+import numpy as np
+import numpy.typing as npt
+import pytest
+
+from mtg_scanner.scanner.identification.phash_index import Match, PHashIndex
+from mtg_scanner.scanner.video import VideoScanner, main, scan_video
+
+FRAME_SIZE = (640, 480)
+
+
+@pytest.fixture
+def frame_of(synthetic_card):
+    """`frame_of(seed, x, y)` a frame with card `seed` at x, y, or an empty frame if `seed` is `None`"""
+
+    def _frame_of(seed: int | None, x: int = 200, y: int = 80) -> npt.NDArray[np.uint8]:
+        frame = np.full((FRAME_SIZE[1], FRAME_SIZE[0], 3), 230, dtype=np.uint8)
+        if seed is not None:
+            card = synthetic_card(seed, 220, 308)
+            frame[y : y + card.shape[0], x : x + card.shape[1]] = card
+        return frame
+
+    return _frame_of
+
+
+@pytest.fixture
+def index(tmp_path, synthetic_card) -> PHashIndex:
+    image_dir = tmp_path / "image_data"
+    image_dir.mkdir()
+    for seed in range(2):
+        cv.imwrite(str(image_dir / f"card-{seed}.jpg"), synthetic_card(seed))
+    return PHashIndex.build(image_dir)
+
+
+def _identified(scanner: VideoScanner) -> list[tuple[int, str]]:
+    identifications = []
+    while not scanner.identifications.empty():
+        identification = scanner.identifications.get()
+        identifications.append(
+            (identification.frame_index, identification.matches[0].scryfall_id)
+        )
+    return identifications
+
+
+def test_tracks_still_card_and_identifies_it_once(frame_of, index):
+    scanner = VideoScanner(identify=index.query, stable_frames=3)
+
+    for i in range(10):
+        scanner.process(i, frame_of(0))
+
+    assert _identified(scanner) == [(2, "card-0")]
+    assert scanner.stats.full_detections == 1
+    assert scanner.stats.tracked == 9
+
+
+def test_moving_card_is_not_identified(frame_of, index):
+    scanner = VideoScanner(identify=index.query, stable_frames=3)
+
+    for i in range(10):
+        scanner.process(i, frame_of(0, x=100 + 20 * i))
+
+    assert _identified(scanner) == []
+    # small moves are followed by tracking
+    assert scanner.stats.tracked == 9
+
+
+def test_new_card_is_identified(frame_of, index):
+    scanner = VideoScanner(identify=index.query, stable_frames=3)
+    frames = [frame_of(0)] * 4 + [frame_of(None)] * 2 + [frame_of(1, x=120)] * 4
+
+    for i, frame in enumerate(frames):
+        scanner.process(i, frame)
+
+    assert _identified(scanner) == [(2, "card-0"), (8, "card-1")]
+
+
+def test_frames_are_dropped_while_busy(frame_of):
+    started = threading.Event()
+    release = threading.Event()
+
+    def _slow_identify(card: ct.MatLike) -> list[Match]:
+        started.set()
+        release.wait(timeout=5)
+        return []
+
+    scanner = VideoScanner(identify=_slow_identify, stable_frames=1)
+    with scanner:
+        scanner.submit(frame_of(0))
+        assert started.wait(timeout=5)
+        for _ in range(9):
+            scanner.submit(frame_of(0))
+        release.set()
+
+    # only the newest frame waits for the worker, the rest are dropped
+    assert scanner.stats.frames == 10
+    assert scanner.stats.dropped == 8
+    assert scanner.stats.processed == 2
+
+
+@pytest.fixture
+def video_path(tmp_path: Path, frame_of) -> Path:
+    """card 0 held still, taken away, then card 1 held still"""
+    video_path = tmp_path / "scan.avi"
+    writer = cv.VideoWriter(
+        str(video_path), cv.VideoWriter.fourcc(*"MJPG"), 60, FRAME_SIZE
+    )
+    frames = [frame_of(0)] * 30 + [frame_of(None)] * 10 + [frame_of(1, x=120)] * 30
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+    return video_path
+
+
+def test_scan_video(video_path, index):
+    scanner = VideoScanner(identify=index.query, stable_frames=3)
+
+    stats = scan_video(str(video_path), scanner)
+
+    assert stats.frames == 70
+    assert stats.processed + stats.dropped == stats.frames
+    assert [scryfall_id for _, scryfall_id in _identified(scanner)] == [
+        "card-0",
+        "card-1",
+    ]
+
+
+def test_scan_video_missing_file(tmp_path):
+    with pytest.raises(ValueError):
+        scan_video(str(tmp_path / "missing.avi"), VideoScanner())
+
+
+def test_main_writes_identifications(video_path, index, tmp_path, capsys):
+    index_dir = tmp_path / "phash_index"
+    index.save(index_dir)
+
+    exit_code = main([str(video_path), "--index_dir", str(index_dir), "--no_realtime"])
+
+    assert exit_code == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert [json.loads(line)["matches"][0]["scryfall_id"] for line in lines] == [
+        "card-0",
+        "card-1",
+    ]
+
+
+def test_main_without_index(video_path, capsys):
+    exit_code = main([str(video_path), "--no_realtime"])
+
+    assert exit_code == 0
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,124 @@
+import asyncio
+from collections import Counter
+from collections.abc import AsyncIterator, Callable
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from dataclasses import dataclass, field
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+
+@dataclass
+class StandInServer:
+    """
+    Local aiohttp server standing in for scryfall
+    `/images/{name}` serves an image, `/flaky/{name}` fails `fail_times` before serving and `/missing/{name}` 404s.
+    `/large/{size}` streams `size` bytes and `/truncated/{name}` drops the connection part way through the body.
+    `/bulk-data` lists a single `unique_artwork` entry served from `/bulk/unique_artwork.json` with `bulk_body`
+    """
+
+    server: TestServer
+    delay: float = 0.0
+    fail_times: int = 2
+    in_flight: int = 0
+    max_in_flight: int = 0
+    requests: Counter[str] = field(default_factory=Counter)
+    bulk_body: bytes = b"[]"
+    bulk_updated_at: str = "2024-01-01T00:00:00.000+00:00"
+
+    def url(self, path: str) -> str:
+        return str(self.server.make_url(path))
+
+    @staticmethod
+    def image_bytes(name: str) -> bytes:
+        return name.encode("utf-8") * 1000
+
+
+def _build_app(state: StandInServer) -> web.Application:
+    async def image(request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        state.requests[request.path] += 1
+        state.in_flight += 1
+        state.max_in_flight = max(state.max_in_flight, state.in_flight)
+        try:
+            await asyncio.sleep(state.delay)
+        finally:
+            state.in_flight -= 1
+        return web.Response(body=StandInServer.image_bytes(name))
+
+    async def flaky(request: web.Request) -> web.Response:
+        if state.requests[request.path] < state.fail_times:
+            state.requests[request.path] += 1
+            raise web.HTTPServiceUnavailable()
+        return await image(request)
+
+    async def missing(request: web.Request) -> web.Response:
+        state.requests[request.path] += 1
+        raise web.HTTPNotFound()
+
+    async def large(request: web.Request) -> web.StreamResponse:
+        size = int(request.match_info["size"])
+        response = web.StreamResponse()
+        response.content_length = size
+        await response.prepare(request)
+        chunk = b"x" * 64 * 1024
+        for start in range(0, size, len(chunk)):
+            await response.write(chunk[: size - start])
+        await response.write_eof()
+        return response
+
+    async def truncated(request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse()
+        response.content_length = 1024 * 1024
+        await response.prepare(request)
+        await response.write(b"x" * 1024)
+        assert request.transport is not None
+        request.transport.close()
+        return response
+
+    async def bulk_data_list(request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "data": [
+                    {
+                        "type": "unique_artwork",
+                        "updated_at": state.bulk_updated_at,
+                        "download_uri": state.url("/bulk/unique_artwork.json"),
+                    }
+                ]
+            }
+        )
+
+    async def bulk_file(request: web.Request) -> web.Response:
+        state.requests[request.path] += 1
+        return web.Response(body=state.bulk_body, content_type="application/json")
+
+    app = web.Application()
+    app.router.add_get("/images/{name}", image)
+    app.router.add_get("/flaky/{name}", flaky)
+    app.router.add_get("/missing/{name}", missing)
+    app.router.add_get("/large/{size}", large)
+    app.router.add_get("/truncated/{name}", truncated)
+    app.router.add_get("/bulk-data", bulk_data_list)
+    app.router.add_get("/bulk/{name}", bulk_file)
+    return app
+
+
+@pytest.fixture
+def stand_in_server() -> Callable[..., AbstractAsyncContextManager[StandInServer]]:
+    """
+    Factory for a running `StandInServer`, use as `async with stand_in_server() as server:`
+    """
+
+    @asynccontextmanager
+    async def _start(**kwargs: object) -> AsyncIterator[StandInServer]:
+        state = StandInServer(server=None, **kwargs)  # type: ignore[arg-type]
+        state.server = TestServer(_build_app(state))
+        await state.server.start_server()
+        try:
+            yield state
+        finally:
+            await state.server.close()
+
+    return _start
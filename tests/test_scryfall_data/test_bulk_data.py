@@ -0,0 +1,104 @@
+import json
+import multiprocessing
+import resource
+import time
+from pathlib import Path
+
+import pytest
+
+from mtg_scanner.scryfall_data import bulk_data
+
+
+def test_iter_bulk_file_matches_read_bulk_file(scryfall_card_json, write_bulk_file):
+    path = write_bulk_file([scryfall_card_json() for _ in range(25)])
+
+    # small chunk size so entries are split across reads
+    streamed = list(bulk_data.iter_bulk_file(path, chunk_size=64))
+
+    assert streamed == bulk_data.read_bulk_file(path)
+
+
+@pytest.mark.parametrize("chunk_size", (1, 7, 4096))
+def test_iter_bulk_file_raw_compact_json(scryfall_card_json, tmp_path, chunk_size):
+    cards = [scryfall_card_json() for _ in range(5)]
+    path = tmp_path / "bulk_data.json"
+    path.write_text(json.dumps(cards, separators=(",", ":")), encoding="utf-8")
+
+    assert list(bulk_data.iter_bulk_file_raw(path, chunk_size=chunk_size)) == cards
+
+
+def test_iter_bulk_file_raw_empty_array(tmp_path):
+    path = tmp_path / "bulk_data.json"
+    path.write_text(" [ \n ] ", encoding="utf-8")
+
+    assert list(bulk_data.iter_bulk_file_raw(path)) == []
+
+
+@pytest.mark.parametrize(
+    "contents",
+    (
+        pytest.param('{"id": 1}', id="not an array"),
+        pytest.param('[{"id": 1}, ', id="truncated"),
+        pytest.param('[{"id": 1} {"id": 2}]', id="missing separator"),
+        pytest.param("[1, 2]", id="not objects"),
+    ),
+)
+def test_iter_bulk_file_raw_malformed(tmp_path, contents):
+    path = tmp_path / "bulk_data.json"
+    path.write_text(contents, encoding="utf-8")
+
+    with pytest.raises(ValueError):
+        list(bulk_data.iter_bulk_file_raw(path))
+
+
+def test_iter_bulk_file_batches(scryfall_card_json, write_bulk_file):
+    path = write_bulk_file([scryfall_card_json() for _ in range(7)])
+
+    batches = list(bulk_data.iter_bulk_file_batches(path, batch_size=3))
+
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+
+
+def _consume_bulk_file(path: Path, streaming: bool) -> tuple[int, float, int]:
+    """
+    Run in a fresh process so peak RSS is not polluted by the other read path
+    """
+    start = time.perf_counter()
+    if streaming:
+        count = sum(1 for _ in bulk_data.iter_bulk_file(path))
+    else:
+        count = len(bulk_data.read_bulk_file(path))
+    elapsed = time.perf_counter() - start
+    return count, elapsed, _peak_rss_kb()
+
+
+def _peak_rss_kb() -> int:
+    # ru_maxrss survives exec, so it would include the parent's usage at fork time
+    # the high water mark in /proc is reset for the new process image
+    status = Path("/proc/self/status")
+    if status.exists():
+        for line in status.read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+@pytest.mark.slow
+def test_benchmark_bulk_file_read(scryfall_card_json, write_bulk_file):
+    n_cards = 20_000
+    path = write_bulk_file([scryfall_card_json() for _ in range(n_cards)])
+
+    results = {}
+    ctx = multiprocessing.get_context("spawn")
+    for streaming in (False, True):
+        with ctx.Pool(1) as pool:
+            results[streaming] = pool.apply(_consume_bulk_file, (path, streaming))
+
+    for streaming, (count, elapsed, peak_rss_kb) in results.items():
+        assert count == n_cards
+        print(
+            f"{'iter_bulk_file' if streaming else 'read_bulk_file'}: "
+            f"{count / elapsed:,.0f} cards/sec, peak RSS {peak_rss_kb / 1024:,.1f} MB"
+        )
+
+    assert results[True][2] < results[False][2]
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import tracemalloc
+from typing import TYPE_CHECKING
+
+import aiohttp
+import pytest
+
+from mtg_scanner.scryfall_data.downloader import (
+    DownloadJob,
+    DownloadReport,
+    DownloadScheduler,
+    RateLimiter,
+    partial_path,
+)
+from mtg_scanner.scryfall_data.pull_scryfall_data import (
+    download_and_save,
+    save_image_data,
+)
+
+if TYPE_CHECKING:
+    from tests.test_scryfall_data.conftest import StandInServer
+
+
+def _fast_scheduler(**kwargs) -> DownloadScheduler:
+    return DownloadScheduler(
+        **{"requests_per_second": 1000, "backoff_base": 0.01, **kwargs}
+    )
+
+
+def test_scheduler_caps_concurrency(stand_in_server, tmp_path):
+    async def _run() -> tuple[StandInServer, DownloadReport]:
+        async with stand_in_server(delay=0.02) as server:
+            jobs = (
+                DownloadJob(str(i), server.url(f"/images/{i}"), tmp_path / f"{i}.jpg")
+                for i in range(40)
+            )
+            async with aiohttp.ClientSession() as session:
+
+                async def _download(job):
+                    return await download_and_save(session, job.uri, job.path, False)
+
+                report = await _fast_scheduler(max_concurrency=3).run(jobs, _download)
+            return server, report
+
+    server, report = asyncio.run(_run())
+
+    assert report.downloaded == 40
+    assert report.errors == []
+    assert server.max_in_flight == 3
+    assert (tmp_path / "7.jpg").read_bytes() == server.image_bytes("7")
+
+
+def test_scheduler_retries_and_collects_errors(stand_in_server, tmp_path):
+    async def _run() -> tuple[StandInServer, DownloadReport]:
+        async with stand_in_server(fail_times=2) as server:
+            jobs = [
+                DownloadJob("flaky", server.url("/flaky/a"), tmp_path / "a.jpg"),
+                DownloadJob("missing", server.url("/missing/b"), tmp_path / "b.jpg"),
+                DownloadJob("ok", server.url("/images/c"), tmp_path / "c.jpg"),
+            ]
+            async with aiohttp.ClientSession() as session:
+
+                async def _download(job):
+                    return await download_and_save(session, job.uri, job.path, False)
+
+                report = await _fast_scheduler(max_retries=3).run(jobs, _download)
+            return server, report
+
+    server, report = asyncio.run(_run())
+
+    assert report.downloaded == 2
+    assert [error.key for error in report.errors] == ["missing"]
+    # 404s are not retried
+    assert server.requests["/missing/b"] == 1
+    assert server.requests["/flaky/a"] == 3
+    assert (tmp_path / "a.jpg").exists()
+    assert not (tmp_path / "b.jpg").exists()
+
+
+def test_scheduler_gives_up_after_max_retries(stand_in_server, tmp_path):
+    async def _run() -> tuple[StandInServer, DownloadReport]:
+        async with stand_in_server(fail_times=5) as server:
+            jobs = [DownloadJob("a", server.url("/flaky/a"), tmp_path / "a.jpg")]
+            async with aiohttp.ClientSession() as session:
+
+                async def _download(job):
+                    return await download_and_save(session, job.uri, job.path, False)
+
+                report = await _fast_scheduler(max_retries=2).run(jobs, _download)
+            return server, report
+
+    server, report = asyncio.run(_run())
+
+    assert len(report.errors) == 1
+    assert server.requests["/flaky/a"] == 3
+
+
+def test_rate_limiter_spaces_requests():
+    async def _run() -> float:
+        limiter = RateLimiter(requests_per_second=50)
+        start = time.monotonic()
+        await asyncio.gather(*(limiter.wait() for _ in range(6)))
+        return time.monotonic() - start
+
+    # first call passes straight away, the other 5 are spaced by 20ms
+    assert asyncio.run(_run()) >= 0.09
+
+
+def test_rate_limiter_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        RateLimiter(0)
+
+
+def test_save_image_data(stand_in_server, scryfall_card_json, tmp_path):
+    async def _run() -> DownloadReport:
+        async with stand_in_server() as server:
+            cards = [
+                scryfall_card_json(
+                    id=name, image_uris={"small": server.url(f"/images/{name}")}
+                )
+                for name in ("a", "b", "c")
+            ]
+            cards.append(scryfall_card_json(id="art", layout="art_series"))
+            no_image = scryfall_card_json(id="no-image")
+            del no_image["image_uris"]
+            cards.append(no_image)
+            (tmp_path / "c.jpg").write_bytes(b"existing")
+            async with aiohttp.ClientSession() as session:
+                return await save_image_data(
+                    cards, tmp_path, session, scheduler=_fast_scheduler()
+                )
+
+    report = asyncio.run(_run())
+
+    assert (report.downloaded, report.skipped) == (2, 1)
+    assert [error.key for error in report.errors] == ["no-image"]
+    assert (tmp_path / "c.jpg").read_bytes() == b"existing"
+    assert not (tmp_path / "art.jpg").exists()
+
+
+def test_skips_do_not_wait_on_rate_limiter(tmp_path):
+    downloaded: list[str] = []
+
+    async def _skip(job: DownloadJob) -> bool:
+        return job.key != "new"
+
+    async def _download(job: DownloadJob) -> bool:
+        downloaded.append(job.key)
+        return True
+
+    async def _run() -> tuple[DownloadReport, float]:
+        jobs = [
+            DownloadJob(str(i), f"https://example.com/{i}", tmp_path / f"{i}.jpg")
+            for i in range(30)
+        ]
+        jobs.append(DownloadJob("new", "https://example.com/new", tmp_path / "n.jpg"))
+        start = time.monotonic()
+        # 30 limited requests would take 3s
+        report = await DownloadScheduler(requests_per_second=10).run(
+            jobs, _download, skip=_skip
+        )
+        return report, time.monotonic() - start
+
+    report, elapsed = asyncio.run(_run())
+
+    assert (report.downloaded, report.skipped) == (1, 30)
+    assert downloaded == ["new"]
+    assert elapsed < 0.5
+
+
+def test_download_streams_large_file(stand_in_server, tmp_path):
+    size = 32 * 1024 * 1024
+    img_path = tmp_path / "large.jpg"
+
+    async def _run() -> int:
+        async with stand_in_server() as server:
+            async with aiohttp.ClientSession() as session:
+                tracemalloc.start()
+                try:
+                    await download_and_save(
+                        session, server.url(f"/large/{size}"), img_path, False
+                    )
+                    return tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+
+    peak = asyncio.run(_run())
+
+    assert img_path.stat().st_size == size
+    # never holds more than a few chunks of the body
+    assert peak < size / 8
+
+
+def test_download_failure_leaves_no_partial_file(stand_in_server, tmp_path):
+    img_path = tmp_path / "a.jpg"
+    img_path.write_bytes(b"previous version")
+
+    async def _run() -> None:
+        async with stand_in_server() as server:
+            async with aiohttp.ClientSession() as session:
+                await download_and_save(
+                    session, server.url("/truncated/a"), img_path, True
+                )
+
+    with pytest.raises(aiohttp.ClientPayloadError):
+        asyncio.run(_run())
+
+    assert img_path.read_bytes() == b"previous version"
+    assert not partial_path(img_path).exists()
@@ -0,0 +1,64 @@
+import hashlib
+
+from mtg_scanner.scryfall_data.manifest import DownloadManifest
+
+
+def test_manifest_round_trip(tmp_path):
+    path = tmp_path / "manifest.jsonl"
+    with DownloadManifest.load(path) as manifest:
+        manifest.record("a", "https://img/a.jpg?1", 10, "aa", "highres_scan")
+        manifest.record("b", "https://img/b.jpg?1", 20, "bb", "lowres")
+        manifest.record("a", "https://img/a.jpg?2", 11, "ab", "highres_scan")
+
+    reloaded = DownloadManifest.load(path)
+
+    assert len(reloaded) == 2
+    entry = reloaded.get("a")
+    assert entry is not None
+    assert (entry.uri, entry.size, entry.sha256) == ("https://img/a.jpg?2", 11, "ab")
+    # compacted down to the latest entry per image
+    assert len(path.read_text().splitlines()) == 2
+
+
+def test_manifest_skips_truncated_line(tmp_path):
+    path = tmp_path / "manifest.jsonl"
+    with DownloadManifest.load(path) as manifest:
+        manifest.record("a", "https://img/a.jpg", 10, "aa")
+    with open(path, "a", encoding="utf-8") as file:
+        file.write('{"scryfall_id": "b", "uri": ')
+
+    reloaded = DownloadManifest.load(path)
+
+    assert len(reloaded) == 1
+    assert reloaded.get("b") is None
+
+
+def test_manifest_is_current(tmp_path):
+    img_path = tmp_path / "a.jpg"
+    img_path.write_bytes(b"x" * 10)
+    with DownloadManifest.load(tmp_path / "manifest.jsonl") as manifest:
+        manifest.record(
+            "a",
+            "https://img/a.jpg?1",
+            10,
+            hashlib.sha256(b"x" * 10).hexdigest(),
+            "lowres",
+        )
+
+        assert manifest.is_current("a", "https://img/a.jpg?1", "lowres", img_path)
+        # art changed
+        assert not manifest.is_current("a", "https://img/a.jpg?2", "lowres", img_path)
+        # better scan available
+        assert not manifest.is_current(
+            "a", "https://img/a.jpg?1", "highres_scan", img_path
+        )
+        # never downloaded
+        assert not manifest.is_current(
+            "b", "https://img/b.jpg?1", "lowres", tmp_path / "b.jpg"
+        )
+        # corrupted on disk, same size
+        img_path.write_bytes(b"y" * 10)
+        assert not manifest.is_current("a", "https://img/a.jpg?1", "lowres", img_path)
+        # file on disk does not match what was downloaded
+        img_path.write_bytes(b"x" * 5)
+        assert not manifest.is_current("a", "https://img/a.jpg?1", "lowres", img_path)
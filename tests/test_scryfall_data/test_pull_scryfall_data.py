@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import TYPE_CHECKING, Any
+
+import aiohttp
+
+from mtg_scanner.scryfall_data.bulk_data import iter_bulk_file_raw
+from mtg_scanner.scryfall_data.downloader import DownloadReport, DownloadScheduler
+from mtg_scanner.scryfall_data.manifest import MANIFEST_FILE_NAME, DownloadManifest
+from mtg_scanner.scryfall_data.pull_scryfall_data import (
+    BulkDataType,
+    ScryfallApiClient,
+    bulk_metadata_path,
+    is_bulk_data_current,
+    save_bulk_metadata,
+    save_image_data,
+)
+
+if TYPE_CHECKING:
+    from tests.test_scryfall_data.conftest import StandInServer
+
+
+def test_download_bulk_data(stand_in_server, scryfall_card_json, tmp_path):
+    cards = [scryfall_card_json() for _ in range(3)]
+    path = tmp_path / "bulk_data" / "bulk_data.json"
+
+    async def _run() -> dict[str, Any]:
+        async with stand_in_server(bulk_body=json.dumps(cards).encode()) as server:
+            async with aiohttp.ClientSession() as session:
+                client = ScryfallApiClient(session)
+                client.base_url = server.url("")
+                info = await client.get_bulk_data_info(BulkDataType.UNIQUE_ARTWORK)
+                await client.download_bulk_data(BulkDataType.UNIQUE_ARTWORK, path, info)
+                return info
+
+    info = asyncio.run(_run())
+
+    assert list(iter_bulk_file_raw(path)) == cards
+
+    assert not asyncio.run(is_bulk_data_current(info, path))
+    asyncio.run(save_bulk_metadata(info, path))
+    assert bulk_metadata_path(path).exists()
+    assert asyncio.run(is_bulk_data_current(info, path))
+    assert not asyncio.run(
+        is_bulk_data_current({**info, "updated_at": "2025-01-01"}, path)
+    )
+
+
+def test_save_image_data_resumes_from_manifest(
+    stand_in_server, scryfall_card_json, tmp_path
+):
+    manifest_path = tmp_path / MANIFEST_FILE_NAME
+
+    async def _pull(
+        server: StandInServer,
+        cards: list[dict[str, object]],
+        requests_per_second: float = 1000,
+    ) -> DownloadReport:
+        async with aiohttp.ClientSession() as session:
+            with DownloadManifest.load(manifest_path) as manifest:
+                return await save_image_data(
+                    cards,
+                    tmp_path,
+                    session,
+                    scheduler=DownloadScheduler(
+                        requests_per_second=requests_per_second
+                    ),
+                    manifest=manifest,
+                )
+
+    async def _run() -> (
+        tuple[StandInServer, DownloadReport, DownloadReport, DownloadReport]
+    ):
+        async with stand_in_server() as server:
+
+            def _card(name: str, version: int) -> dict[str, object]:
+                card: dict[str, object] = scryfall_card_json(
+                    id=name,
+                    image_uris={"small": server.url(f"/images/{name}?v={version}")},
+                )
+                return card
+
+            # a file left by an older pull without a manifest entry is not trusted
+            (tmp_path / "c.jpg").write_bytes(b"partial")
+            first = await _pull(server, [_card("a", 1), _card("b", 1), _card("c", 1)])
+            second = await _pull(server, [_card("a", 1), _card("b", 2), _card("c", 1)])
+            # corrupted without changing size
+            (tmp_path / "a.jpg").write_bytes(
+                bytes(len((tmp_path / "a.jpg").read_bytes()))
+            )
+            # up to date images are skipped before the rate limit, so only the one fetch waits
+            third = await _pull(
+                server,
+                [_card("a", 1), _card("b", 2), _card("c", 1)],
+                requests_per_second=1,
+            )
+            return server, first, second, third
+
+    server, first, second, third = asyncio.run(_run())
+
+    assert (first.downloaded, first.skipped) == (3, 0)
+    assert (tmp_path / "c.jpg").read_bytes() == server.image_bytes("c")
+    # only the image whose uri changed is fetched again
+    assert (second.downloaded, second.skipped) == (1, 2)
+    entry = DownloadManifest.load(manifest_path).get("b")
+    assert entry is not None
+    assert entry.uri.endswith("v=2")
+    assert entry.size == len(server.image_bytes("b"))
+    assert (third.downloaded, third.skipped) == (1, 2)
+    assert third.elapsed < 0.5
+    assert (tmp_path / "a.jpg").read_bytes() == server.image_bytes("a")
@@ -0,0 +1,181 @@
+import importlib
+import uuid
+from collections.abc import AsyncGenerator, Callable, Generator
+from datetime import datetime, timezone
+from pathlib import Path
+from types import ModuleType
+
+import cv2 as cv
+import numpy as np
+import numpy.typing as npt
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+import mtg_scanner.db as db
+from mtg_scanner.db.models import Base, Card
+from mtg_scanner.scanner.identification.phash_index import PHashIndex
+from mtg_scanner.scanner.scan_pool import ScanPool
+from mtg_scanner.web_server.response_cache import ResponseCache
+from mtg_scanner.web_server.sync_job import SyncJobRunner
+
+
+@pytest.fixture(scope="session")
+def web_main() -> ModuleType:
+    """
+    `mtg_scanner.web_server.main`
+    """
+    return importlib.import_module("mtg_scanner.web_server.main")
+
+
+@pytest.fixture
+def web_db_url(tmp_path: Path) -> str:
+    """
+    Url of a fresh SQLite file db, the async driver can't share an in-memory db with the sync one
+    """
+    db_url = f"sqlite:///{tmp_path / 'web.db'}"
+    engine = create_engine(db_url)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    return db_url
+
+
+@pytest.fixture
+def web_orm(web_db_url: str) -> Generator[db.OrmSession, None, None]:
+    """
+    Sync session on the db the app is using, to set up and check data
+    """
+    engine = create_engine(web_db_url)
+    session = sessionmaker(autoflush=False, autocommit=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+@pytest.fixture
+def response_cache() -> ResponseCache:
+    return ResponseCache()
+
+
+@pytest.fixture
+def card_snapshot_dir(tmp_path: Path) -> Path:
+    return tmp_path / "card_snapshot"
+
+
+@pytest.fixture
+def sync_jobs(
+    web_db_url: str,
+    tmp_path: Path,
+    response_cache: ResponseCache,
+    card_snapshot_dir: Path,
+) -> SyncJobRunner:
+    """
+    Syncs `tmp_path/bulk_data.json` into the db at `web_db_url`, images are looked for in `tmp_path`
+    and the card snapshot is exported to `card_snapshot_dir`
+    """
+    return SyncJobRunner(
+        web_db_url,
+        tmp_path / "bulk_data.json",
+        tmp_path,
+        on_update=lambda job: response_cache.clear(),
+        snapshot_dir=card_snapshot_dir,
+    )
+
+
+@pytest.fixture
+def scan_index_dir(
+    tmp_path: Path, synthetic_card: Callable[..., npt.NDArray[np.uint8]]
+) -> Path:
+    """
+    Hash index of synthetic cards with seeds 0-9, the scryfall id of each is `uuid.UUID(int=seed)`
+    """
+    image_dir = tmp_path / "index_images"
+    image_dir.mkdir()
+    for seed in range(10):
+        cv.imwrite(str(image_dir / f"{uuid.UUID(int=seed)}.jpg"), synthetic_card(seed))
+    index_dir = tmp_path / "phash_index"
+    PHashIndex.build(image_dir, workers=1).save(index_dir)
+    return index_dir
+
+
+@pytest.fixture
+def scan_pool(scan_index_dir: Path) -> Generator[ScanPool, None, None]:
+    pool = ScanPool(scan_index_dir, workers=1)
+    try:
+        yield pool
+    finally:
+        pool.shutdown()
+
+
+@pytest.fixture
+def web_app(
+    web_main: ModuleType,
+    web_db_url: str,
+    sync_jobs: SyncJobRunner,
+    scan_pool: ScanPool,
+    response_cache: ResponseCache,
+    card_snapshot_dir: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> FastAPI:
+    """
+    The app with its db pointed at `web_db_url`, its syncs run by `sync_jobs`, its scans by `scan_pool`,
+    its responses cached in `response_cache` and its card snapshot read from `card_snapshot_dir`
+    """
+    monkeypatch.setattr(web_main, "CARD_SNAPSHOT_DIR", card_snapshot_dir)
+    # connections are closed with their session, so nothing is left on the client's event loop
+    async_engine = create_async_engine(db.async_db_url(web_db_url), poolclass=NullPool)
+    async_session = async_sessionmaker(
+        async_engine, autoflush=False, expire_on_commit=False
+    )
+
+    async def _get_db() -> AsyncGenerator[db.AsyncOrmSession, None]:
+        async with async_session() as orm:
+            yield orm
+
+    app: FastAPI = web_main.create_app(db_url=web_db_url)
+    app.dependency_overrides[web_main.get_db] = _get_db
+    app.dependency_overrides[web_main.get_sync_jobs] = lambda: sync_jobs
+    app.dependency_overrides[web_main.get_scan_pool] = lambda: scan_pool
+    app.dependency_overrides[web_main.get_response_cache] = lambda: response_cache
+    return app
+
+
+@pytest.fixture
+def client(web_app: FastAPI) -> Generator[TestClient, None, None]:
+    with TestClient(web_app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def add_cards() -> Callable[..., None]:
+    """
+    Insert `n` cards shown on the card list, with plenty of repeated names
+    """
+
+    def _add_cards(orm: db.OrmSession, n: int, **overrides: object) -> None:
+        now = datetime.now(timezone.utc)
+        orm.execute(
+            insert(Card),
+            [
+                {
+                    "name": f"Card {i % (n // 3 + 1):06d}",
+                    "mana_cost": "{1}{W}",
+                    "rarity": "common",
+                    "card_art_uri": f"/images/{i}.jpg",
+                    "scryfall_uri": f"https://scryfall.com/card/{uuid.uuid4()}",
+                    "created_at": now,
+                    "updated_at": now,
+                    **overrides,
+                }
+                for i in range(n)
+            ],
+        )
+        orm.commit()
+
+    return _add_cards
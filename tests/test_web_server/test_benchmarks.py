@@ -0,0 +1,51 @@
+"""
+Render time of the card list, compared against `tests/data/benchmark_baseline.json`.
+Run with `--runslow`, add `--update-benchmarks` to save new baselines after an intended change.
+"""
+
+import uuid
+from types import ModuleType
+
+import pytest
+from starlette.requests import Request
+
+from mtg_scanner.db.models import Card
+from mtg_scanner.web_server.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+# a page mostly shares a handful of mana costs
+_MANA_COSTS = ("{1}{W}", "{2}{U}{U}", "{B}{R}", "{G}", "{3}", None)
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("page_size", [10, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE])
+def test_card_list_render_benchmark(
+    benchmark, web_main: ModuleType, page_size: int
+) -> None:
+    cards = [
+        Card(
+            card_id=i,
+            name=f"Card {i:06d}",
+            mana_cost=_MANA_COSTS[i % len(_MANA_COSTS)],
+            rarity="common",
+            type="Creature — Elf",
+            card_art_uri=f"{uuid.uuid4()}.jpg",
+            scryfall_uri=f"https://scryfall.com/card/{uuid.uuid4()}",
+        )
+        for i in range(page_size)
+    ]
+    request = Request(
+        {
+            "type": "http",
+            "app": web_main.app,
+            "router": web_main.app.router,
+            "method": "GET",
+            "scheme": "http",
+            "server": ("testserver", 80),
+            "root_path": "",
+            "path": "/card_list",
+            "query_string": b"",
+            "headers": [],
+        }
+    )
+
+    benchmark(lambda: web_main._render_card_list(request, cards, "next", page_size))
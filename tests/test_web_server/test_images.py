@@ -0,0 +1,207 @@
+import os
+import time
+from pathlib import Path
+
+import cv2 as cv
+import cv2.typing as ct
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from mtg_scanner.web_server.images import (
+    CACHE_CONTROL,
+    CardImageFiles,
+    ThumbnailCache,
+    thumbnail_width,
+)
+
+
+@pytest.fixture
+def image_dir(tmp_path: Path, synthetic_card) -> Path:
+    image_dir = tmp_path / "image_data"
+    image_dir.mkdir()
+    for seed in range(3):
+        cv.imwrite(str(image_dir / f"card-{seed}.jpg"), synthetic_card(seed))
+    return image_dir
+
+
+@pytest.fixture
+def thumbnails(tmp_path: Path) -> ThumbnailCache:
+    return ThumbnailCache(tmp_path / "thumbnail_cache")
+
+
+@pytest.fixture
+def image_client(image_dir, thumbnails):
+    app = FastAPI()
+    app.mount("/images", CardImageFiles(directory=image_dir, thumbnails=thumbnails))
+    with TestClient(app) as client:
+        yield client
+
+
+def _decode(content: bytes) -> ct.MatLike:
+    return cv.imdecode(np.frombuffer(content, dtype=np.uint8), cv.IMREAD_COLOR)
+
+
+def test_thumbnail_width():
+    assert thumbnail_width(1) == 64
+    assert thumbnail_width(64) == 64
+    assert thumbnail_width(100) == 128
+    assert thumbnail_width(10_000) == 256
+
+
+def test_thumbnail(image_client):
+    response = image_client.get("/images/card-0.jpg", params={"w": 100})
+
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == CACHE_CONTROL
+    assert "etag" in response.headers
+    assert "last-modified" in response.headers
+    assert _decode(response.content).shape == (178, 128, 3)
+
+    cached = image_client.get(
+        "/images/card-0.jpg",
+        params={"w": 100},
+        headers={"if-none-match": response.headers["etag"]},
+    )
+
+    assert cached.status_code == 304
+    assert cached.headers["cache-control"] == CACHE_CONTROL
+
+
+def test_full_size_image(image_client):
+    response = image_client.get("/images/card-0.jpg")
+
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == CACHE_CONTROL
+    assert _decode(response.content).shape == (680, 488, 3)
+
+
+@pytest.mark.parametrize(
+    "path, params, status_code",
+    [
+        ("/images/missing.jpg", {"w": 64}, 404),
+        ("/images/card-0.jpg", {"w": "big"}, 400),
+        ("/images/card-0.jpg", {"w": 0}, 400),
+        ("/images/../image_data/card-0.jpg", {"w": 64}, 404),
+    ],
+)
+def test_bad_thumbnail_requests(image_client, path, params, status_code):
+    response = image_client.get(path, params=params)
+
+    assert response.status_code == status_code
+    assert "cache-control" not in response.headers
+
+
+def test_thumbnail_etag_outlives_eviction(image_client, thumbnails, image_dir):
+    first = image_client.get("/images/card-0.jpg", params={"w": 64})
+    for path in thumbnails.cache_dir.rglob("*.jpg"):
+        path.unlink()
+
+    second = image_client.get("/images/card-0.jpg", params={"w": 64})
+
+    assert second.status_code == 200
+    assert second.headers["etag"] == first.headers["etag"]
+
+
+def test_thumbnail_remade_when_source_changes(image_client, image_dir, synthetic_card):
+    first = image_client.get("/images/card-0.jpg", params={"w": 64})
+    source = image_dir / "card-0.jpg"
+    cv.imwrite(str(source), synthetic_card(7))
+    os.utime(source, ns=(time.time_ns() + 10**9,) * 2)
+
+    second = image_client.get("/images/card-0.jpg", params={"w": 64})
+
+    assert second.headers["etag"] != first.headers["etag"]
+    assert second.content != first.content
+
+
+def test_cache_evicts_least_recently_used(image_dir, tmp_path):
+    sources = [image_dir / f"card-{seed}.jpg" for seed in range(3)]
+    sizes = [
+        ThumbnailCache(tmp_path / "sizes").get(source, source.name, 64)[1].st_size
+        for source in sources
+    ]
+    cache_dir = tmp_path / "cache"
+    cache = ThumbnailCache(cache_dir, max_bytes=sum(sizes) - 1)
+
+    cache.get(sources[0], sources[0].name, 64)
+    cache.get(sources[1], sources[1].name, 64)
+    cache.get(sources[0], sources[0].name, 64)
+    cache.get(sources[2], sources[2].name, 64)
+
+    assert sorted(path.name for path in cache_dir.rglob("*.jpg")) == [
+        "card-0.jpg",
+        "card-2.jpg",
+    ]
+    assert cache.total_bytes == sizes[0] + sizes[2]
+    # picked up by the next run
+    assert ThumbnailCache(cache_dir).total_bytes == sizes[0] + sizes[2]
+
+
+@pytest.mark.slow
+def test_cache_keeps_thumbnail_being_served(image_dir, tmp_path):
+    cache = ThumbnailCache(tmp_path / "cache", max_bytes=1)
+    app = FastAPI()
+    app.mount("/images", CardImageFiles(directory=image_dir, thumbnails=cache))
+
+    with TestClient(app) as client:
+        responses = [
+            client.get(f"/images/card-{seed}.jpg", params={"w": 64})
+            for seed in range(3)
+        ]
+
+    # each thumbnail alone is over the limit, the one just made is evicted by the next
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert [path.name for path in cache.cache_dir.rglob("*.jpg")] == ["card-2.jpg"]
+    path, stat_result = cache.get(image_dir / "card-2.jpg", "card-2.jpg", 64)
+    assert stat_result.st_size == path.stat().st_size == cache.total_bytes
+
+
+def test_card_list_page_weight(tmp_path, synthetic_card):
+    # a card list page of `normal` sized Scryfall images
+    image_dir = tmp_path / "image_data"
+    image_dir.mkdir()
+    names = []
+    for seed in range(100):
+        names.append(f"card-{seed}.jpg")
+        cv.imwrite(str(image_dir / names[-1]), synthetic_card(seed))
+    app = FastAPI()
+    app.mount(
+        "/images",
+        CardImageFiles(
+            directory=image_dir, thumbnails=ThumbnailCache(tmp_path / "cache")
+        ),
+    )
+
+    def _load_page(client: TestClient, **params: int) -> tuple[int, float, list[str]]:
+        start = time.perf_counter()
+        responses = [client.get(f"/images/{name}", params=params) for name in names]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        assert all(response.status_code == 200 for response in responses)
+        page_bytes = sum(len(response.content) for response in responses)
+        return (
+            page_bytes,
+            elapsed_ms,
+            [response.headers["etag"] for response in responses],
+        )
+
+    with TestClient(app) as client:
+        full_bytes, full_ms, _ = _load_page(client)
+        thumb_bytes, first_ms, etags = _load_page(client, w=64)
+        _, cached_ms, _ = _load_page(client, w=64)
+        start = time.perf_counter()
+        for name, etag in zip(names, etags):
+            response = client.get(
+                f"/images/{name}", params={"w": 64}, headers={"if-none-match": etag}
+            )
+            assert response.status_code == 304
+        revalidate_ms = (time.perf_counter() - start) * 1000
+
+    print(
+        f"page weight {full_bytes / 1024:.0f}KiB full size, {thumb_bytes / 1024:.0f}KiB thumbnails; "
+        f"full size {full_ms:.0f}ms, thumbnails made {first_ms:.0f}ms, "
+        f"cached {cached_ms:.0f}ms, revalidated {revalidate_ms:.0f}ms"
+    )
+    assert thumb_bytes < full_bytes / 10
+    assert cached_ms < first_ms
@@ -0,0 +1,305 @@
+import asyncio
+import random
+import socket
+import threading
+import time
+from collections.abc import AsyncGenerator
+from concurrent.futures import Future
+from pathlib import Path
+from types import ModuleType
+
+import cv2 as cv
+import httpx
+import pytest
+import uvicorn
+from fastapi import FastAPI
+from sqlalchemy import Engine, Select, create_engine, event
+from sqlalchemy.engine import ScalarResult
+from sqlalchemy.orm import sessionmaker
+
+import mtg_scanner.db as db
+from mtg_scanner.db.models import Card
+from mtg_scanner.scanner.identification.phash_index import PHashIndex
+from mtg_scanner.scanner.scan import ScanResult, scan_image_bytes
+from mtg_scanner.web_server.pagination import CardCursor
+from mtg_scanner.web_server.response_cache import ResponseCache
+
+N_CARDS = 50_000
+# clients uploading 12MP phone photos back to back while another pages through the card list
+N_SCAN_CLIENTS = 4
+SCANS_PER_CLIENT = 10
+N_CLIENTS = 8
+REQUESTS_PER_CLIENT = 25
+# pause between a client's requests, back to back requests would saturate the server
+# and the latency would just be the length of the queue
+THINK_TIME_S = (0.1, 0.3)
+# Storage latency, a sleep every this many SQLite VM instructions, ~10ms for a page query.
+# With the db in the page cache a page query is CPU bound and over in ~1ms, leaving nothing
+# for the async engine to overlap, this stands in for a cold cache or a network disk
+_STORAGE_WAIT_INSTRUCTIONS = 100
+_STORAGE_WAIT_S = 0.001
+
+
+def _wait_on_storage() -> int:
+    # runs inside sqlite3_step on the thread executing the query, which has released the GIL
+    time.sleep(_STORAGE_WAIT_S)
+    return 0
+
+
+def _add_storage_latency(engine: Engine) -> None:
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, _) -> None:
+        if hasattr(dbapi_connection, "run_async"):
+            # the aiosqlite connection lives on its own thread
+            dbapi_connection.run_async(
+                lambda conn: conn.set_progress_handler(
+                    _wait_on_storage, _STORAGE_WAIT_INSTRUCTIONS
+                )
+            )
+        else:
+            dbapi_connection.set_progress_handler(
+                _wait_on_storage, _STORAGE_WAIT_INSTRUCTIONS
+            )
+
+
+class _BlockingSession:
+    """
+    Runs queries on a sync session inside the async routes, blocking the event loop
+    as every route did before the async engine
+    """
+
+    def __init__(self, orm: db.OrmSession) -> None:
+        self._orm = orm
+
+    async def scalars(self, statement: Select[tuple[Card]]) -> ScalarResult[Card]:
+        return self._orm.scalars(statement)
+
+
+class _InlinePool:
+    """
+    Scans on the event loop, as a route calling the scanner directly would
+    """
+
+    def __init__(self, index_dir: Path) -> None:
+        self._index = PHashIndex.load(index_dir)
+
+    def submit(self, data: bytes, name: str, k: int = 5) -> Future[ScanResult]:
+        future: Future[ScanResult] = Future()
+        future.set_result(scan_image_bytes(data, name, self._index, k))
+        return future
+
+
+class _Server(uvicorn.Server):
+    def install_signal_handlers(self) -> None:
+        # not on the main thread
+        pass
+
+
+def _serve(app: FastAPI) -> tuple[_Server, threading.Thread, str]:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port: int = sock.getsockname()[1]
+    server = _Server(uvicorn.Config(app, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+async def _load(base_url: str, cursors: list[str]) -> list[float]:
+    """latency in ms of every request from `N_CLIENTS` clients paging through the card list"""
+    latencies: list[float] = []
+    rng = random.Random(0)
+
+    async def _client(client: httpx.AsyncClient) -> None:
+        for _ in range(REQUESTS_PER_CLIENT):
+            start = time.perf_counter()
+            response = await client.get(
+                "/card_list", params={"after": rng.choice(cursors), "limit": 50}
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200
+            await asyncio.sleep(rng.uniform(*THINK_TIME_S))
+
+    limits = httpx.Limits(max_connections=N_CLIENTS)
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=60
+    ) as client:
+        await asyncio.gather(*(_client(client) for _ in range(N_CLIENTS)))
+    return latencies
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+@pytest.mark.slow
+def test_card_list_p99_under_concurrent_load(
+    web_main: ModuleType,
+    web_app: FastAPI,
+    web_db_url: str,
+    web_orm,
+    add_cards,
+    response_cache: ResponseCache,
+):
+    # the db and rendering are measured, not the cache
+    response_cache.max_bytes = 0
+    add_cards(web_orm, N_CARDS)
+    rng = random.Random(1)
+    cursors = [
+        CardCursor(f"Card {rng.randrange(N_CARDS // 3):06d}", 0).encode()
+        for _ in range(100)
+    ]
+
+    sync_engine = create_engine(web_db_url, connect_args={"check_same_thread": False})
+    sync_session = sessionmaker(autoflush=False, autocommit=False, bind=sync_engine)
+    _add_storage_latency(sync_engine)
+
+    async def _get_blocking_db() -> AsyncGenerator[_BlockingSession, None]:
+        with sync_session() as orm:
+            yield _BlockingSession(orm)
+
+    results: dict[str, list[float]] = {}
+    server, thread, base_url = _serve(web_app)
+    try:
+        # the app's own pooled engine, the fixture's opens a connection per request
+        del web_app.dependency_overrides[web_main.get_db]
+        _add_storage_latency(web_app.state.resources.async_engine.sync_engine)
+        for name, get_db in (
+            ("async", web_main.get_db),
+            ("blocking", _get_blocking_db),
+        ):
+            web_app.dependency_overrides[web_main.get_db] = get_db
+            # warm up the pool and template cache
+            asyncio.run(_load(base_url, cursors[:10]))
+            results[name] = asyncio.run(_load(base_url, cursors))
+    finally:
+        server.should_exit = True
+        thread.join()
+        sync_engine.dispose()
+
+    for name, latencies in results.items():
+        print(
+            f"{name}: /card_list p50 {_percentile(latencies, 50):.1f}ms, "
+            f"p99 {_percentile(latencies, 99):.1f}ms"
+        )
+    assert _percentile(results["async"], 99) < _percentile(results["blocking"], 99)
+
+
+async def _scan_load(base_url: str, photo: bytes) -> tuple[list[float], float]:
+    """
+    /card_list latencies in ms while `N_SCAN_CLIENTS` clients upload `photo` back to back,
+    and the scans per second
+    """
+    latencies: list[float] = []
+    scanning = True
+
+    async def _scan_client(client: httpx.AsyncClient) -> None:
+        for _ in range(SCANS_PER_CLIENT):
+            files = {"files": ("photo.jpg", photo, "image/jpeg")}
+            response = await client.post("/scan", files=files)
+            assert response.status_code == 200
+            assert response.json()[0]["error"] is None
+
+    async def _list_client(client: httpx.AsyncClient) -> None:
+        while scanning:
+            start = time.perf_counter()
+            response = await client.get("/card_list", params={"limit": 50})
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200
+            await asyncio.sleep(0.05)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        lister = asyncio.create_task(_list_client(client))
+        start = time.perf_counter()
+        await asyncio.gather(*(_scan_client(client) for _ in range(N_SCAN_CLIENTS)))
+        elapsed = time.perf_counter() - start
+        scanning = False
+        await lister
+    return latencies, N_SCAN_CLIENTS * SCANS_PER_CLIENT / elapsed
+
+
+@pytest.mark.slow
+def test_card_list_latency_during_scans(
+    web_main: ModuleType,
+    web_app: FastAPI,
+    web_orm,
+    add_cards,
+    scan_pool,
+    scan_index_dir: Path,
+    synthetic_photo,
+    response_cache: ResponseCache,
+):
+    response_cache.max_bytes = 0
+    add_cards(web_orm, 10_000)
+    ok, encoded = cv.imencode(".jpg", synthetic_photo(3, width=3000, height=4000)[0])
+    assert ok
+    photo = encoded.tobytes()
+
+    results: dict[str, tuple[list[float], float]] = {}
+    server, thread, base_url = _serve(web_app)
+    try:
+        for name, pool in (
+            ("pool", scan_pool),
+            ("inline", _InlinePool(scan_index_dir)),
+        ):
+            web_app.dependency_overrides[web_main.get_scan_pool] = lambda: pool
+            # start the workers
+            with httpx.Client(base_url=base_url, timeout=120) as client:
+                files = {"files": ("photo.jpg", photo, "image/jpeg")}
+                assert client.post("/scan", files=files).status_code == 200
+            results[name] = asyncio.run(_scan_load(base_url, photo))
+    finally:
+        server.should_exit = True
+        thread.join()
+
+    for name, (latencies, scans_per_sec) in results.items():
+        print(
+            f"{name}: /card_list p50 {_percentile(latencies, 50):.1f}ms, "
+            f"p99 {_percentile(latencies, 99):.1f}ms, {scans_per_sec:.1f} scans/sec"
+        )
+    assert _percentile(results["pool"][0], 99) < _percentile(results["inline"][0], 99)
+
+
+async def _requests_per_second(app: FastAPI, cursors: list[str]) -> float:
+    """card list pages requested back to back, straight through the app to leave out the client's sockets"""
+    n_requests = REQUESTS_PER_CLIENT * N_CLIENTS
+    rng = random.Random(2)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        start = time.perf_counter()
+        for _ in range(n_requests):
+            response = await client.get(
+                "/card_list", params={"after": rng.choice(cursors), "limit": 50}
+            )
+            assert response.status_code == 200
+        return n_requests / (time.perf_counter() - start)
+
+
+@pytest.mark.slow
+def test_card_list_requests_per_second_cached(
+    web_app: FastAPI, web_orm, add_cards, response_cache: ResponseCache
+):
+    add_cards(web_orm, N_CARDS)
+    rng = random.Random(1)
+    # the popular pages of a read heavy site
+    cursors = [
+        CardCursor(f"Card {rng.randrange(N_CARDS // 3):06d}", 0).encode()
+        for _ in range(20)
+    ]
+
+    results: dict[str, float] = {}
+    for name, max_bytes in (("uncached", 0), ("cached", response_cache.max_bytes)):
+        response_cache.max_bytes = max_bytes
+        response_cache.clear()
+        # warm up the template cache, and the response cache when on
+        asyncio.run(_requests_per_second(web_app, cursors))
+        results[name] = asyncio.run(_requests_per_second(web_app, cursors))
+
+    print(
+        f"/card_list {results['uncached']:.0f} requests/sec uncached, "
+        f"{results['cached']:.0f} cached"
+    )
+    assert results["cached"] > results["uncached"] * 5
@@ -0,0 +1,205 @@
+import re
+import uuid
+
+import cv2 as cv
+
+from mtg_scanner.db.card_search import rebuild_search_index
+from mtg_scanner.db.card_snapshot import CardSnapshot
+from mtg_scanner.web_server.sync_job import JobState, SyncJob
+
+
+def test_card_list_pages(client, web_orm, add_cards):
+    add_cards(web_orm, 5)
+    add_cards(web_orm, 2, mana_cost=None)
+
+    first = client.get("/card_list", params={"limit": 3})
+
+    assert first.status_code == 200
+    assert first.text.count('class="tbl-card-name"') == 1 + 3
+    next_link = re.search(r'href="([^"]*after=[^"]*)"', first.text)
+    assert next_link is not None
+
+    second = client.get(next_link.group(1).replace("&amp;", "&"))
+
+    assert second.status_code == 200
+    assert second.text.count('class="tbl-card-name"') == 1 + 2
+    assert "after=" not in second.text
+
+
+def test_card_list_row_columns(client, web_orm, add_cards):
+    add_cards(web_orm, 2, mana_cost="{2}{U}{W}{U}", card_art_uri="abc.jpg")
+
+    response = client.get("/card_list")
+
+    assert response.text.count('<td class="tbl-card-colour-symbol">⚪🔵</td>') == 2
+    assert response.text.count('<td class="tbl-card-colour-text">WU</td>') == 2
+    assert 'src="http://testserver/images/abc.jpg?w=64"' in response.text
+
+
+def test_card_list_cached(client, web_orm, add_cards, response_cache):
+    add_cards(web_orm, 2)
+    first = client.get("/card_list")
+    add_cards(web_orm, 1, name="New Card")
+
+    cached = client.get("/card_list")
+
+    assert cached.text == first.text
+    assert cached.headers["etag"] == first.headers["etag"]
+    assert cached.headers["cache-control"] == "no-cache"
+    assert (
+        client.get("/card_list", headers={"if-none-match": first.headers["etag"]})
+    ).status_code == 304
+
+    response_cache.clear()
+    fresh = client.get("/card_list")
+
+    assert "New Card" in fresh.text
+    assert fresh.headers["etag"] != first.headers["etag"]
+
+
+def test_card_list_cached_per_host(client, web_orm, add_cards):
+    add_cards(web_orm, 1, card_art_uri="abc.jpg")
+
+    first = client.get("/card_list", headers={"host": "first.example"})
+    second = client.get("/card_list", headers={"host": "second.example"})
+
+    assert 'src="http://first.example/images/abc.jpg?w=64"' in first.text
+    assert 'src="http://second.example/images/abc.jpg?w=64"' in second.text
+    assert first.headers["etag"] != second.headers["etag"]
+
+
+def test_card_list_rejects_bad_cursor(client):
+    response = client.get("/card_list", params={"after": "not a cursor"})
+
+    assert response.status_code == 400
+
+
+def test_search_cards(client, web_orm, add_cards):
+    add_cards(web_orm, 3, type="Creature — Elf", colors="G")
+    add_cards(web_orm, 3, type="Instant", colors="G")
+    rebuild_search_index(web_orm)
+
+    response = client.get("/cards/search", params={"type": "elf", "colors": "g"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [card["type"] for card in body["cards"]] == ["Creature — Elf"] * 3
+    assert body["next_cursor"] is None
+
+
+def test_search_cards_cached_by_query(client, web_orm, add_cards, response_cache):
+    add_cards(web_orm, 1, name="Card A")
+    add_cards(web_orm, 1, name="Card B")
+
+    both = client.get("/cards/search", params={"limit": 5})
+    first = client.get("/cards/search", params={"limit": 1})
+
+    assert len(both.json()["cards"]) == 2
+    assert len(first.json()["cards"]) == 1
+    assert both.headers["etag"] != first.headers["etag"]
+    assert first.headers["content-type"] == "application/json"
+    assert len(response_cache) == 2
+
+
+def test_search_cards_rejects_bad_colors(client, response_cache):
+    response = client.get("/cards/search", params={"colors": "purple"})
+
+    assert response.status_code == 400
+    assert len(response_cache) == 0
+
+
+def _jpeg(photo) -> bytes:
+    ok, encoded = cv.imencode(".jpg", photo)
+    assert ok
+    return encoded.tobytes()
+
+
+def test_scan(client, web_orm, add_cards, synthetic_photo):
+    add_cards(web_orm, 1, name="Seed Two", scryfall_id=str(uuid.UUID(int=2)))
+    photos = [synthetic_photo(seed, width=600, height=800)[0] for seed in (2, 5)]
+
+    response = client.post(
+        "/scan",
+        params={"k": 1},
+        files=[
+            ("files", ("two.jpg", _jpeg(photos[0]), "image/jpeg")),
+            ("files", ("five.jpg", _jpeg(photos[1]), "image/jpeg")),
+            ("files", ("broken.jpg", b"not a jpeg", "image/jpeg")),
+        ],
+    )
+
+    assert response.status_code == 200
+    two, five, broken = response.json()
+    assert two["filename"] == "two.jpg"
+    assert two["bounding_box"] is not None
+    assert two["matches"] == [
+        {"scryfall_id": str(uuid.UUID(int=2)), "distance": 0, "name": "Seed Two"}
+    ]
+    # not in the db
+    assert [match["scryfall_id"] for match in five["matches"]] == [
+        str(uuid.UUID(int=5))
+    ]
+    assert five["matches"][0]["name"] is None
+    assert broken["error"] is not None
+    assert broken["matches"] == []
+
+
+def test_scan_names_from_card_snapshot(
+    web_app, client, web_orm, add_cards, synthetic_photo, card_snapshot_dir
+):
+    def _snapshot(name: str) -> None:
+        CardSnapshot.build(
+            [{"name": name, "rarity": "common", "scryfall_id": str(uuid.UUID(int=5))}]
+        ).save(card_snapshot_dir)
+
+    def _scan_names() -> list[str | None]:
+        photos = [synthetic_photo(seed, width=600, height=800)[0] for seed in (2, 5)]
+        response = client.post(
+            "/scan",
+            params={"k": 1},
+            files=[
+                ("files", (f"{i}.jpg", _jpeg(p), "image/jpeg"))
+                for i, p in enumerate(photos)
+            ],
+        )
+        assert response.status_code == 200
+        return [result["matches"][0]["name"] for result in response.json()]
+
+    add_cards(web_orm, 1, name="Seed Two", scryfall_id=str(uuid.UUID(int=2)))
+    _snapshot("Seed Five")
+
+    # cards missing from the snapshot are looked up in the db
+    assert _scan_names() == ["Seed Two", "Seed Five"]
+
+    _snapshot("Renamed")
+    # the loaded snapshot is used until a sync finishes
+    assert _scan_names() == ["Seed Two", "Seed Five"]
+    web_app.state.resources.on_sync_update(SyncJob("a", state=JobState.SUCCEEDED))
+    assert _scan_names() == ["Seed Two", "Renamed"]
+
+
+def test_scan_rejects_too_many_files(web_main, client):
+    files = [("files", (f"{i}.jpg", b"", "image/jpeg")) for i in range(11)]
+
+    response = client.post("/scan", files=files)
+
+    assert response.status_code == 400
+
+
+def test_scan_rejects_large_file(web_main, client, monkeypatch):
+    monkeypatch.setattr(web_main, "MAX_SCAN_FILE_BYTES", 1024)
+
+    response = client.post(
+        "/scan", files=[("files", ("big.jpg", b"x" * 2048, "image/jpeg"))]
+    )
+
+    assert response.status_code == 413
+    assert response.json()["detail"] == "big.jpg is too large"
+
+
+def test_scan_rejects_non_multipart_body(web_main, client):
+    response = client.post(
+        "/scan", content=b"photo", headers={"content-type": "image/jpeg"}
+    )
+
+    assert response.status_code == 400
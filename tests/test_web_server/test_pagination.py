@@ -0,0 +1,113 @@
+import time
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.dialects import sqlite
+
+from mtg_scanner.db.models import Card
+from mtg_scanner.web_server.pagination import (
+    CardCursor,
+    card_list_query,
+    paginate_cards,
+)
+
+
+def test_cursor_round_trip():
+    cursor = CardCursor('Æther Vial, "quoted"', 42)
+
+    assert CardCursor.decode(cursor.encode()) == cursor
+
+
+@pytest.mark.parametrize("token", ["", "not base64!", "WyJhIl0", "eyJhIjogMX0"])
+def test_cursor_rejects_bad_tokens(token):
+    with pytest.raises(ValueError):
+        CardCursor.decode(token)
+
+
+def test_paginate_walks_every_card_once(orm, add_cards):
+    add_cards(orm, 50)
+    # rows the card list does not show
+    add_cards(orm, 5, mana_cost=None)
+    add_cards(orm, 5, deleted_at=datetime.now(timezone.utc))
+
+    seen: list[tuple[str, int]] = []
+    cursor = None
+    pages = 0
+    while True:
+        page = paginate_cards(orm, card_list_query(), after=cursor, limit=7)
+        seen.extend((card.name, card.card_id) for card in page.cards)
+        pages += 1
+        if page.next_cursor is None:
+            break
+        cursor = CardCursor.decode(page.next_cursor)
+
+    assert pages == 8
+    assert len(seen) == 50
+    assert seen == sorted(seen)
+
+
+def test_paginate_exact_final_page(orm, add_cards):
+    add_cards(orm, 6)
+
+    first = paginate_cards(orm, card_list_query(), limit=3)
+    assert first.next_cursor is not None
+    second = paginate_cards(
+        orm, card_list_query(), after=CardCursor.decode(first.next_cursor), limit=3
+    )
+
+    assert len(second.cards) == 3
+    assert second.next_cursor is None
+
+
+def test_card_list_page_uses_partial_index(orm):
+    query = (
+        card_list_query()
+        .where(Card.name > "a")
+        .order_by(Card.name, Card.card_id)
+        .limit(100)
+    )
+    sql = str(
+        query.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True})
+    )
+
+    plan = " ".join(row[3] for row in orm.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+    assert "USING INDEX ix_card_list_name_card_id" in plan
+    # walking the index gives the order for free
+    assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.slow
+def test_page_latency_is_constant_with_depth(orm, add_cards):
+    n_cards = 100_000
+    add_cards(orm, n_cards)
+    deep = paginate_cards(orm, card_list_query(), limit=n_cards - 200).cards[-1]
+
+    def _median_ms(fn) -> float:
+        timings = []
+        for _ in range(20):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        return sorted(timings)[len(timings) // 2]
+
+    first_ms = _median_ms(lambda: paginate_cards(orm, card_list_query()))
+    deep_ms = _median_ms(
+        lambda: paginate_cards(
+            orm, card_list_query(), after=CardCursor(deep.name, deep.card_id)
+        )
+    )
+    offset_ms = _median_ms(
+        lambda: orm.scalars(
+            card_list_query()
+            .order_by(Card.name, Card.card_id)
+            .offset(n_cards - 200)
+            .limit(100)
+        ).all()
+    )
+    print(
+        f"first page {first_ms:.2f}ms, keyset page at {n_cards - 200} {deep_ms:.2f}ms, "
+        f"OFFSET page at {n_cards - 200} {offset_ms:.2f}ms"
+    )
+    assert deep_ms < first_ms * 2
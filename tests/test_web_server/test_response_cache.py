@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+from mtg_scanner.web_server.response_cache import CachedResponse, ResponseCache
+
+KEY = ("http://testserver/", "/card_list", (("limit", "10"),))
+
+
+def test_put_and_get():
+    cache = ResponseCache()
+
+    entry = cache.put(KEY, b"page", "text/html")
+
+    assert cache.get(KEY) == entry
+    assert cache.get(("http://testserver/", "/card_list", ())) is None
+    assert cache.put(KEY, b"page", "text/html").etag == entry.etag
+    assert cache.put(KEY, b"other", "text/html").etag != entry.etag
+
+
+def test_entries_expire():
+    cache = ResponseCache(ttl_s=0.01)
+    cache.put(KEY, b"page", "text/html")
+
+    time.sleep(0.02)
+
+    assert cache.get(KEY) is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_evicted():
+    cache = ResponseCache(max_bytes=10)
+    keys = [("http://testserver/", f"/page/{i}", ()) for i in range(3)]
+    cache.put(keys[0], b"aaaa", None)
+    cache.put(keys[1], b"bbbb", None)
+    cache.get(keys[0])
+
+    cache.put(keys[2], b"cccc", None)
+
+    assert [cache.get(key) is not None for key in keys] == [True, False, True]
+
+
+def test_nothing_cached_without_room():
+    cache = ResponseCache(max_bytes=0)
+
+    entry = cache.put(KEY, b"page", "text/html")
+
+    assert entry.body == b"page"
+    assert cache.get(KEY) is None
+
+
+def test_stale_render_not_cached():
+    cache = ResponseCache()
+    generation = cache.generation
+    # a sync batch lands while the page is rendering
+    cache.clear()
+
+    cache.put(KEY, b"stale page", "text/html", generation)
+
+    assert cache.get(KEY) is None
+    cache.put(KEY, b"page", "text/html", cache.generation)
+    assert cache.get(KEY) is not None
+
+
+@pytest.mark.parametrize(
+    "if_none_match, expected",
+    [
+        (None, False),
+        ('"abc"', True),
+        ('W/"abc"', True),
+        ('"xyz", "abc"', True),
+        ('"xyz"', False),
+    ],
+)
+def test_matches(if_none_match, expected):
+    entry = CachedResponse(body=b"", media_type=None, etag='"abc"', expires_at=0)
+
+    assert entry.matches(if_none_match) is expected
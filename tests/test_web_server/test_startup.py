@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+import mtg_scanner
+
+_PACKAGE_PARENT = str(Path(mtg_scanner.__file__).parent.parent)
+# time from the first import to the first response, in a fresh interpreter
+_FIRST_REQUEST_SCRIPT = """
+import time
+start = time.perf_counter()
+import mtg_scanner.web_server.main as main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    assert client.get("/").status_code == 200
+print(f"import {(imported - start) * 1000:.0f}ms, first request {(time.perf_counter() - start) * 1000:.0f}ms")
+"""
+
+
+def _run(script: str, cwd: Path, **env: str) -> subprocess.CompletedProcess[str]:
+    clean_env = {k: v for k, v in os.environ.items() if k != "DB_URL"}
+    # wherever the package is imported from here, `cwd` may not have it on the path
+    clean_env["PYTHONPATH"] = os.pathsep.join(
+        [_PACKAGE_PARENT, *filter(None, [os.environ.get("PYTHONPATH")])]
+    )
+    return subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=cwd,
+        env={**clean_env, **env},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def test_import_is_lazy(tmp_path):
+    # no .env or DB_URL to read, nothing heavy to pull in
+    _run(
+        "import sys\n"
+        "import mtg_scanner.web_server.main\n"
+        "for module in (\n"
+        "    'cv2', 'numpy', 'aiosqlite', 'mtg_scanner.scryfall_data.model'\n"
+        "):\n"
+        "    assert module not in sys.modules, module\n",
+        cwd=tmp_path,
+    )
+
+
+def test_startup_reads_dot_env(web_main, web_db_url, tmp_path, monkeypatch):
+    (tmp_path / ".env").write_text(f"DB_URL={web_db_url}\n")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("DB_URL", raising=False)
+    app = web_main.create_app()
+
+    with TestClient(app) as client:
+        assert client.get("/cards/search").status_code == 200
+        assert str(app.state.resources.async_engine.url).endswith(web_db_url[-20:])
+
+
+@pytest.mark.slow
+def test_import_to_first_request_benchmark(benchmark, web_db_url, tmp_path):
+    def _first_request() -> None:
+        result = _run(_FIRST_REQUEST_SCRIPT, cwd=tmp_path, DB_URL=web_db_url)
+        print(result.stdout.strip())
+
+    benchmark(_first_request, rounds=5, warmup=1)
@@ -0,0 +1,159 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select
+
+from mtg_scanner.db.card_snapshot import CardSnapshot
+from mtg_scanner.db.models import Card
+from mtg_scanner.db.sync_scryfall_data import SyncResult
+from mtg_scanner.web_server.sync_job import (
+    JobState,
+    SyncAlreadyRunning,
+    SyncJob,
+    SyncJobRunner,
+)
+
+
+def _wait(runner: SyncJobRunner, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while runner.running is not None:
+        assert time.monotonic() < deadline, "sync did not finish"
+        time.sleep(0.05)
+
+
+def test_sync_job_eta():
+    job = SyncJob(
+        job_id="a",
+        expected_total=1000,
+        progress=SyncResult(processed=250),
+        started_at=datetime.now(timezone.utc) - timedelta(seconds=10),
+    )
+
+    assert job.rate == pytest.approx(25, rel=0.01)
+    assert job.eta_seconds == pytest.approx(30, rel=0.01)
+
+    job.expected_total = None
+    assert job.eta_seconds is None
+
+
+def test_runner_syncs_in_background(
+    sync_jobs, write_bulk_file, scryfall_card_json, web_orm, card_snapshot_dir
+):
+    write_bulk_file([scryfall_card_json() for _ in range(5)])
+
+    job = sync_jobs.start()
+    # only one sync at a time
+    with pytest.raises(SyncAlreadyRunning) as err:
+        sync_jobs.start()
+    assert err.value.job_id == job.job_id
+    _wait(sync_jobs)
+
+    assert sync_jobs.get(job.job_id) is job
+    assert job.state is JobState.SUCCEEDED, job.error
+    assert job.progress == SyncResult(processed=5, upserted=5)
+    assert job.finished_at is not None
+    assert web_orm.scalar(select(func.count()).select_from(Card)) == 5
+    assert len(CardSnapshot.load(card_snapshot_dir)) == 5
+
+
+def test_runner_reports_failure(sync_jobs):
+    # no bulk file
+    job = sync_jobs.start()
+    _wait(sync_jobs)
+
+    assert job.state is JobState.FAILED
+    assert job.error is not None and "FileNotFoundError" in job.error
+    # free to start another
+    sync_jobs.start()
+    _wait(sync_jobs)
+
+
+def test_sync_endpoints(client, write_bulk_file, scryfall_card_json):
+    write_bulk_file([scryfall_card_json() for _ in range(3)])
+
+    started = client.post("/sync_scryfall_data")
+    assert started.status_code == 202
+    job_id = started.json()["job_id"]
+    assert client.post("/sync_scryfall_data").status_code == 409
+
+    deadline = time.monotonic() + 60
+    while (status := client.get(f"/sync_scryfall_data/{job_id}").json())[
+        "state"
+    ] == "running":
+        assert time.monotonic() < deadline, "sync did not finish"
+        time.sleep(0.05)
+
+    assert status["state"] == "succeeded"
+    assert status["processed"] == status["upserted"] == 3
+    assert status["eta_seconds"] == 0
+    assert client.get("/sync_scryfall_data/unknown").status_code == 404
+
+
+def test_sync_clears_response_cache(
+    client, sync_jobs, write_bulk_file, scryfall_card_json
+):
+    write_bulk_file([scryfall_card_json(name="Fresh Card")])
+    assert client.get("/cards/search").json()["cards"] == []
+
+    sync_jobs.start()
+    _wait(sync_jobs)
+
+    cards = client.get("/cards/search").json()["cards"]
+    assert [card["name"] for card in cards] == ["Fresh Card"]
+
+
+def test_sync_clears_response_cache_on_changes(
+    sync_jobs, response_cache, write_bulk_file, scryfall_card_json
+):
+    write_bulk_file([scryfall_card_json() for _ in range(3)])
+    sync_jobs.start()
+    _wait(sync_jobs)
+    # the batch that added the cards, then the end of the job
+    assert response_cache.generation == 2
+
+    sync_jobs.start()
+    _wait(sync_jobs)
+
+    # every card unchanged, only the end of the job
+    assert response_cache.generation == 3
+
+
+@pytest.mark.slow
+def test_card_list_latency_during_sync(
+    client,
+    sync_jobs,
+    response_cache,
+    write_bulk_file,
+    scryfall_card_json,
+    web_orm,
+    add_cards,
+):
+    # the db and rendering are measured, not the cache
+    response_cache.max_bytes = 0
+    add_cards(web_orm, 10_000)
+    write_bulk_file([scryfall_card_json() for _ in range(50_000)])
+
+    def _p99_ms(n: int) -> float:
+        timings = []
+        for _ in range(n):
+            start = time.perf_counter()
+            assert client.get("/card_list", params={"limit": 50}).status_code == 200
+            timings.append((time.perf_counter() - start) * 1000)
+        return sorted(timings)[int(n * 0.99)]
+
+    idle_ms = _p99_ms(200)
+    job = sync_jobs.start()
+    # past the worker's imports and into the sync
+    while job.progress.processed == 0:
+        time.sleep(0.05)
+    syncing_ms = _p99_ms(200)
+    assert sync_jobs.running is job, "sync finished before the measurement"
+    _wait(sync_jobs)
+
+    print(
+        f"/card_list p99 idle {idle_ms:.1f}ms, during sync {syncing_ms:.1f}ms, "
+        f"sync rate {job.rate:,.0f} cards/sec"
+    )
+    assert job.state is JobState.SUCCEEDED, job.error
+    assert syncing_ms < idle_ms * 2
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.types import Message
+
+from mtg_scanner.web_server.uploads import read_uploads
+
+BOUNDARY = "b"
+
+
+def _part(name: str, data: bytes, filename: str | None = None) -> bytes:
+    disposition = f'form-data; name="{name}"'
+    if filename is not None:
+        disposition += f'; filename="{filename}"'
+    return (
+        f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n".encode()
+        + data
+        + b"\r\n"
+    )
+
+
+def _request(chunks: list[bytes], received: list[bytes]) -> Request:
+    """
+    A multipart request streaming `chunks` as its body, each chunk is added to `received` as the app reads it
+    """
+    pending = list(chunks)
+
+    async def _receive() -> Message:
+        chunk = pending.pop(0)
+        received.append(chunk)
+        return {"type": "http.request", "body": chunk, "more_body": bool(pending)}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "headers": [
+            (
+                b"content-type",
+                f"multipart/form-data; boundary={BOUNDARY}".encode(),
+            )
+        ],
+    }
+    return Request(scope, _receive)
+
+
+def test_read_uploads():
+    body = (
+        _part("files", b"one", "1.jpg")
+        + _part("other", b"ignored")
+        + _part("files", b"two" * 1000, "2.jpg")
+        + f"--{BOUNDARY}--\r\n".encode()
+    )
+    chunks = [body[i : i + 100] for i in range(0, len(body), 100)]
+
+    uploads = asyncio.run(
+        read_uploads(_request(chunks, []), "files", max_files=2, max_file_bytes=3000)
+    )
+
+    assert uploads == [("1.jpg", b"one"), ("2.jpg", b"two" * 1000)]
+
+
+@pytest.mark.parametrize(
+    "parts, status_code",
+    (
+        pytest.param([_part("files", b"x" * 5000, "big.jpg")], 413, id="large file"),
+        pytest.param(
+            [_part("files", b"x", f"{i}.jpg") for i in range(3)], 400, id="many files"
+        ),
+    ),
+)
+def test_read_uploads_stops_at_limit(parts: list[bytes], status_code: int):
+    body = b"".join(parts) + b"x" * 100_000
+    chunks = [body[i : i + 1000] for i in range(0, len(body), 1000)]
+    received: list[bytes] = []
+
+    with pytest.raises(HTTPException) as err:
+        asyncio.run(
+            read_uploads(
+                _request(chunks, received), "files", max_files=2, max_file_bytes=4096
+            )
+        )
+
+    assert err.value.status_code == status_code
+    # the rest of the body is never read
+    assert len(received) < 10